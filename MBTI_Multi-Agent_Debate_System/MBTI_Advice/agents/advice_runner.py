@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import time
+from typing import List, Dict, Tuple, Optional, Callable, AsyncIterator
+
+from .agent_pool import agent_pool
+from ..utils.metrics import UsageCallbackHandler, advice_metrics
+
+logger = logging.getLogger(__name__)
+
+# 单个MBTI类型生成建议的超时时间（秒），可按类型单独覆盖
+ADVICE_TIMEOUT = float(os.environ.get("ADVICE_TIMEOUT_SECONDS", 60))
+
+
+async def _generate_one(mbti: str, question: str, history: str, agent_factory: Callable,
+                        use_agent: Optional[bool]) -> str:
+    # 从Agent池取用（池中没有时才构建，构建会初始化模型客户端，放到线程中执行，避免阻塞事件循环）
+    agent = await asyncio.to_thread(agent_factory, mbti)
+    return await agent.agenerate_advice(question, history, use_agent=use_agent)
+
+
+async def generate_advice_concurrently(mbti_types: List[str], question: str, history: str = "",
+                                       timeout: Optional[float] = None,
+                                       timeouts: Optional[Dict[str, float]] = None,
+                                       agent_factory: Optional[Callable] = None,
+                                       use_agent: Optional[bool] = None,
+                                       histories: Optional[Dict[str, str]] = None
+                                       ) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    所有MBTI类型并发生成建议，总耗时约等于最慢的一个（且不超过超时时间）。
+    histories 可为每个类型单独提供对话历史（未提供的类型使用 history）。
+    返回(成功的回复, 失败原因)：某个类型超时或出错时不影响其他类型的结果。
+    """
+    mbti_types = list(dict.fromkeys(mbti_types))  # 去重并保持顺序
+    agent_factory = agent_factory or agent_pool.get
+    timeout = timeout or ADVICE_TIMEOUT
+    per_type = {mbti: (timeouts or {}).get(mbti, timeout) for mbti in mbti_types}
+    results = await asyncio.gather(*[
+        asyncio.wait_for(_generate_one(mbti, question, (histories or {}).get(mbti, history), agent_factory, use_agent), per_type[mbti])
+        for mbti in mbti_types
+    ], return_exceptions=True)
+    responses, errors = {}, {}
+    for mbti, result in zip(mbti_types, results):
+        if isinstance(result, asyncio.TimeoutError):
+            logger.warning(f"{mbti} 建议生成超时（{per_type[mbti]}秒）")
+            errors[mbti] = f"生成超时（{per_type[mbti]:g}秒）"
+        elif isinstance(result, BaseException):
+            logger.error(f"{mbti} 建议生成失败: {result}", exc_info=result)
+            errors[mbti] = f"生成失败: {result}"
+        else:
+            responses[mbti] = result
+    return responses, errors
+
+
+async def stream_advice_concurrently(mbti_types: List[str], question: str, history: str = "",
+                                     histories: Optional[Dict[str, str]] = None,
+                                     timeout: Optional[float] = None,
+                                     agent_factory: Optional[Callable] = None) -> AsyncIterator[dict]:
+    """
+    每个MBTI类型各发起一次流式调用，把各自的增量内容合并为一个事件流：
+    persona_start / delta / persona_complete / persona_error，全部结束后发送 complete（含完整回复）。
+    最快的类型生成的内容会立即推送，不等待其他类型。
+    """
+    mbti_types = list(dict.fromkeys(mbti_types))
+    agent_factory = agent_factory or agent_pool.get
+    timeout = timeout or ADVICE_TIMEOUT
+    queue: asyncio.Queue = asyncio.Queue()
+    responses: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+
+    async def produce(mbti: str):
+        usage = UsageCallbackHandler()
+        chunks = []
+        ok = False
+        started = time.perf_counter()
+        try:
+            mbti_history = (histories or {}).get(mbti, history)
+            cached = None
+
+            async def run():
+                nonlocal cached
+                agent = await asyncio.to_thread(agent_factory, mbti)
+                await queue.put({"type": "persona_start", "mbti": mbti})
+                history_used = agent.effective_history(question, mbti_history)
+                cached = agent.lookup_cached(question, history_used)
+                if cached is not None:
+                    chunks.append(cached)
+                    await queue.put({"type": "delta", "mbti": mbti, "content": cached, "cached": True})
+                    return
+                async for delta in agent.astream_advice(question, history_used, usage):
+                    if delta:
+                        chunks.append(delta)
+                        await queue.put({"type": "delta", "mbti": mbti, "content": delta})
+                agent.store_cached(question, history_used, "".join(chunks), time.perf_counter() - started)
+            await asyncio.wait_for(run(), timeout)
+            ok = True
+            responses[mbti] = "".join(chunks)
+            await queue.put({"type": "persona_complete", "mbti": mbti, "content": responses[mbti]})
+        except asyncio.TimeoutError:
+            errors[mbti] = f"生成超时（{timeout:g}秒）"
+            await queue.put({"type": "persona_error", "mbti": mbti, "error": errors[mbti], "partial": "".join(chunks)})
+        except Exception as e:
+            logger.error(f"{mbti} 流式建议生成失败: {e}", exc_info=True)
+            errors[mbti] = f"生成失败: {e}"
+            await queue.put({"type": "persona_error", "mbti": mbti, "error": errors[mbti], "partial": "".join(chunks)})
+        finally:
+            advice_metrics.record(mbti, "cache" if cached is not None else "fast", time.perf_counter() - started,
+                                  usage, ok)
+            await queue.put(None)
+
+    tasks = [asyncio.create_task(produce(mbti)) for mbti in mbti_types]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event is None:
+                remaining -= 1
+                continue
+            yield event
+        yield {"type": "complete", "responses": responses, "errors": errors}
+    finally:
+        # 客户端断开时取消仍在生成的类型
+        for task in tasks:
+            task.cancel()
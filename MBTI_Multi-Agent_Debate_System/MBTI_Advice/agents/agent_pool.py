@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from ..config.settings import settings, get_llm_config, get_prompt_template
+from .mbti_agent import MBTIAdviceAgent
+
+logger = logging.getLogger(__name__)
+
+
+def config_version(mbti_type: str) -> str:
+    """某个MBTI类型的配置指纹：模型平台、模型参数、密钥或提示词变化后，池中旧的Agent失效"""
+    payload = json.dumps({
+        "platform": settings.MBTI_MODEL_MAPPING.get(mbti_type),
+        "llm": get_llm_config(mbti_type),
+        "prompt": get_prompt_template(mbti_type),
+    }, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class MBTIAgentPool:
+    """
+    进程级的 MBTIAdviceAgent 池：按MBTI类型缓存已初始化的Agent，请求时不再重复构建模型客户端和Agent。
+    - 线程安全：同一类型并发请求时只构建一次，其余请求等待构建完成
+    - LRU淘汰：超过 max_size 时淘汰最久未使用的类型
+    - 配置版本：每次取用时比对配置指纹，配置变化后自动重建
+    """
+
+    def __init__(self, max_size: int = int(os.environ.get("ADVICE_AGENT_POOL_SIZE", 16)),
+                 agent_factory: Callable[[str], MBTIAdviceAgent] = MBTIAdviceAgent,
+                 version_fn: Callable[[str], str] = config_version):
+        self.max_size = max(1, max_size)
+        self.agent_factory = agent_factory
+        self.version_fn = version_fn
+        self._agents: "OrderedDict[str, Tuple[str, MBTIAdviceAgent]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, mbti_type: str) -> MBTIAdviceAgent:
+        version = self.version_fn(mbti_type)
+        agent = self._lookup(mbti_type, version)
+        if agent is not None:
+            return agent
+        with self._lock:
+            build_lock = self._build_locks.setdefault(mbti_type, threading.Lock())
+        # 同一类型串行构建，不同类型可并行构建
+        with build_lock:
+            agent = self._lookup(mbti_type, version)
+            if agent is not None:
+                return agent
+            agent = self.agent_factory(mbti_type)
+            with self._lock:
+                self.misses += 1
+                self._agents[mbti_type] = (version, agent)
+                self._agents.move_to_end(mbti_type)
+                while len(self._agents) > self.max_size:
+                    evicted, _ = self._agents.popitem(last=False)
+                    logger.info(f"Agent池已满，淘汰 {evicted}")
+            return agent
+
+    def _lookup(self, mbti_type: str, version: str) -> Optional[MBTIAdviceAgent]:
+        with self._lock:
+            entry = self._agents.get(mbti_type)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                logger.info(f"{mbti_type} 配置已变化，重建Agent")
+                del self._agents[mbti_type]
+                return None
+            self._agents.move_to_end(mbti_type)
+            self.hits += 1
+            return entry[1]
+
+    def invalidate(self, mbti_type: Optional[str] = None):
+        """手动失效某个类型（不传则清空整个池）"""
+        with self._lock:
+            if mbti_type is None:
+                self._agents.clear()
+            else:
+                self._agents.pop(mbti_type, None)
+
+    def prewarm(self, mbti_types: Optional[Iterable[str]] = None, max_workers: int = 4) -> Dict[str, str]:
+        """预先构建各类型的Agent（默认全部16种），返回构建失败的类型及原因"""
+        mbti_types = list(mbti_types or settings.MBTI_MODEL_MAPPING.keys())[:self.max_size]
+        errors = {}
+
+        def build(mbti):
+            try:
+                self.get(mbti)
+            except Exception as e:
+                errors[mbti] = str(e)
+                logger.warning(f"{mbti} Agent预热失败: {e}")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(build, mbti_types))
+        logger.info(f"Agent池预热完成：{len(self)} 个类型就绪，{len(errors)} 个失败")
+        return errors
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._agents), "max_size": self.max_size, "types": list(self._agents),
+                    "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._agents)
+
+
+# 进程内共享的Agent池
+agent_pool = MBTIAgentPool()
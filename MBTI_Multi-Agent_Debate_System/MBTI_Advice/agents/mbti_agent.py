@@ -1,33 +1,56 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Iterator, Optional
+
 from langchain.agents import AgentType, initialize_agent, Tool
 from langchain.utilities import SerpAPIWrapper
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
+from common.singleflight import coalesced_astream
+from ..config.settings import settings
 from ..llms.mbti_models import get_llm_for_mbti
 from ..utils.mbti_prompts import get_prompt_for_mbti
-from ..utils.vector_db import MBTIVectorDB, MockVectorDB
+from ..utils.vector_db import MockVectorDB, shared_vector_db
+from ..utils.metrics import UsageCallbackHandler, advice_metrics
+from ..utils.semantic_cache import advice_cache, depends_on_history
+
+# 默认走单次调用的快速路径；设为 true 时默认改用 ReAct Agent（单次请求也可通过 use_agent 指定）
+ADVICE_USE_AGENT = os.environ.get("ADVICE_USE_AGENT", "false").lower() in ("1", "true", "yes")
 
 
 class MBTIAdviceAgent:
-    def __init__(self, mbti_type: str,use_vector_db: bool = False):
+    def __init__(self, mbti_type: str, use_vector_db: Optional[bool] = None):
         self.mbti_type = mbti_type
         self.llm = get_llm_for_mbti(mbti_type)
-        # 仅在需要时初始化向量数据库
-        if use_vector_db:
-            self.vector_db = MBTIVectorDB()
+        # 默认由 ADVICE_USE_VECTOR_DB 决定是否检索本地知识库（VECTOR_DB_PATH），所有类型共用一份索引
+        if settings.ADVICE_USE_VECTOR_DB if use_vector_db is None else use_vector_db:
+            try:
+                self.vector_db = shared_vector_db(settings.VECTOR_DB_PATH)
+            except Exception as e:
+                print(f"本地知识库加载失败，改用内置MBTI资料: {e}")
+                self.vector_db = MockVectorDB()
         else:
             self.vector_db = MockVectorDB()
 
         # 定义 Agent 工具
         self.tools = self._get_tools()
 
-        # 初始化 Agent
-        self.agent = initialize_agent(
-            self.tools,
-            self.llm,
-            agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-            verbose=True,
-            handle_parsing_errors=True
-        )
+        # Agent 在首次使用 Agent 模式时才初始化
+        self._agent = None
+
+    @property
+    def agent(self):
+        if self._agent is None:
+            # 初始化 Agent
+            self._agent = initialize_agent(
+                self.tools,
+                self.llm,
+                agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+                verbose=True,
+                handle_parsing_errors=True
+            )
+        return self._agent
 
     def _get_tools(self):
         """定义 Agent 可用的工具"""
@@ -52,13 +75,114 @@ class MBTIAdviceAgent:
         # )
         return tools
 
-    def generate_advice(self, user_query: str, conversation_history: str = ""):
-        """生成MBTI风格的建议"""
+    def _build_prompt(self, user_query: str, conversation_history: str = "") -> str:
         # 构建提示词，包含用户问题和对话历史
         full_prompt = get_prompt_for_mbti(self.mbti_type, user_query)
 
         if conversation_history:
             full_prompt = f"对话历史:\n{conversation_history}\n\n{full_prompt}"
+        return full_prompt
+
+    def _retrieve_context(self, user_query: str, k: int = 3) -> str:
+        """本地检索MBTI知识库，代替Agent的 SearchMBTIDB 工具调用"""
+        try:
+            docs = self.vector_db.get_relevant_info(user_query, k=k, mbti_type=self.mbti_type)
+        except Exception as e:
+            print(f"MBTI知识库检索失败，跳过参考资料: {e}")
+            return ""
+        return "\n\n".join(doc.page_content for doc in docs or [])
+
+    def _build_fast_prompt(self, user_query: str, conversation_history: str = "") -> str:
+        # 快速路径：检索结果直接注入提示词，一次调用完成
+        context = self._retrieve_context(user_query)
+        prompt = get_prompt_for_mbti(self.mbti_type, user_query)
+        if context:
+            prompt = f"以下是与问题相关的MBTI参考资料，可酌情参考：\n{context}\n\n{prompt}"
+        if conversation_history:
+            prompt = f"对话历史:\n{conversation_history}\n\n{prompt}"
+        return prompt
+
+    def _use_agent(self, use_agent: Optional[bool]) -> bool:
+        return ADVICE_USE_AGENT if use_agent is None else use_agent
+
+    def effective_history(self, user_query: str, conversation_history: str = "") -> str:
+        """与问题无关的对话历史不放入提示词：这样的请求按问题本身生成回答，可以读写语义缓存"""
+        return conversation_history if depends_on_history(user_query, conversation_history) else ""
+
+    def lookup_cached(self, user_query: str, conversation_history: str = "") -> Optional[str]:
+        """语义缓存查询；带对话历史的个性化请求不使用缓存（传入 effective_history 处理后的历史）"""
+        if conversation_history:
+            return None
+        hit = advice_cache.lookup(self.mbti_type, user_query)
+        return hit[0] if hit else None
+
+    def store_cached(self, user_query: str, conversation_history: str, answer: str, latency: float):
+        if not conversation_history:
+            advice_cache.store(self.mbti_type, user_query, answer, latency)
+
+    def stream_advice(self, user_query: str, conversation_history: str = "",
+                      usage: Optional[UsageCallbackHandler] = None) -> Iterator[str]:
+        """快速路径：单次流式调用，逐段返回建议内容"""
+        prompt = self._build_fast_prompt(user_query, conversation_history)
+        config = {"callbacks": [usage]} if usage is not None else None
+        for chunk in self.llm.stream(prompt, config=config):
+            yield chunk.content if hasattr(chunk, 'content') else str(chunk)
+
+    async def astream_advice(self, user_query: str, conversation_history: str = "",
+                             usage: Optional[UsageCallbackHandler] = None) -> AsyncIterator[str]:
+        """快速路径（异步）：单次流式调用，逐段返回建议内容；低温度人格的相同请求会合并为一次上游调用"""
+        # 知识库检索是同步计算（向量化、相似度搜索），放到线程中执行，不阻塞事件循环
+        prompt = await asyncio.to_thread(self._build_fast_prompt, user_query, conversation_history)
+        config = {"callbacks": [usage]} if usage is not None else None
+        async for chunk in coalesced_astream(self.llm, prompt, config=config):
+            yield chunk.content if hasattr(chunk, 'content') else str(chunk)
+
+    def generate_advice(self, user_query: str, conversation_history: str = "", use_agent: Optional[bool] = None):
+        """生成MBTI风格的建议"""
+        use_agent = self._use_agent(use_agent)
+        started = time.perf_counter()
+        conversation_history = self.effective_history(user_query, conversation_history)
+        cached = self.lookup_cached(user_query, conversation_history)
+        if cached is not None:
+            advice_metrics.record(self.mbti_type, "cache", time.perf_counter() - started)
+            return cached
+        usage = UsageCallbackHandler()
+        ok = False
+        try:
+            if use_agent:
+                # 运行 Agent 生成建议
+                result = self.agent.run(self._build_prompt(user_query, conversation_history), callbacks=[usage])
+            else:
+                result = "".join(self.stream_advice(user_query, conversation_history, usage))
+            ok = True
+        finally:
+            advice_metrics.record(self.mbti_type, "agent" if use_agent else "fast",
+                                  time.perf_counter() - started, usage, ok)
+        self.store_cached(user_query, conversation_history, result, time.perf_counter() - started)
+        return result
 
-        # 运行 Agent 生成建议
-        return self.agent.run(full_prompt)
\ No newline at end of file
+    async def agenerate_advice(self, user_query: str, conversation_history: str = "",
+                               use_agent: Optional[bool] = None):
+        """异步生成MBTI风格的建议（不阻塞事件循环，便于多个类型并发）"""
+        use_agent = self._use_agent(use_agent)
+        started = time.perf_counter()
+        conversation_history = self.effective_history(user_query, conversation_history)
+        cached = self.lookup_cached(user_query, conversation_history)
+        if cached is not None:
+            advice_metrics.record(self.mbti_type, "cache", time.perf_counter() - started)
+            return cached
+        usage = UsageCallbackHandler()
+        ok = False
+        try:
+            if use_agent:
+                result = await self.agent.arun(self._build_prompt(user_query, conversation_history),
+                                               callbacks=[usage])
+            else:
+                result = "".join([chunk async for chunk in
+                                  self.astream_advice(user_query, conversation_history, usage)])
+            ok = True
+        finally:
+            advice_metrics.record(self.mbti_type, "agent" if use_agent else "fast",
+                                  time.perf_counter() - started, usage, ok)
+        self.store_cached(user_query, conversation_history, result, time.perf_counter() - started)
+        return result
@@ -35,6 +35,8 @@ class AppSettings(BaseSettings):
     SPARK_API_SECRET: str = Field(..., validation_alias="SPARK_API_SECRET")
     # 向量数据库路径
     VECTOR_DB_PATH: str = Field("mbti_vector_db", validation_alias="VECTOR_DB_PATH")
+    # 建议服务是否检索 VECTOR_DB_PATH 下的本地知识库（关闭时只使用内置的少量MBTI资料）
+    ADVICE_USE_VECTOR_DB: bool = Field(False, validation_alias="ADVICE_USE_VECTOR_DB")
 
     # MBTI 到模型的映射
     MBTI_MODEL_MAPPING: Dict[str, str] = Field(
@@ -1,80 +1,140 @@
 # llms/custom_qianwen.py
 
-import requests
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, AsyncIterator
 from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import generate_from_stream, agenerate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk
 from langchain.schema import ChatGeneration, ChatResult, HumanMessage, AIMessage  # 导入 AIMessage
-from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.callbacks.manager import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+
+from .http_client import LLMHTTPError, post_json, apost_json, stream_sse, astream_sse, to_chat_messages
 
 
 class CustomQianWenChat(BaseChatModel):
-    """直接调用通义千问API的自定义实现，不依赖langchain_qianwen库"""
+    """直接调用通义千问API的自定义实现，不依赖langchain_qianwen库；共享连接池，支持异步和SSE流式输出"""
 
     api_key: str
     model_name: str = "qwen-max"
     temperature: float = 0.7
     max_tokens: int = 1024
     api_url: str = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+    # 为 True 时 generate 也走流式接口
+    streaming: bool = False
 
     @property
     def _llm_type(self) -> str:
         return "custom-qianwen"
 
-    def _generate(
-            self,
-            messages: List[HumanMessage],
-            stop: Optional[List[str]] = None,
-            run_manager: Optional[CallbackManagerForLLMRun] = None,
-            **kwargs: Any,
-    ) -> ChatResult:
-        # 构建请求头
+    def _headers(self, stream: bool = False) -> Dict[str, str]:
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
+        if stream:
+            headers["X-DashScope-SSE"] = "enable"
+        return headers
 
-        # 构建请求体
-        request_data = {
+    def _payload(self, messages: List[BaseMessage], stop: Optional[List[str]], stream: bool = False,
+                 **kwargs: Any) -> dict:
+        parameters = {
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            **kwargs
+        }
+        if stop:
+            parameters["stop"] = stop
+        if stream:
+            # 增量输出：每个事件只包含新生成的文本
+            parameters["incremental_output"] = True
+        return {
             "model": self.model_name,
-            "input": {
-                "messages": [{"role": "user", "content": msg.content} for msg in messages]
-            },
-            "parameters": {
-                "temperature": self.temperature,
-                "max_tokens": self.max_tokens,
-                **kwargs
-            }
+            "input": {"messages": to_chat_messages(messages)},
+            "parameters": parameters
         }
 
-        # 发送请求
-        try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=request_data,
-                timeout=60  # 设置超时时间
-            )
-            response.raise_for_status()  # 检查请求是否成功
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"通义千问API调用失败: {str(e)}")
-
-        # 解析响应
-        result = response.json()
-
+    def _to_result(self, result: dict) -> ChatResult:
         # 检查API返回是否包含错误
-        if "error" in result:
-            raise Exception(f"通义千问API返回错误: {result['error']}")
+        if "error" in result or result.get("code"):
+            raise LLMHTTPError(f"通义千问API返回错误: {result.get('error') or result.get('message') or result.get('code')}")
 
         # 提取生成的文本
         text = result.get("output", {}).get("text", "")
         if not text:
-            raise Exception("通义千问API返回内容为空")
+            raise LLMHTTPError("通义千问API返回内容为空")
 
-        # 创建正确的 ChatMessage 对象
+        usage = result.get("usage") or {}
         message = AIMessage(content=text)  # 创建 AIMessage 对象
         generation = ChatGeneration(message=message)  # 传递 message 参数
+        return ChatResult(generations=[generation], llm_output={"token_usage": {
+            "prompt_tokens": usage.get("input_tokens"),
+            "completion_tokens": usage.get("output_tokens"),
+        }, "model_name": self.model_name} if usage else None)
+
+    @staticmethod
+    def _to_chunk(event: dict) -> Optional[ChatGenerationChunk]:
+        if event.get("code"):
+            raise LLMHTTPError(f"通义千问API返回错误: {event.get('message') or event.get('code')}")
+        text = (event.get("output") or {}).get("text") or ""
+        if not text:
+            return None
+        return ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    def _generate(
+            self,
+            messages: List[HumanMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
+        result = post_json("通义千问", self.api_url, self._headers(), self._payload(messages, stop, **kwargs))
+        return self._to_result(result)
+
+    async def _agenerate(
+            self,
+            messages: List[HumanMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+        result = await apost_json("通义千问", self.api_url, self._headers(), self._payload(messages, stop, **kwargs))
+        return self._to_result(result)
+
+    def _stream(
+            self,
+            messages: List[HumanMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        payload = self._payload(messages, stop, stream=True, **kwargs)
+        for event in stream_sse("通义千问", self.api_url, self._headers(stream=True), payload):
+            chunk = self._to_chunk(event)
+            if chunk is None:
+                continue
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
 
-        return ChatResult(generations=[generation])
+    async def _astream(
+            self,
+            messages: List[HumanMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        payload = self._payload(messages, stop, stream=True, **kwargs)
+        async for event in astream_sse("通义千问", self.api_url, self._headers(stream=True), payload):
+            chunk = self._to_chunk(event)
+            if chunk is None:
+                continue
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
 
     @property
     def _identifying_params(self) -> Dict[str, Any]:
@@ -83,4 +143,4 @@ class CustomQianWenChat(BaseChatModel):
             "model_name": self.model_name,
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
-        }
\ No newline at end of file
+        }
@@ -1,14 +1,18 @@
 # llms/custom_spark.py
 
-import requests
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, AsyncIterator
 from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import generate_from_stream, agenerate_from_stream
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
 from langchain.schema import ChatGeneration, ChatResult, HumanMessage, AIMessage
-from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.callbacks.manager import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+
+from .http_client import LLMHTTPError, post_json, apost_json, stream_sse, astream_sse, to_chat_messages
 
 
 class CustomChatSpark(BaseChatModel):
-    """自定义讯飞星火大模型客户端"""
+    """自定义讯飞星火大模型客户端（HTTP接口，OpenAI兼容格式）；共享连接池，支持异步和SSE流式输出"""
 
     app_id: str
     api_key: str
@@ -16,61 +20,117 @@ class CustomChatSpark(BaseChatModel):
     model_name: str = "spark"
     temperature: float = 0.7
     max_tokens: int = 1024
+    api_url: str = "https://spark-api-open.xf-yun.com/v1/chat/completions"
+    # 为 True 时 generate 也走流式接口
+    streaming: bool = False
 
     @property
     def _llm_type(self) -> str:
         return "custom-spark"
 
-    def _generate(
-            self,
-            messages: List[HumanMessage],
-            stop: Optional[List[str]] = None,
-            run_manager: Optional[CallbackManagerForLLMRun] = None,
-            **kwargs: Any,
-    ) -> ChatResult:
-        # 构建请求体
-        user_messages = [msg.content for msg in messages]
-        prompt = "\n".join(user_messages)
-
-        # 这里需要根据讯飞星火API的实际格式构建请求
-        # 以下是示例代码，需要根据实际API文档调整
-        headers = {
+    def _headers(self) -> Dict[str, str]:
+        # HTTP接口使用 APIKey:APISecret 认证
+        return {
             "Content-Type": "application/json",
-            # 添加认证头
+            "Authorization": f"Bearer {self.api_key}:{self.api_secret}",
         }
 
+    def _payload(self, messages: List[HumanMessage], stop: Optional[List[str]], stream: bool = False,
+                 **kwargs: Any) -> dict:
         request_data = {
             "model": self.model_name,
-            "prompt": prompt,
+            "messages": to_chat_messages(messages),
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
+            "user": self.app_id,
+            "stream": stream,
             **kwargs
         }
+        if stop:
+            request_data["stop"] = stop
+        return request_data
 
-        # 发送请求
-        try:
-            response = requests.post(
-                "https://spark-api.xfyun.cn/v2.1/chat",  # 修改为正确的API地址
-                headers=headers,
-                json=request_data,
-                timeout=60
-            )
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"讯飞星火API调用失败: {str(e)}")
-
-        # 解析响应
-        result = response.json()
-
-        # 提取生成的文本（根据实际API响应格式调整）
-        text = result.get("data", {}).get("result", "")
+    def _to_result(self, result: dict) -> ChatResult:
+        if result.get("code"):
+            raise LLMHTTPError(f"讯飞星火API返回错误: {result.get('message') or result.get('code')}")
+
+        # 提取生成的文本
+        choices = result.get("choices") or [{}]
+        text = (choices[0].get("message") or {}).get("content", "")
         if not text:
-            raise Exception("讯飞星火API返回内容为空")
+            raise LLMHTTPError("讯飞星火API返回内容为空")
 
+        usage = result.get("usage")
         message = AIMessage(content=text)
         generation = ChatGeneration(message=message)
+        return ChatResult(generations=[generation],
+                          llm_output={"token_usage": usage, "model_name": self.model_name} if usage else None)
+
+    @staticmethod
+    def _to_chunk(event: dict) -> Optional[ChatGenerationChunk]:
+        if event.get("code"):
+            raise LLMHTTPError(f"讯飞星火API返回错误: {event.get('message') or event.get('code')}")
+        choices = event.get("choices") or [{}]
+        text = (choices[0].get("delta") or {}).get("content") or ""
+        if not text:
+            return None
+        return ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    def _generate(
+            self,
+            messages: List[HumanMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
+        result = post_json("讯飞星火", self.api_url, self._headers(), self._payload(messages, stop, **kwargs))
+        return self._to_result(result)
 
-        return ChatResult(generations=[generation])
+    async def _agenerate(
+            self,
+            messages: List[HumanMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+        result = await apost_json("讯飞星火", self.api_url, self._headers(), self._payload(messages, stop, **kwargs))
+        return self._to_result(result)
+
+    def _stream(
+            self,
+            messages: List[HumanMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        payload = self._payload(messages, stop, stream=True, **kwargs)
+        for event in stream_sse("讯飞星火", self.api_url, self._headers(), payload):
+            chunk = self._to_chunk(event)
+            if chunk is None:
+                continue
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+            self,
+            messages: List[HumanMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        payload = self._payload(messages, stop, stream=True, **kwargs)
+        async for event in astream_sse("讯飞星火", self.api_url, self._headers(), payload):
+            chunk = self._to_chunk(event)
+            if chunk is None:
+                continue
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
 
     @property
     def _identifying_params(self) -> Dict[str, Any]:
@@ -78,4 +138,4 @@ class CustomChatSpark(BaseChatModel):
             "model_name": self.model_name,
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,195 @@
+# llms/http_client.py
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+
+# 自定义模型客户端共享的连接池配置
+LLM_HTTP_TIMEOUT = float(os.environ.get("LLM_HTTP_TIMEOUT", 60))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.environ.get("LLM_HTTP_CONNECT_TIMEOUT", 10))
+LLM_HTTP_RETRIES = int(os.environ.get("LLM_HTTP_RETRIES", 2))
+LLM_HTTP_MAX_CONNECTIONS = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", 100))
+LLM_HTTP_MAX_KEEPALIVE = int(os.environ.get("LLM_HTTP_MAX_KEEPALIVE", 20))
+
+# 这些状态码视为临时错误，退避后重试
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMHTTPError(Exception):
+    """模型服务调用失败（重试后仍失败或返回不可重试的错误）"""
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_HTTP_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=LLM_HTTP_MAX_CONNECTIONS, max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE)
+
+
+_sync_client: Optional[httpx.Client] = None
+_sync_lock = threading.Lock()
+# 异步连接池与事件循环绑定，每个事件循环一个
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_sync_client() -> httpx.Client:
+    """进程内共享的同步连接池（keep-alive复用连接）"""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(timeout=_timeout(), limits=_limits())
+    return _sync_client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """当前事件循环共享的异步连接池"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_clients():
+    """关闭当前事件循环的异步连接池（应用关闭时调用）"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _backoff(attempt: int) -> float:
+    return min(8.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def _should_retry(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUS
+    return isinstance(error, httpx.TransportError)
+
+
+def _error(provider: str, error: Exception) -> LLMHTTPError:
+    if isinstance(error, httpx.HTTPStatusError):
+        try:
+            body = error.response.text[:500]
+        except httpx.ResponseNotRead:
+            # 流式响应出错时响应体未读取
+            body = ""
+        return LLMHTTPError(f"{provider}API调用失败: HTTP {error.response.status_code} {body}")
+    return LLMHTTPError(f"{provider}API调用失败: {error!r}")
+
+
+def post_json(provider: str, url: str, headers: Dict[str, str], payload: dict,
+              retries: int = LLM_HTTP_RETRIES) -> dict:
+    for attempt in range(retries + 1):
+        try:
+            response = get_sync_client().post(url, headers=headers, json=payload)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            if attempt >= retries or not _should_retry(e):
+                raise _error(provider, e) from e
+            time.sleep(_backoff(attempt))
+
+
+async def apost_json(provider: str, url: str, headers: Dict[str, str], payload: dict,
+                     retries: int = LLM_HTTP_RETRIES) -> dict:
+    for attempt in range(retries + 1):
+        try:
+            response = await get_async_client().post(url, headers=headers, json=payload)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            if attempt >= retries or not _should_retry(e):
+                raise _error(provider, e) from e
+            await asyncio.sleep(_backoff(attempt))
+
+
+def _sse_data(lines: List[str]) -> Optional[Any]:
+    data = "\n".join(line[5:].lstrip() for line in lines if line.startswith("data:"))
+    if not data or data == "[DONE]":
+        return None
+    return json.loads(data)
+
+
+def stream_sse(provider: str, url: str, headers: Dict[str, str], payload: dict,
+               retries: int = LLM_HTTP_RETRIES) -> Iterator[dict]:
+    """
+    以SSE方式请求并逐个返回事件的JSON数据。
+    只在收到第一个事件之前重试，已经输出内容后出错直接抛出，避免重复输出。
+    """
+    for attempt in range(retries + 1):
+        started = False
+        try:
+            with get_sync_client().stream("POST", url, headers=headers, json=payload) as response:
+                response.raise_for_status()
+                event: List[str] = []
+                for line in response.iter_lines():
+                    if line:
+                        event.append(line)
+                        continue
+                    data = _sse_data(event)
+                    event = []
+                    if data is not None:
+                        started = True
+                        yield data
+                data = _sse_data(event)
+                if data is not None:
+                    yield data
+            return
+        except (httpx.HTTPError, ValueError) as e:
+            if started or attempt >= retries or not _should_retry(e):
+                raise _error(provider, e) from e
+            time.sleep(_backoff(attempt))
+
+
+async def astream_sse(provider: str, url: str, headers: Dict[str, str], payload: dict,
+                      retries: int = LLM_HTTP_RETRIES) -> AsyncIterator[dict]:
+    """stream_sse 的异步版本"""
+    for attempt in range(retries + 1):
+        started = False
+        try:
+            async with get_async_client().stream("POST", url, headers=headers, json=payload) as response:
+                response.raise_for_status()
+                event: List[str] = []
+                async for line in response.aiter_lines():
+                    if line:
+                        event.append(line)
+                        continue
+                    data = _sse_data(event)
+                    event = []
+                    if data is not None:
+                        started = True
+                        yield data
+                data = _sse_data(event)
+                if data is not None:
+                    yield data
+            return
+        except (httpx.HTTPError, ValueError) as e:
+            if started or attempt >= retries or not _should_retry(e):
+                raise _error(provider, e) from e
+            await asyncio.sleep(_backoff(attempt))
+
+
+def to_chat_messages(messages: List[BaseMessage]) -> List[Dict[str, str]]:
+    """LangChain消息转换为 role/content 格式"""
+    result = []
+    for msg in messages:
+        if isinstance(msg, SystemMessage):
+            role = "system"
+        elif isinstance(msg, AIMessage):
+            role = "assistant"
+        else:
+            role = "user"
+        result.append({"role": role, "content": msg.content})
+    return result
@@ -1,31 +1,349 @@
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import HumanMessage, AIMessage
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+
+from ..utils.metrics import estimate_tokens
+
+# 数据库模型在首次访问数据库时才导入（见 _db），导入本模块不会初始化数据库连接或建表
+ConversationMessage = ConversationSummary = None
+
+logger = logging.getLogger(__name__)
+
+USER_ROLE = "用户"
+# 每个用户始终保留的最近消息数；更早的消息折叠进对应MBTI类型的摘要后才删除
+HISTORY_MAX_MESSAGES = int(os.environ.get("ADVICE_HISTORY_MAX_MESSAGES", 40))
+# 每个用户最多保存的消息数（摘要迟迟没有折叠时的硬上限，内存与数据库都按此截断）
+HISTORY_MAX_STORED = int(os.environ.get("ADVICE_HISTORY_MAX_STORED", 400))
+# get_history 返回的历史最多占用的token数
+HISTORY_TOKEN_BUDGET = int(os.environ.get("ADVICE_HISTORY_TOKENS", 1500))
+# 会话空闲超过该时间（秒）后过期，重新开始对话
+SESSION_TTL_SECONDS = float(os.environ.get("ADVICE_SESSION_TTL_SECONDS", 24 * 3600))
+# 进程内热缓存最多保留的用户数
+HOT_CACHE_USERS = int(os.environ.get("ADVICE_MEMORY_CACHE_USERS", 1024))
+# 热缓存中的会话超过该时间（秒）未与数据库核对时，才查询数据库确认其他进程是否写入过新消息
+REVALIDATE_SECONDS = float(os.environ.get("ADVICE_MEMORY_REVALIDATE_SECONDS", 5))
+
+# 消息以 (id, 角色, 内容, 时间戳) 元组保存在定长环形队列中
+Message = Tuple[int, str, str, float]
+
+
+class _Session:
+    __slots__ = ("messages", "last_id", "last_active", "checked_at", "summaries")
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[Message] = deque(maxlen=max_messages)
+        self.last_id = 0
+        self.last_active = time.time()
+        self.checked_at = time.time()
+        # persona -> (摘要, 已折叠到的消息id)，按需从数据库加载
+        self.summaries: Dict[str, Tuple[str, int]] = {}
 
 
 class MBTIConversationMemory:
-    def __init__(self):
-        # 为每个用户创建一个对话历史
-        self.user_memories = {}
-
-    def get_memory(self, user_id: str) -> ConversationBufferMemory:
-        """获取用户的对话记忆"""
-        if user_id not in self.user_memories:
-            self.user_memories[user_id] = ConversationBufferMemory(
-                return_messages=True, memory_key="chat_history"
-            )
-        return self.user_memories[user_id]
+    """
+    建议对话记忆：SQLite持久化（多进程共享），进程内LRU热缓存。
+    - 每个用户始终保留最近 max_messages 条消息；更早的消息要等涉及的每个MBTI类型都折叠进摘要后才删除
+      （一次建议可能同时写入十几个类型的回答，只按条数截断会丢掉还没摘要的消息），
+      总数超过 max_stored 时才不论是否已摘要直接删除，内存和数据库占用都有上限
+    - 会话空闲超过 ttl_seconds 后过期清空
+    - 热缓存中的会话每隔 revalidate_seconds 才与数据库核对一次，期间的读取不访问数据库
+    - 方法都是同步的数据库读写，异步接口中使用 aget_histories / aadd_exchange（在线程中执行）
+    """
+
+    def __init__(self, max_messages: int = HISTORY_MAX_MESSAGES, token_budget: int = HISTORY_TOKEN_BUDGET,
+                 ttl_seconds: float = SESSION_TTL_SECONDS, cache_size: int = HOT_CACHE_USERS,
+                 session_factory=None, revalidate_seconds: float = REVALIDATE_SECONDS,
+                 max_stored: int = HISTORY_MAX_STORED):
+        self.max_messages = max_messages
+        self.max_stored = max(max_stored, max_messages)
+        self.token_budget = token_budget
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        # 为空时使用 user_database.SessionLocal（首次访问数据库时导入）
+        self.session_factory = session_factory
+        self.revalidate_seconds = revalidate_seconds
+        self._cache: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._tables_ready = False
+
+    def _db(self):
+        """打开数据库会话；首次调用时导入数据库模型并建表"""
+        global ConversationMessage, ConversationSummary
+        if ConversationMessage is None:
+            from user_database.models import ConversationMessage, ConversationSummary
+        if self.session_factory is None:
+            from user_database import SessionLocal
+            self.session_factory = SessionLocal
+        db = self.session_factory()
+        if not self._tables_ready:
+            try:
+                ConversationMessage.__table__.create(bind=db.get_bind(), checkfirst=True)
+                ConversationSummary.__table__.create(bind=db.get_bind(), checkfirst=True)
+                self._tables_ready = True
+            except Exception:
+                db.close()
+                raise
+        return db
 
     def add_message(self, user_id: str, mbti_type: str, message: str, is_user: bool):
-        """添加消息到对话历史"""
-        memory = self.get_memory(user_id)
-        role = "用户" if is_user else mbti_type
-        message_obj = HumanMessage(content=f"[{role}] {message}") if is_user else \
-            AIMessage(content=f"[{mbti_type}] {message}")
-
-        memory.chat_memory.add_message(message_obj)
-
-    def get_history(self, user_id: str) -> str:
-        """获取用户的对话历史文本"""
-        memory = self.get_memory(user_id)
-        messages = memory.chat_memory.messages
-        return "\n".join([f"{msg.type}: {msg.content}" for msg in messages])
\ No newline at end of file
+        """添加消息到对话历史；写入数据库失败时不保存（消息id只来自数据库）"""
+        role = USER_ROLE if is_user else mbti_type
+        session = self._session(user_id)
+        now = time.time()
+        try:
+            db = self._db()
+        except Exception as e:
+            logger.warning(f"对话记忆写入失败，消息未保存: {e}")
+            return
+        try:
+            row = ConversationMessage(user_id=user_id, role=role, content=message)
+            db.add(row)
+            db.flush()
+            # 上次同步之后其他进程也写入了该用户的消息：移出热缓存，下次访问时重新加载
+            stale = db.query(ConversationMessage.id).filter(
+                ConversationMessage.user_id == user_id,
+                ConversationMessage.id > session.last_id, ConversationMessage.id < row.id
+            ).limit(1).scalar() is not None
+            trimmed = self._trim(db, user_id)
+            db.commit()
+            message_id = row.id
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"对话记忆写入失败，消息未保存: {e}")
+            return
+        finally:
+            db.close()
+        session.last_active = now
+        session.last_id = message_id
+        if trimmed:
+            kept = [m for m in session.messages if m[0] not in trimmed]
+            session.messages.clear()
+            session.messages.extend(kept)
+        session.messages.append((message_id, role, message, now))
+        if stale:
+            with self._lock:
+                if self._cache.get(user_id) is session:
+                    del self._cache[user_id]
+
+    def _id_at(self, db, user_id: str, offset: int) -> Optional[int]:
+        """该用户从新到旧第 offset+1 条消息的id（不足时返回 None）"""
+        return db.query(ConversationMessage.id).filter(
+            ConversationMessage.user_id == user_id
+        ).order_by(ConversationMessage.id.desc()).offset(offset).limit(1).scalar()
+
+    def _trim(self, db, user_id: str) -> set:
+        """删除最近 max_messages 条之前、且已折叠进摘要的消息（超过 max_stored 的直接删除），返回删除的id"""
+        boundary = self._id_at(db, user_id, self.max_messages)
+        if boundary is None:
+            return set()
+        covered = dict(db.query(ConversationSummary.persona, ConversationSummary.covered_id).filter(
+            ConversationSummary.user_id == user_id, ConversationSummary.persona != ""
+        ).all())
+        personas = [r for (r,) in db.query(ConversationMessage.role).filter(
+            ConversationMessage.user_id == user_id).distinct() if r != USER_ROLE]
+        # 类型的回答折叠进该类型的摘要后即可删除；用户消息出现在每个类型的对话中，所有类型都折叠后才能删除
+        user_floor = min((covered.get(p, 0) for p in personas), default=0)
+        conditions = [and_(ConversationMessage.role == USER_ROLE, ConversationMessage.id <= min(boundary, user_floor))]
+        conditions += [and_(ConversationMessage.role == p, ConversationMessage.id <= min(boundary, c))
+                       for p, c in covered.items()]
+        hard_boundary = self._id_at(db, user_id, self.max_stored)
+        if hard_boundary is not None:
+            conditions.append(ConversationMessage.id <= hard_boundary)
+        ids = {i for (i,) in db.query(ConversationMessage.id).filter(
+            ConversationMessage.user_id == user_id, or_(*conditions))}
+        if ids:
+            db.query(ConversationMessage).filter(ConversationMessage.id.in_(ids)).delete(synchronize_session=False)
+        return ids
+
+    def add_exchange(self, user_id: str, question: str, responses: Dict[str, str]):
+        """保存一轮对话：用户的问题和各MBTI类型的回答"""
+        self.add_message(user_id, USER_ROLE, question, is_user=True)
+        for mbti, advice in responses.items():
+            self.add_message(user_id, mbti, advice, is_user=False)
+
+    async def aadd_exchange(self, user_id: str, question: str, responses: Dict[str, str]):
+        await asyncio.to_thread(self.add_exchange, user_id, question, responses)
+
+    async def aget_histories(self, user_id: str, personas: Iterable[str]) -> Dict[str, str]:
+        """在线程中读取各MBTI类型的对话历史（persona -> 历史文本），不阻塞事件循环"""
+        personas = list(personas)
+        return await asyncio.to_thread(lambda: {p: self.get_history(user_id, persona=p) for p in personas})
+
+    def get_history(self, user_id: str, max_tokens: Optional[int] = None, persona: Optional[str] = None) -> str:
+        """
+        获取用户的对话历史文本（从最新消息往前，不超过token预算）。
+        指定 persona 时只包含用户与该MBTI类型之间的对话；已折叠的旧消息以摘要形式出现。
+        """
+        budget = self.token_budget if max_tokens is None else max_tokens
+        session = self._session(user_id)
+        summary, covered_id = self._summary(user_id, session, persona)
+        lines = []
+        used = 0
+        if summary:
+            summary_line = f"对话摘要: {summary}"
+            used = estimate_tokens(summary_line)
+        for message_id, role, content, _ in reversed(self._messages(session, persona)):
+            if message_id <= covered_id:
+                break
+            line = f"human: [{role}] {content}" if role == USER_ROLE else f"ai: [{role}] {content}"
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        if summary:
+            lines.append(summary_line)
+        return "\n".join(reversed(lines))
+
+    def messages_to_fold(self, user_id: str, persona: Optional[str] = None, keep_recent: int = 6) -> List[Message]:
+        """尚未折叠进摘要、且不在最近 keep_recent 条之内的消息（供后台摘要使用）"""
+        session = self._session(user_id)
+        _, covered_id = self._summary(user_id, session, persona)
+        messages = [m for m in self._messages(session, persona) if m[0] > covered_id]
+        return messages[:-keep_recent] if keep_recent > 0 else messages
+
+    def get_summary(self, user_id: str, persona: Optional[str] = None) -> Tuple[str, int]:
+        return self._summary(user_id, self._session(user_id), persona)
+
+    def set_summary(self, user_id: str, persona: Optional[str], summary: str, covered_id: int):
+        """保存滚动摘要，covered_id 及之前的消息此后只以摘要形式出现"""
+        persona = persona or ""
+        with self._lock:
+            session = self._cache.get(user_id)
+        if session is not None:
+            session.summaries[persona] = (summary, covered_id)
+        try:
+            db = self._db()
+        except Exception as e:
+            logger.warning(f"对话摘要保存失败: {e}")
+            return
+        try:
+            row = db.query(ConversationSummary).filter_by(user_id=user_id, persona=persona).first()
+            if row is None:
+                row = ConversationSummary(user_id=user_id, persona=persona)
+                db.add(row)
+            row.summary = summary
+            row.covered_id = covered_id
+            row.updated_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"对话摘要保存失败: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _messages(session: _Session, persona: Optional[str]) -> List[Message]:
+        if not persona:
+            return list(session.messages)
+        return [m for m in session.messages if m[1] in (USER_ROLE, persona)]
+
+    def _summary(self, user_id: str, session: _Session, persona: Optional[str]) -> Tuple[str, int]:
+        persona = persona or ""
+        if persona not in session.summaries:
+            db = None
+            try:
+                db = self._db()
+                row = db.query(ConversationSummary).filter_by(user_id=user_id, persona=persona).first()
+                session.summaries[persona] = (row.summary, row.covered_id) if row else ("", 0)
+            except Exception as e:
+                logger.warning(f"对话摘要读取失败: {e}")
+                return "", 0
+            finally:
+                if db is not None:
+                    db.close()
+        return session.summaries[persona]
+
+    def clear(self, user_id: str):
+        with self._lock:
+            self._cache.pop(user_id, None)
+        self._delete(user_id)
+
+    def _session(self, user_id: str) -> _Session:
+        with self._lock:
+            session = self._cache.get(user_id)
+            if session is not None:
+                self._cache.move_to_end(user_id)
+        reload = session is None
+        if not reload and time.time() - session.checked_at > self.revalidate_seconds:
+            # 核对间隔已过：其他进程写入过新消息时重新加载
+            latest = self._latest_id(user_id)
+            session.checked_at = time.time()
+            reload = latest is not None and latest != session.last_id
+        if reload:
+            session = self._load(user_id)
+            with self._lock:
+                self._cache[user_id] = session
+                self._cache.move_to_end(user_id)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if session.messages and time.time() - session.last_active > self.ttl_seconds:
+            session.messages.clear()
+            session.summaries.clear()
+            session.last_active = time.time()
+            self._delete(user_id)
+        return session
+
+    def _latest_id(self, user_id: str) -> Optional[int]:
+        db = None
+        try:
+            db = self._db()
+            return db.query(func.max(ConversationMessage.id)).filter(
+                ConversationMessage.user_id == user_id).scalar() or 0
+        except Exception as e:
+            logger.warning(f"对话记忆读取失败，使用内存缓存: {e}")
+            return None
+        finally:
+            if db is not None:
+                db.close()
+
+    def _load(self, user_id: str) -> _Session:
+        session = _Session(self.max_stored)
+        db = None
+        try:
+            db = self._db()
+            rows = db.query(ConversationMessage).filter(
+                ConversationMessage.user_id == user_id
+            ).order_by(ConversationMessage.id.desc()).limit(self.max_stored).all()
+        except Exception as e:
+            logger.warning(f"对话记忆加载失败: {e}")
+            rows = []
+        finally:
+            if db is not None:
+                db.close()
+        for row in reversed(rows):
+            ts = row.created_at.replace(tzinfo=timezone.utc).timestamp() if row.created_at else time.time()
+            session.messages.append((row.id, row.role, row.content, ts))
+        if rows:
+            session.last_id = rows[0].id
+            session.last_active = session.messages[-1][3]
+        return session
+
+    def _delete(self, user_id: str):
+        try:
+            db = self._db()
+        except Exception as e:
+            logger.warning(f"对话记忆清理失败: {e}")
+            return
+        try:
+            db.query(ConversationMessage).filter(ConversationMessage.user_id == user_id).delete(
+                synchronize_session=False)
+            db.query(ConversationSummary).filter(ConversationSummary.user_id == user_id).delete(
+                synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"对话记忆清理失败: {e}")
+        finally:
+            db.close()
+
+
+# 进程内共享的对话记忆（跨请求复用，跨进程通过数据库共享）
+conversation_memory = MBTIConversationMemory()
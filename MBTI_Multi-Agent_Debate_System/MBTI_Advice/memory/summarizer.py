@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+from .conversation_memory import MBTIConversationMemory, USER_ROLE, conversation_memory
+
+logger = logging.getLogger(__name__)
+
+# 摘要之后始终以原文保留的最近消息数
+SUMMARY_KEEP_RECENT = int(os.environ.get("ADVICE_SUMMARY_KEEP_RECENT", 6))
+# 待折叠的消息达到该数量才触发一次摘要，避免每轮都调用
+SUMMARY_MIN_BATCH = int(os.environ.get("ADVICE_SUMMARY_MIN_BATCH", 6))
+SUMMARY_MAX_CHARS = int(os.environ.get("ADVICE_SUMMARY_MAX_CHARS", 300))
+
+SUMMARY_PROMPT = """请把下面的对话内容合并进已有摘要，输出一段更新后的中文摘要。
+要求：保留用户的背景信息、核心困惑、已经给出的主要建议和用户的反馈，去掉寒暄和重复内容，不超过{max_chars}字，直接输出摘要正文。
+
+已有摘要：
+{summary}
+
+新的对话：
+{dialogue}
+"""
+
+
+def _default_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        api_key=os.environ.get("DEEPSEEK_API_KEY"),
+        base_url=os.environ.get("DEEPSEEK_BASE_URL"),
+        model_name=os.environ.get("ADVICE_SUMMARY_MODEL", "deepseek-chat"),
+        temperature=0.3,
+        max_tokens=600
+    )
+
+
+class ConversationSummarizer:
+    """
+    后台滚动摘要：较早的对话轮次折叠进每个用户（可按MBTI类型区分）的摘要，
+    提示词只携带 摘要 + 最近若干轮，长度不再随对话轮数线性增长。
+    摘要在请求结束后异步刷新，不占用请求耗时。
+    """
+
+    def __init__(self, memory: MBTIConversationMemory = conversation_memory, llm=None,
+                 keep_recent: int = SUMMARY_KEEP_RECENT, min_batch: int = SUMMARY_MIN_BATCH,
+                 max_chars: int = SUMMARY_MAX_CHARS):
+        self.memory = memory
+        self._llm = llm
+        self.keep_recent = keep_recent
+        self.min_batch = min_batch
+        self.max_chars = max_chars
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = _default_llm()
+        return self._llm
+
+    def schedule(self, user_id: str, persona: Optional[str] = None) -> Optional[asyncio.Task]:
+        """在后台刷新摘要（同一用户/类型同时只运行一个任务），不阻塞当前请求"""
+        key = (user_id, persona or "")
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            return task
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        task = loop.create_task(self._refresh_safely(user_id, persona))
+        self._tasks[key] = task
+        task.add_done_callback(lambda t: self._tasks.pop(key, None) if self._tasks.get(key) is t else None)
+        return task
+
+    async def _refresh_safely(self, user_id: str, persona: Optional[str]):
+        try:
+            await self.refresh(user_id, persona)
+        except Exception as e:
+            logger.warning(f"对话摘要刷新失败（{user_id}/{persona or '全部'}）: {e}")
+
+    async def refresh(self, user_id: str, persona: Optional[str] = None) -> bool:
+        """待折叠的消息足够多时调用一次LLM更新摘要，返回是否更新"""
+        # 数据库读写放到线程中，避免阻塞事件循环
+        pending = await asyncio.to_thread(self.memory.messages_to_fold, user_id, persona, self.keep_recent)
+        if len(pending) < self.min_batch:
+            return False
+        summary, _ = await asyncio.to_thread(self.memory.get_summary, user_id, persona)
+        dialogue = "\n".join(f"[{role}] {content}" if role != USER_ROLE else f"[用户] {content}"
+                             for _, role, content, _ in pending)
+        prompt = SUMMARY_PROMPT.format(max_chars=self.max_chars, summary=summary or "（无）", dialogue=dialogue)
+        result = await self.llm.ainvoke(prompt)
+        text = (result.content if hasattr(result, 'content') else str(result)).strip()
+        if not text:
+            return False
+        await asyncio.to_thread(self.memory.set_summary, user_id, persona, text, pending[-1][0])
+        return True
+
+
+# 进程内共享的摘要器
+conversation_summarizer = ConversationSummarizer()
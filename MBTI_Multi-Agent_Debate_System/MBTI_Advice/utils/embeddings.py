@@ -0,0 +1,50 @@
+import re
+import zlib
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+# 去掉空白和常见标点后再切分字符n-gram
+_NORMALIZE = re.compile(r"[\s，。、；：！？,.;:!?（）()“”‘’「」『』\"'《》…—\-~～]+")
+
+
+class HashingVectorizer:
+    """
+    本地哈希向量化：字符n-gram经哈希映射到固定维度并做L2归一化，不需要模型和网络。
+    对中文按字切分天然适用；相似问法（同义改写、语序微调）的余弦相似度高。
+    """
+
+    def __init__(self, dim: int = 1024, ngram_range: Tuple[int, int] = (1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return _NORMALIZE.sub("", (text or "").lower())
+
+    def ngrams(self, text: str) -> List[str]:
+        text = self.normalize(text)
+        grams = []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+        return grams
+
+    def embed(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for gram in self.ngrams(text):
+            h = zlib.crc32(gram.encode("utf-8"))
+            # 最高位决定符号，减小哈希冲突带来的偏差
+            vec[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def embed_batch(self, texts: Iterable[str]) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack([self.embed(t) for t in texts])
+
+
+# 进程内共享的默认向量化器
+default_vectorizer = HashingVectorizer()
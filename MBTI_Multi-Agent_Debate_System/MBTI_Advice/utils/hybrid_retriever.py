@@ -0,0 +1,197 @@
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from .local_index import LocalVectorIndex
+
+# hybrid：关键词与向量检索按排名融合；keyword：只用倒排索引（不需要向量化）；vector：只用向量检索
+RETRIEVAL_MODE = os.environ.get("ADVICE_RETRIEVAL_MODE", "hybrid").lower()
+RRF_K = int(os.environ.get("ADVICE_RRF_K", 60))
+BM25_FILE = "bm25.pkl"
+
+# 英文/数字按词切分，连续的中文按字二元组切分
+_TOKEN = re.compile(r"[a-z0-9]+|[\u3400-\u9fff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for run in _TOKEN.findall((text or "").lower()):
+        if run[0] < "\u3400" or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    字符n-gram倒排索引 + BM25打分，不依赖分词服务。
+    倒排表按词项连续存放（CSR格式）：行号数组和预先算好的BM25词频权重数组，查询时只需按idf加权求和。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_count = 0
+        self._term_ids: Dict[str, int] = {}
+        # 追加写入的 (行号, 词项id, 词频) 三元组与文档长度，finalize 时整体排序成倒排表
+        self._docs = array("q")
+        self._terms = array("q")
+        self._tfs = array("f")
+        self._lengths = array("f")
+        self._starts = np.zeros(1, dtype=np.int64)
+        self._postings = np.zeros(0, dtype=np.int64)
+        self._weights = np.zeros(0, dtype=np.float32)
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._dirty = False
+
+    def add(self, doc_id: int, text: str):
+        """按行号顺序追加文档"""
+        counts = Counter(tokenize(text))
+        while len(self._lengths) < doc_id:
+            self._lengths.append(0)
+        self._lengths.append(sum(counts.values()))
+        term_ids = self._term_ids
+        for term, tf in counts.items():
+            self._docs.append(doc_id)
+            self._terms.append(term_ids.setdefault(term, len(term_ids)))
+            self._tfs.append(tf)
+        self.doc_count = len(self._lengths)
+        self._dirty = True
+
+    def finalize(self):
+        """根据当前的平均文档长度重新计算倒排表和BM25权重"""
+        if not self._dirty:
+            return
+        docs = np.frombuffer(self._docs, dtype=np.int64)
+        terms = np.frombuffer(self._terms, dtype=np.int64)
+        tfs = np.frombuffer(self._tfs, dtype=np.float32)
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)
+        avgdl = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths / avgdl)
+        order = np.argsort(terms, kind="stable")
+        postings, tf = docs[order], tfs[order]
+        df = np.bincount(terms, minlength=len(self._term_ids))
+        self._starts = np.concatenate([[0], np.cumsum(df)])
+        self._postings = postings
+        self._weights = (tf * (self.k1 + 1) / (tf + norm[postings])).astype(np.float32)
+        self._idf = np.log(1 + (self.doc_count - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self._dirty = False
+
+    def search(self, query: str, k: int = 5, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """返回BM25得分最高的k个行号和得分（降序），没有任何词项命中时为空"""
+        self.finalize()
+        ids, weights = [], []
+        for term, qtf in Counter(tokenize(query)).items():
+            tid = self._term_ids.get(term)
+            if tid is not None and tid < len(self._idf):
+                start, end = self._starts[tid], self._starts[tid + 1]
+                ids.append(self._postings[start:end])
+                weights.append(self._weights[start:end] * (self._idf[tid] * qtf))
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if not ids:
+            return empty
+        ids, weights = np.concatenate(ids), np.concatenate(weights)
+        if allowed is not None:
+            keep = allowed[ids]
+            ids, weights = ids[keep], weights[keep]
+        if len(ids) == 0:
+            return empty
+        docs, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        if len(docs) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            docs, scores = docs[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return docs[order], scores[order]
+
+
+class HybridRetriever:
+    """
+    知识库混合检索：BM25关键词检索与向量检索各取候选，按倒数排名融合（RRF）排序。
+    倒排索引随向量索引增量同步，并保存在索引目录下，重启后只需补齐新增的文档。
+    与向量数据库一样提供 get_relevant_info(query, k) 接口。
+    """
+
+    def __init__(self, index: LocalVectorIndex, mode: str = RETRIEVAL_MODE, rrf_k: int = RRF_K,
+                 min_similarity: Optional[float] = None):
+        self.index = index
+        self.mode = mode
+        self.rrf_k = rrf_k
+        # 向量候选的最低余弦相似度，低于该值的不参与融合
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self.bm25 = self._load()
+
+    def sync(self) -> int:
+        """把向量索引中新增的文档加入倒排索引并预计算权重，返回新增的条数"""
+        with self._lock:
+            start = self.bm25.doc_count
+            added = 0
+            for doc_id, text in self.index.iter_texts(start):
+                self.bm25.add(doc_id, text)
+                added += 1
+            self.bm25.finalize()
+            if added:
+                self._save()
+            return added
+
+    def search(self, query: str, k: int = 5, mbti_type: Optional[str] = None,
+               mode: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """返回 (文档, 得分)；keyword 模式为BM25得分，vector 模式为余弦相似度，hybrid 模式为RRF得分"""
+        mode = (mode or self.mode).lower()
+        if mode != "vector" and self.bm25.doc_count < len(self.index):
+            self.sync()
+        allowed = self.index.allowed_mask(mbti_type)
+        if mode == "keyword":
+            ids, scores = self.bm25.search(query, k, allowed)
+        elif mode == "vector":
+            ids, scores = self._vector_candidates(query, k, mbti_type)
+        else:
+            depth = max(k * 4, 20)
+            ranked = [self.bm25.search(query, depth, allowed)[0], self._vector_candidates(query, depth, mbti_type)[0]]
+            fused: Dict[int, float] = defaultdict(float)
+            for ids in ranked:
+                for rank, doc_id in enumerate(ids):
+                    fused[int(doc_id)] += 1.0 / (self.rrf_k + rank + 1)
+            best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+            ids, scores = [d for d, _ in best], [s for _, s in best]
+        return [(self.index.get_document(int(i)), float(s)) for i, s in zip(ids, scores)]
+
+    def get_relevant_info(self, query: str, k: int = 5, mbti_type: Optional[str] = None) -> List[Document]:
+        return [doc for doc, _ in self.search(query, k=k, mbti_type=mbti_type)]
+
+    def _vector_candidates(self, query: str, k: int, mbti_type: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        ids, scores = self.index.search_ids(query, k, mbti_type)
+        if self.min_similarity is not None:
+            keep = scores >= self.min_similarity
+            ids, scores = ids[keep], scores[keep]
+        return ids, scores
+
+    def _load(self) -> BM25Index:
+        path = os.path.join(self.index.path, BM25_FILE) if self.index.path else None
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    bm25 = pickle.load(f)
+                # 索引文件被截断修复过时已保存的倒排索引可能超前，重新构建
+                if bm25.doc_count <= len(self.index):
+                    return bm25
+            except Exception as e:
+                print(f"倒排索引加载失败，重新构建: {e}")
+        return BM25Index()
+
+    def _save(self):
+        if not self.index.path:
+            return
+        path = os.path.join(self.index.path, BM25_FILE)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(self.bm25, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from .embeddings import HashingVectorizer
+from .local_index import LocalVectorIndex
+
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 256))
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", min(4, os.cpu_count() or 1)))
+INGEST_EXTENSIONS = (".txt", ".md", ".markdown")
+MANIFEST_FILE = "ingest_manifest.jsonl"
+# 大文件按块读取，每块约1M字符，避免整份读入内存
+READ_BLOCK_CHARS = 1 << 20
+
+# 中文优先在段落、句末标点处切分，标点保留在句尾
+CHINESE_SEPARATORS = ["\n\n", "\n", r"(?<=[。！？!?])", r"(?<=[；;])", r"(?<=[，,、])", " ", ""]
+_MBTI_IN_PATH = re.compile(r"(?<![A-Za-z])([EI][NS][TF][JP])(?![A-Za-z])", re.IGNORECASE)
+
+
+def chinese_text_splitter(chunk_size: int = 500, chunk_overlap: int = 50) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        separators=CHINESE_SEPARATORS,
+        is_separator_regex=True,
+        keep_separator=True,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+
+
+def _embed_batch(texts: List[str], dim: int, ngram_range: Tuple[int, int]) -> np.ndarray:
+    # 在工作进程中执行，向量化器按参数重建
+    return HashingVectorizer(dim, ngram_range).embed_batch(texts)
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_blocks(path: str, block_chars: int = READ_BLOCK_CHARS) -> Iterator[str]:
+    """按行累积到约 block_chars 个字符后产出一块"""
+    lines, size = [], 0
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if size >= block_chars:
+                yield "".join(lines)
+                lines, size = [], 0
+    if lines:
+        yield "".join(lines)
+
+
+@dataclass
+class IngestStats:
+    files_seen: int = 0
+    files_skipped: int = 0
+    files_ingested: int = 0
+    files_removed: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    @property
+    def docs_per_sec(self) -> float:
+        return self.files_ingested / self.seconds if self.seconds else 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "files_seen": self.files_seen,
+            "files_skipped": self.files_skipped,
+            "files_ingested": self.files_ingested,
+            "files_removed": self.files_removed,
+            "chunks": self.chunks,
+            "seconds": round(self.seconds, 2),
+            "docs_per_sec": round(self.docs_per_sec, 1),
+            "chunks_per_sec": round(self.chunks_per_sec, 1),
+        }
+
+
+class KnowledgeIngestor:
+    """
+    MBTI知识库流式导入：逐个文件按块读取、中文切分，分批交给工作进程向量化，按提交顺序增量写入索引。
+    - 同一时间在途的批次数有上限，内存占用与语料总量无关
+    - 清单记录每个文件的内容哈希和对应的行号范围：未变化的文件跳过，变化或删除的文件先删除旧片段；
+      清单以追加日志保存，文件开始写入前先记一条未完成标记，中断后重跑会清理残留片段
+    - 文件路径中含MBTI类型（如 intj/职业.md）时，片段标记为该类型
+    """
+
+    def __init__(self, index: LocalVectorIndex, batch_size: int = INGEST_BATCH_SIZE, workers: int = INGEST_WORKERS,
+                 chunk_size: int = 500, chunk_overlap: int = 50, extensions: Sequence[str] = INGEST_EXTENSIONS,
+                 use_processes: bool = True, fsync: bool = False):
+        self.index = index
+        self.batch_size = batch_size
+        self.workers = workers
+        self.splitter = chinese_text_splitter(chunk_size, chunk_overlap)
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.use_processes = use_processes
+        self.fsync = fsync
+        self.manifest_path = os.path.join(index.path, MANIFEST_FILE) if index.path else None
+        self.manifest: Dict[str, dict] = self._load_manifest()
+
+    def ingest(self, data_dir: str) -> IngestStats:
+        """导入目录下的所有文本文件，返回导入统计"""
+        stats = IngestStats()
+        started = time.perf_counter()
+        root = os.path.abspath(data_dir)
+        seen = set()
+        self._cleanup_incomplete()
+        executor = self._executor()
+        pending = deque()
+        starts: Dict[str, int] = {}
+        max_inflight = max(2, 2 * self.workers)
+        try:
+            for path in self._scan(root):
+                stats.files_seen += 1
+                seen.add(path)
+                digest = _file_hash(path)
+                entry = self.manifest.get(path)
+                if entry and entry["hash"] == digest:
+                    stats.files_skipped += 1
+                    continue
+                if entry:
+                    self.index.delete(range(*entry["rows"]))
+                for texts, metadatas in self._batches(path, root):
+                    pending.append(("batch", path, (self._submit(executor, texts), texts, metadatas)))
+                    while len(pending) > max_inflight:
+                        self._drain_one(pending, stats, starts)
+                # 文件的最后一个批次写入后再记录清单
+                pending.append(("done", path, digest))
+            while pending:
+                self._drain_one(pending, stats, starts)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        for path in [p for p in self.manifest if p.startswith(root + os.sep) and p not in seen]:
+            self.index.delete(range(*self.manifest.pop(path)["rows"]))
+            self._log_manifest({"path": path, "removed": True})
+            stats.files_removed += 1
+        self._compact_manifest()
+        self.index.maybe_build_ivf()
+        stats.seconds = time.perf_counter() - started
+        print(f"知识库导入完成：{stats.files_seen} 个文件，新增/更新 {stats.files_ingested}，跳过 {stats.files_skipped}，"
+              f"删除 {stats.files_removed}，{stats.chunks} 个片段，"
+              f"{stats.docs_per_sec:.1f} 文档/秒，{stats.chunks_per_sec:.1f} 片段/秒")
+        return stats
+
+    def _scan(self, root: str) -> Iterator[str]:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(self.extensions):
+                    yield os.path.join(dirpath, name)
+
+    def _batches(self, path: str, root: str) -> Iterator[Tuple[List[str], List[dict]]]:
+        rel = os.path.relpath(path, root)
+        match = _MBTI_IN_PATH.search(rel)
+        base = {"source": rel}
+        if match:
+            base["mbti"] = match.group(1).upper()
+        texts, metadatas = [], []
+        chunk_no = 0
+        for block in _read_blocks(path):
+            for chunk in self.splitter.split_text(block):
+                chunk = chunk.strip()
+                if not chunk:
+                    continue
+                texts.append(chunk)
+                metadatas.append(dict(base, chunk=chunk_no))
+                chunk_no += 1
+                if len(texts) >= self.batch_size:
+                    yield texts, metadatas
+                    texts, metadatas = [], []
+        if texts:
+            yield texts, metadatas
+
+    def _submit(self, executor: Optional[Executor], texts: List[str]):
+        vectorizer = self.index.vectorizer
+        if executor is None:
+            return vectorizer.embed_batch(texts)
+        return executor.submit(_embed_batch, texts, vectorizer.dim, vectorizer.ngram_range)
+
+    def _drain_one(self, pending: deque, stats: IngestStats, starts: Dict[str, int]):
+        """按提交顺序取出最早的批次写入索引；遇到文件结束标记时更新清单"""
+        kind, path, payload = pending.popleft()
+        if kind == "done":
+            start = starts.pop(path, len(self.index))
+            self._set_entry(path, payload, [start, len(self.index)])
+            stats.files_ingested += 1
+            return
+        future, texts, metadatas = payload
+        vectors = future if isinstance(future, np.ndarray) else future.result()
+        if path not in starts:
+            starts[path] = len(self.index)
+            self._set_entry(path, "", [starts[path], None])
+        self.index.add_texts(texts, metadatas, vectors=vectors, fsync=self.fsync)
+        stats.chunks += len(texts)
+
+    def _executor(self) -> Optional[Executor]:
+        if self.workers <= 0:
+            return None
+        if self.use_processes:
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def _cleanup_incomplete(self):
+        # 上次导入中断的文件：删除其起始行之后写入的片段，本次重新导入
+        for path, entry in list(self.manifest.items()):
+            if entry["rows"][1] is None:
+                self.index.delete(range(entry["rows"][0], len(self.index)))
+                self._set_entry(path, "", [entry["rows"][0], len(self.index)])
+
+    def _set_entry(self, path: str, digest: str, rows: list):
+        self.manifest[path] = {"hash": digest, "rows": rows}
+        self._log_manifest({"path": path, "hash": digest, "rows": rows})
+
+    def _load_manifest(self) -> Dict[str, dict]:
+        manifest = {}
+        if self.manifest_path and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("removed"):
+                        manifest.pop(record["path"], None)
+                    else:
+                        manifest[record["path"]] = {"hash": record["hash"], "rows": record["rows"]}
+        return manifest
+
+    def _log_manifest(self, record: dict):
+        if not self.manifest_path:
+            return
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _compact_manifest(self):
+        """导入结束后把追加日志压缩为每个文件一条记录"""
+        if not self.manifest_path:
+            return
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for path, entry in self.manifest.items():
+                f.write(json.dumps({"path": path, **entry}, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.manifest_path)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="导入MBTI知识库文本到本地向量索引")
+    parser.add_argument("data_dir")
+    parser.add_argument("--db", default=os.environ.get("VECTOR_DB_PATH", "mbti_vector_db"))
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    args = parser.parse_args()
+    KnowledgeIngestor(LocalVectorIndex(args.db), batch_size=args.batch_size, workers=args.workers).ingest(args.data_dir)
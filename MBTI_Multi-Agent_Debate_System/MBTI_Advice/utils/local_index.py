@@ -0,0 +1,318 @@
+import json
+import os
+import threading
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from .embeddings import HashingVectorizer, default_vectorizer
+
+# 向量数超过该值时建立IVF倒排索引，只扫描最近的若干个簇
+IVF_MIN_ROWS = int(os.environ.get("VECTOR_INDEX_IVF_MIN_ROWS", 20000))
+IVF_NPROBE = int(os.environ.get("VECTOR_INDEX_NPROBE", 8))
+# 暴力扫描时每次读入内存的行数，限制大语料下的峰值内存
+SCAN_CHUNK_ROWS = 65536
+# 未指定MBTI类型的文档视为通用资料，按类型过滤时始终保留
+GENERAL_MBTI = ""
+
+VECTORS_FILE = "vectors.f32"
+DOCS_FILE = "docs.jsonl"
+IVF_FILE = "ivf.npz"
+DELETED_FILE = "deleted.i64"
+
+
+class LocalVectorIndex:
+    """
+    本地向量索引：float32向量矩阵以内存映射文件保存，余弦相似度取top-k，完全离线。
+    - 小语料直接用NumPy分块暴力扫描；超过 IVF_MIN_ROWS 后建立IVF（球面k-means聚类），
+      查询只扫描最近的 nprobe 个簇，以及建索引之后新追加的向量
+    - 文档正文按行存于 docs.jsonl，只在内存中保留偏移量和MBTI类型编码，按需读取
+    - 文件只追加不改写；删除以墓碑记录，查询时跳过
+    - path 为 None 时全部保存在内存中（用于内置的小型知识库）
+    """
+
+    def __init__(self, path: Optional[str] = None, vectorizer: HashingVectorizer = default_vectorizer,
+                 ivf_min_rows: int = IVF_MIN_ROWS, nprobe: int = IVF_NPROBE):
+        self.path = path
+        self.vectorizer = vectorizer
+        self.dim = vectorizer.dim
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._count = 0
+        self._offsets: List[int] = []
+        self._codes = np.zeros(0, dtype=np.int16)
+        self._deleted = np.zeros(0, dtype=bool)
+        self._mbti_codes = {GENERAL_MBTI: 0}
+        self._memory_docs: List[Tuple[str, dict]] = []
+        self._memory_vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._matrix = None
+        self._ivf = None
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._open()
+
+    def __len__(self) -> int:
+        return self._count
+
+    # ---------- 写入 ----------
+
+    def add_texts(self, texts: Sequence[str], metadatas: Optional[Sequence[dict]] = None,
+                  vectors: Optional[np.ndarray] = None, fsync: bool = False) -> int:
+        """追加文档（可传入已计算好的向量），返回追加的条数"""
+        texts = list(texts)
+        if not texts:
+            return 0
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        if vectors is None:
+            vectors = self.vectorizer.embed_batch(texts)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+        with self._lock:
+            codes = np.array([self._code(meta.get("mbti")) for meta in metadatas], dtype=np.int16)
+            if self.path is None:
+                self._memory_docs.extend(zip(texts, metadatas))
+                self._memory_vectors = np.vstack([self._memory_vectors, vectors])
+            else:
+                docs_path = os.path.join(self.path, DOCS_FILE)
+                with open(docs_path, "ab") as f:
+                    position = f.tell()
+                    for text, meta in zip(texts, metadatas):
+                        line = json.dumps({"text": text, "metadata": meta}, ensure_ascii=False).encode("utf-8") + b"\n"
+                        self._offsets.append(position)
+                        f.write(line)
+                        position += len(line)
+                    if fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                # 向量在文档之后写入：中途失败时以两者较短的一方为准
+                with open(os.path.join(self.path, VECTORS_FILE), "ab") as f:
+                    f.write(vectors.tobytes())
+                    if fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                self._matrix = None
+            self._codes = np.concatenate([self._codes, codes])
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(texts), dtype=bool)])
+            self._count += len(texts)
+        return len(texts)
+
+    def add_documents(self, documents: Iterable[Document], **kwargs) -> int:
+        documents = list(documents)
+        return self.add_texts([d.page_content for d in documents], [dict(d.metadata) for d in documents], **kwargs)
+
+    def delete(self, ids: Iterable[int]) -> int:
+        """按行号删除文档，返回实际删除的条数"""
+        with self._lock:
+            ids = np.unique(np.fromiter(ids, dtype=np.int64))
+            ids = ids[(ids >= 0) & (ids < self._count)]
+            ids = ids[~self._deleted[ids]]
+            if len(ids) == 0:
+                return 0
+            if self.path:
+                with open(os.path.join(self.path, DELETED_FILE), "ab") as f:
+                    f.write(ids.tobytes())
+            self._deleted[ids] = True
+            return len(ids)
+
+    def maybe_build_ivf(self) -> bool:
+        """向量数达到阈值且IVF缺失或过期（之后追加的向量超过20%）时重建，返回是否重建"""
+        with self._lock:
+            if self._count < self.ivf_min_rows:
+                return False
+            if self._ivf is not None and self._count - self._ivf["built_count"] <= 0.2 * self._ivf["built_count"]:
+                return False
+        self.build_ivf()
+        return True
+
+    def build_ivf(self, nlist: Optional[int] = None, iterations: int = 8, sample_size: int = 50000, seed: int = 0):
+        """在采样向量上做球面k-means，再把全部向量分配到最近的簇"""
+        with self._lock:
+            matrix = self._vectors()
+            count = len(matrix)
+            if count == 0:
+                return
+            nlist = nlist or max(1, int(np.sqrt(count)))
+            rng = np.random.default_rng(seed)
+            sample = matrix[np.sort(rng.choice(count, min(sample_size, count), replace=False))]
+            centroids = sample[rng.choice(len(sample), min(nlist, len(sample)), replace=False)].copy()
+            for _ in range(iterations):
+                assign = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(len(centroids)):
+                    members = sample[assign == c]
+                    if len(members):
+                        mean = members.sum(axis=0)
+                        norm = np.linalg.norm(mean)
+                        if norm:
+                            centroids[c] = mean / norm
+            assignments = np.empty(count, dtype=np.int32)
+            for start in range(0, count, SCAN_CHUNK_ROWS):
+                block = np.asarray(matrix[start:start + SCAN_CHUNK_ROWS])
+                assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            order = np.argsort(assignments, kind="stable")
+            bounds = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+            self._ivf = {"centroids": centroids, "order": order.astype(np.int64), "bounds": bounds,
+                         "built_count": count}
+            if self.path:
+                np.savez(os.path.join(self.path, IVF_FILE), **self._ivf)
+
+    # ---------- 查询 ----------
+
+    def search(self, query: str, k: int = 5, mbti_type: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """返回与查询最相似的k篇文档及余弦相似度；指定 mbti_type 时只返回该类型和通用的资料"""
+        ids, scores = self.search_ids(query, k, mbti_type)
+        return [(self.get_document(int(i)), float(score)) for i, score in zip(ids, scores)]
+
+    def search_ids(self, query: str, k: int = 5, mbti_type: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """同 search，只返回按相似度降序排列的行号和相似度"""
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if not query or k <= 0:
+            return empty
+        q = self.vectorizer.embed(query)
+        with self._lock:
+            matrix = self._vectors()
+            count = len(matrix)
+            if count == 0:
+                return empty
+            allowed = self.allowed_mask(mbti_type)
+            candidates = self._ivf_candidates(q, count)
+            if candidates is not None:
+                if allowed is not None:
+                    candidates = candidates[allowed[candidates]]
+                ids, scores = candidates, matrix[candidates] @ q
+            else:
+                ids, scores = self._scan(matrix, q, k, allowed)
+            if len(ids) == 0:
+                return empty
+            top = np.argpartition(-scores, min(k, len(ids)) - 1)[:k] if len(ids) > k else np.arange(len(ids))
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return ids[top], scores[top]
+
+    def allowed_mask(self, mbti_type: Optional[str] = None) -> Optional[np.ndarray]:
+        """可参与检索的行：排除已删除的文档，指定类型时只保留该类型和通用资料；全部可用时返回None"""
+        with self._lock:
+            count = self._count
+            allowed = ~self._deleted[:count] if self._deleted[:count].any() else None
+            if mbti_type is not None:
+                code = self._mbti_codes.get(mbti_type.upper(), -1)
+                matched = (self._codes[:count] == code) | (self._codes[:count] == 0)
+                allowed = matched if allowed is None else allowed & matched
+            return allowed
+
+    def get_relevant_info(self, query: str, k: int = 5, mbti_type: Optional[str] = None) -> List[Document]:
+        return [doc for doc, _ in self.search(query, k=k, mbti_type=mbti_type)]
+
+    def _scan(self, matrix, q: np.ndarray, k: int, allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        # 分块暴力扫描，每块只保留前k个，避免一次性读入整个矩阵
+        best_ids, best_scores = [], []
+        for start in range(0, len(matrix), SCAN_CHUNK_ROWS):
+            scores = np.asarray(matrix[start:start + SCAN_CHUNK_ROWS]) @ q
+            ids = np.arange(start, start + len(scores))
+            if allowed is not None:
+                keep = allowed[start:start + len(scores)]
+                ids, scores = ids[keep], scores[keep]
+            if len(ids) > k:
+                part = np.argpartition(-scores, k - 1)[:k]
+                ids, scores = ids[part], scores[part]
+            best_ids.append(ids)
+            best_scores.append(scores)
+        return np.concatenate(best_ids), np.concatenate(best_scores)
+
+    def _ivf_candidates(self, q: np.ndarray, count: int) -> Optional[np.ndarray]:
+        ivf = self._ivf
+        if ivf is None or count < self.ivf_min_rows or ivf["built_count"] > count:
+            return None
+        centroids = ivf["centroids"]
+        probes = np.argsort(-(centroids @ q))[:self.nprobe]
+        parts = [ivf["order"][ivf["bounds"][c]:ivf["bounds"][c + 1]] for c in probes]
+        # 建索引之后追加的向量尚未分簇，全部参与比较
+        parts.append(np.arange(ivf["built_count"], count))
+        return np.sort(np.concatenate(parts))
+
+    # ---------- 存储 ----------
+
+    def _code(self, mbti: Optional[str]) -> int:
+        mbti = (mbti or GENERAL_MBTI).upper()
+        if mbti not in self._mbti_codes:
+            self._mbti_codes[mbti] = len(self._mbti_codes)
+        return self._mbti_codes[mbti]
+
+    def _vectors(self):
+        if self.path is None:
+            return self._memory_vectors
+        if self._matrix is None:
+            if self._count == 0:
+                return np.zeros((0, self.dim), dtype=np.float32)
+            self._matrix = np.memmap(os.path.join(self.path, VECTORS_FILE), dtype=np.float32, mode="r",
+                                     shape=(self._count, self.dim))
+        return self._matrix
+
+    def get_document(self, i: int) -> Document:
+        if self.path is None:
+            text, meta = self._memory_docs[i]
+            return Document(page_content=text, metadata=dict(meta))
+        with open(os.path.join(self.path, DOCS_FILE), "rb") as f:
+            f.seek(self._offsets[i])
+            row = json.loads(f.readline())
+        return Document(page_content=row["text"], metadata=row["metadata"])
+
+    def iter_texts(self, start: int = 0) -> Iterator[Tuple[int, str]]:
+        """按行号顺序读取 start 之后的文档正文（顺序读文件，不逐条seek）"""
+        count = self._count
+        if self.path is None:
+            for i in range(start, count):
+                yield i, self._memory_docs[i][0]
+            return
+        if start >= count:
+            return
+        with open(os.path.join(self.path, DOCS_FILE), "rb") as f:
+            f.seek(self._offsets[start])
+            for i in range(start, count):
+                yield i, json.loads(f.readline())["text"]
+
+    def _open(self):
+        """加载已有索引：扫描 docs.jsonl 重建偏移量和类型编码，向量文件按内存映射读取"""
+        docs_path = os.path.join(self.path, DOCS_FILE)
+        codes = []
+        if os.path.exists(docs_path):
+            with open(docs_path, "rb") as f:
+                position = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self._offsets.append(position)
+                    codes.append(self._code(json.loads(line)["metadata"].get("mbti")))
+                    position += len(line)
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        stored = os.path.getsize(vectors_path) // (4 * self.dim) if os.path.exists(vectors_path) else 0
+        self._count = min(len(self._offsets), stored)
+        del self._offsets[self._count:]
+        self._codes = np.array(codes[:self._count], dtype=np.int16)
+        self._deleted = np.zeros(self._count, dtype=bool)
+        deleted_path = os.path.join(self.path, DELETED_FILE)
+        if os.path.exists(deleted_path):
+            deleted = np.fromfile(deleted_path, dtype=np.int64)
+            self._deleted[deleted[deleted < self._count]] = True
+        self._repair(docs_path, vectors_path)
+        ivf_path = os.path.join(self.path, IVF_FILE)
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as data:
+                ivf = {name: data[name] for name in data.files}
+            ivf["built_count"] = int(ivf["built_count"])
+            if ivf["built_count"] <= self._count and ivf["centroids"].shape[1] == self.dim:
+                self._ivf = ivf
+
+    def _repair(self, docs_path: str, vectors_path: str):
+        # 上次写入中断时截掉多出的部分，保证文档与向量一一对应
+        if os.path.exists(vectors_path) and os.path.getsize(vectors_path) != self._count * 4 * self.dim:
+            with open(vectors_path, "r+b") as f:
+                f.truncate(self._count * 4 * self.dim)
+        if os.path.exists(docs_path):
+            end = 0
+            if self._count:
+                with open(docs_path, "rb") as f:
+                    f.seek(self._offsets[-1])
+                    end = self._offsets[-1] + len(f.readline())
+            if os.path.getsize(docs_path) != end:
+                with open(docs_path, "r+b") as f:
+                    f.truncate(end)
@@ -0,0 +1,99 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+CJK_PATTERN = re.compile(r"[一-鿿　-〿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """服务商未返回用量时的估算：中文按每字1个token，其余按每4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """统计一次建议生成过程中的LLM调用次数和token用量（优先使用服务商返回的用量，缺失时估算）"""
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated = False
+        self._pending_prompt_tokens = 0
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self.llm_calls += 1
+        self._pending_prompt_tokens = sum(estimate_tokens(p) for p in prompts)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> None:
+        self.llm_calls += 1
+        self._pending_prompt_tokens = sum(estimate_tokens(str(m.content)) for batch in messages for m in batch)
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage.get("prompt_tokens") is not None:
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+            return
+        self.estimated = True
+        self.prompt_tokens += self._pending_prompt_tokens
+        self.completion_tokens += sum(estimate_tokens(g.text) for gens in response.generations for g in gens)
+
+
+class AdviceMetrics:
+    """按 MBTI类型 × 生成模式（fast/agent）汇总耗时、LLM调用次数和token用量，线程安全"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, dict]] = {}
+
+    def record(self, mbti_type: str, mode: str, latency: float, usage: Optional[UsageCallbackHandler] = None,
+               ok: bool = True):
+        with self._lock:
+            s = self._stats.setdefault(mbti_type, {}).setdefault(mode, {
+                "requests": 0, "errors": 0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "latency_total": 0.0, "latencies": []
+            })
+            s["requests"] += 1
+            s["errors"] += 0 if ok else 1
+            s["latency_total"] += latency
+            s["latencies"] = (s["latencies"] + [latency])[-self.window:]
+            if usage is not None:
+                s["llm_calls"] += usage.llm_calls
+                s["prompt_tokens"] += usage.prompt_tokens
+                s["completion_tokens"] += usage.completion_tokens
+
+    def snapshot(self) -> Dict[str, dict]:
+        """每个类型各模式的平均值；两种模式都有数据时给出快速模式相对Agent模式的降低比例"""
+        result = {}
+        with self._lock:
+            for mbti, modes in self._stats.items():
+                entry = {}
+                for mode, s in modes.items():
+                    n = s["requests"]
+                    latencies = sorted(s["latencies"])
+                    entry[mode] = {
+                        "requests": n,
+                        "errors": s["errors"],
+                        "avg_latency": round(s["latency_total"] / n, 3),
+                        "p95_latency": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+                        "avg_llm_calls": round(s["llm_calls"] / n, 2),
+                        "avg_tokens": round((s["prompt_tokens"] + s["completion_tokens"]) / n, 1),
+                    }
+                if "fast" in entry and "agent" in entry:
+                    fast, agent = entry["fast"], entry["agent"]
+                    entry["reduction"] = {
+                        "latency": round(1 - fast["avg_latency"] / agent["avg_latency"], 3) if agent["avg_latency"] else None,
+                        "tokens": round(1 - fast["avg_tokens"] / agent["avg_tokens"], 3) if agent["avg_tokens"] else None,
+                    }
+                result[mbti] = entry
+        return result
+
+
+# 进程内共享的建议生成指标
+advice_metrics = AdviceMetrics()
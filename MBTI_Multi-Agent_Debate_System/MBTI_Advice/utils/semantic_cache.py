@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .embeddings import HashingVectorizer
+
+# 命中阈值：规范化后问题向量的余弦相似度不低于该值才返回缓存的回答。
+# 在同义改写/否定/换主题的问题对（test/test_semantic_cache.py）上校准：同义改写规范化后多在0.88以上，
+# 只差一两个关键字的不同问题（考研/考公、失恋/失业）在0.8以下，否定问法另由否定词检查排除
+CACHE_THRESHOLD = float(os.environ.get("ADVICE_CACHE_THRESHOLD", 0.85))
+CACHE_TTL_SECONDS = float(os.environ.get("ADVICE_CACHE_TTL_SECONDS", 24 * 3600))
+# 每个MBTI类型最多缓存的问题数，超过后淘汰最久未命中的
+CACHE_MAX_ENTRIES = int(os.environ.get("ADVICE_CACHE_MAX_ENTRIES", 512))
+ADVICE_CACHE_ENABLED = os.environ.get("ADVICE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# 问题的关键片段在此前的对话中出现的比例不低于该值时，认为对话历史与问题相关
+HISTORY_OVERLAP = float(os.environ.get("ADVICE_HISTORY_OVERLAP", 0.5))
+
+# 问题规范化：统一常见同义说法，去掉提问框架（请问、帮我想想、要不要……）和语气词，只保留问题内容
+_SYNONYMS = [
+    (re.compile(r"今晚"), "今天晚上"),
+    (re.compile(r"明晚"), "明天晚上"),
+    (re.compile(r"怎么才能|如何才能|怎样才能|应该怎么|该怎么|要怎么|怎么样|如何|怎样|咋"), "怎么"),
+    (re.compile(r"哪里|哪儿"), "哪"),
+    (re.compile(r"之后|以后"), "后"),
+    (re.compile(r"跟|与"), "和"),
+    (re.compile(r"能够|可以"), "能"),
+]
+# 正反问（要不要、该不该、是不是……）只是提问方式，不是否定
+_A_NOT_A = re.compile(r"(.)不\1|应不应|可不可以")
+_FILLERS = re.compile(r"^(请问|请|帮我想想|帮我看看|帮我|我想知道|我想问问|我想问)|(比较好|好呢|好吗|呢|吗|啊|呀|吧)$"
+                      r"|应该|的|我|做到")
+_NEGATIONS = re.compile(r"[不没别无非未勿莫]")
+# 指代上文的说法：问题包含这些词时依赖对话历史
+_REFERENCES = re.compile(r"他|她|它|这|那|刚才|上面|前面|之前|上次|继续|还有|另外|其他|其它|具体|展开|为什么")
+
+
+def canonical_question(question: str) -> str:
+    text = HashingVectorizer.normalize(question)
+    for pattern, replacement in _SYNONYMS:
+        text = pattern.sub(replacement, text)
+    text = _A_NOT_A.sub("", text)
+    previous = None
+    while previous != text:
+        previous, text = text, _FILLERS.sub("", text)
+    return text
+
+
+def negations(canonical: str) -> str:
+    """问题中的否定词（排序后拼接），否定不一致的两个问题意思相反，不能互相命中"""
+    return "".join(sorted(_NEGATIONS.findall(canonical)))
+
+
+def depends_on_history(question: str, history: str, overlap: float = HISTORY_OVERLAP) -> bool:
+    """问题是否依赖对话历史：指代上文，或问题的大部分片段在用户此前的发言/对话摘要中出现过"""
+    if not history:
+        return False
+    if _REFERENCES.search(question):
+        return True
+    canonical = canonical_question(question)
+    grams = {canonical[i:i + 2] for i in range(len(canonical) - 1)}
+    if not grams:
+        return True
+    context = HashingVectorizer.normalize("".join(
+        line for line in history.splitlines() if line.startswith(("human:", "对话摘要:"))
+    ))
+    return sum(gram in context for gram in grams) / len(grams) >= overlap
+
+
+# 缓存使用的问题向量化器：规范化后的问题很短，字和双字片段比三字片段更稳定
+question_vectorizer = HashingVectorizer(ngram_range=(1, 2))
+
+
+class _TypeIndex:
+    """单个MBTI类型的缓存索引：向量矩阵按槽位存放，查询为一次矩阵乘法"""
+
+    def __init__(self, dim: int, capacity: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.created = np.zeros(capacity)
+        self.last_used = np.zeros(capacity)
+        self.questions = [None] * capacity
+        self.negations = [None] * capacity
+        self.answers = [None] * capacity
+        self.latencies = np.zeros(capacity)
+
+    def free_slot(self) -> int:
+        empty = np.flatnonzero(~self.valid)
+        if len(empty):
+            return int(empty[0])
+        return int(np.argmin(self.last_used))
+
+
+class SemanticAnswerCache:
+    """
+    建议的语义缓存：按MBTI类型分别建索引，规范化后的问题与已缓存问题足够相似、且否定词一致时直接返回缓存的回答。
+    缓存条目有TTL，每个类型容量有上限（LRU淘汰）。
+    依赖对话历史的个性化回答不应写入或读取缓存，由调用方判断（见 depends_on_history）。
+    """
+
+    def __init__(self, vectorizer: HashingVectorizer = question_vectorizer, threshold: float = CACHE_THRESHOLD,
+                 ttl_seconds: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES,
+                 enabled: bool = ADVICE_CACHE_ENABLED):
+        self.vectorizer = vectorizer
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._indexes: Dict[str, _TypeIndex] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.saved_seconds = 0.0
+
+    def lookup(self, mbti_type: str, question: str) -> Optional[Tuple[str, float]]:
+        """返回(缓存的回答, 相似度)，未命中返回None"""
+        if not self.enabled or not question:
+            return None
+        canonical = canonical_question(question)
+        vec = self.vectorizer.embed(canonical)
+        negation = negations(canonical)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            index = self._indexes.get(mbti_type)
+            if index is None:
+                return None
+            expired = index.valid & (now - index.created > self.ttl_seconds)
+            index.valid[expired] = False
+            if not index.valid.any():
+                return None
+            sims = index.vectors @ vec
+            sims[~index.valid] = -1.0
+            candidates = np.flatnonzero(sims >= self.threshold)
+            best = next((int(i) for i in candidates[np.argsort(-sims[candidates])]
+                         if index.negations[i] == negation), None)
+            if best is None:
+                return None
+            index.last_used[best] = now
+            self.hits += 1
+            self.saved_seconds += float(index.latencies[best])
+            return index.answers[best], float(sims[best])
+
+    def store(self, mbti_type: str, question: str, answer: str, latency: float = 0.0):
+        if not self.enabled or not question or not answer:
+            return
+        canonical = canonical_question(question)
+        vec = self.vectorizer.embed(canonical)
+        negation = negations(canonical)
+        now = time.time()
+        with self._lock:
+            index = self._indexes.get(mbti_type)
+            if index is None:
+                index = self._indexes[mbti_type] = _TypeIndex(self.vectorizer.dim, self.max_entries)
+            # 几乎相同（且否定词一致）的问题直接覆盖原条目
+            sims = index.vectors @ vec
+            sims[~index.valid] = -1.0
+            best = int(np.argmax(sims))
+            slot = best if sims[best] >= 0.99 and index.negations[best] == negation else index.free_slot()
+            index.vectors[slot] = vec
+            index.valid[slot] = True
+            index.created[slot] = now
+            index.last_used[slot] = now
+            index.questions[slot] = question
+            index.negations[slot] = negation
+            index.answers[slot] = answer
+            index.latencies[slot] = latency
+
+    def clear(self, mbti_type: Optional[str] = None):
+        with self._lock:
+            if mbti_type is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(mbti_type, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 2),
+                "entries": {mbti: int(index.valid.sum()) for mbti, index in self._indexes.items()},
+            }
+
+
+# 进程内共享的建议语义缓存
+advice_cache = SemanticAnswerCache()
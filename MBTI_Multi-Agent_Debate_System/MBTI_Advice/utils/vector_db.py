@@ -1,31 +1,54 @@
-from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.document_loaders import DirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import os
+import threading
+from typing import Dict, Optional
+
+from .hybrid_retriever import HybridRetriever
+from .ingest import KnowledgeIngestor
+from .local_index import LocalVectorIndex
 
 class MBTIVectorDB:
-    def __init__(self, db_path: str = "mbti_vector_db", use_embeddings: bool = True):
-        self.db_path = db_path
+    """本地向量数据库：基于内存映射的 LocalVectorIndex，不依赖外部Embedding服务，完全离线"""
+
+    def __init__(self, db_path: str = None, use_embeddings: bool = True):
+        self.db_path = db_path or os.environ.get("VECTOR_DB_PATH", "mbti_vector_db")
+        # 保留参数兼容旧调用；向量统一由本地哈希向量化器生成
         self.use_embeddings = use_embeddings
-        self.embeddings = None
         self.vectorstore = None
+        self.retriever = None
 
     def initialize_db(self, data_dir: str = None):
-        """初始化或加载向量数据库"""
-        if self.use_embeddings:
-            # 使用DeepSeek Embeddings (如果有) 或保留OpenAI作为备选
-            self.embeddings = OpenAIEmbeddings(
-                openai_api_key=os.environ.get("DEEPSEEK_API_KEY", "") or
-                               os.environ.get("OPENAI_API_KEY", "")
-            )
+        """初始化或加载向量数据库（首次创建时写入内置的MBTI资料），指定 data_dir 时增量导入其中的文本"""
+        self.vectorstore = LocalVectorIndex(self.db_path)
+        if len(self.vectorstore) == 0:
+            self.vectorstore.add_documents(MockVectorDB.seed_documents())
+        stats = KnowledgeIngestor(self.vectorstore).ingest(data_dir) if data_dir else None
+        self.vectorstore.maybe_build_ivf()
+        # 关键词倒排索引在初始化时补齐，查询时不再构建
+        self.retriever = HybridRetriever(self.vectorstore)
+        self.retriever.sync()
+        return stats
 
-    def get_relevant_info(self, query: str, k: int = 5):
-        """获取与查询相关的 MBTI 特质信息"""
+    def get_relevant_info(self, query: str, k: int = 5, mbti_type: Optional[str] = None):
+        """获取与查询相关的 MBTI 特质信息（指定 mbti_type 时只返回该类型和通用资料）"""
         if not self.vectorstore:
             self.initialize_db()
 
-        return self.vectorstore.similarity_search(query, k=k)
+        return self.retriever.get_relevant_info(query, k=k, mbti_type=mbti_type)
+
+
+_shared_dbs: Dict[str, MBTIVectorDB] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_vector_db(db_path: str) -> MBTIVectorDB:
+    """进程内共享的向量数据库（每个路径一个实例）：各类型的Agent共用同一份索引，只在首次取用时加载"""
+    with _shared_lock:
+        db = _shared_dbs.get(db_path)
+        if db is None:
+            db = MBTIVectorDB(db_path)
+            db.initialize_db()
+            _shared_dbs[db_path] = db
+        return db
 
 
 from langchain.docstore.document import Document
@@ -43,7 +66,7 @@ class MockVectorDB:
                              "- 具有战略思维，喜欢规划长远目标\n"
                              "- 独立性高，偏好自主决策的工作环境\n"
                              "- 适合技术、科研、工程、战略规划等领域",
-                metadata={"source": "mock_mbti_db"}
+                metadata={"source": "mock_mbti_db", "mbti": "INTJ"}
             )
         ],
         "INTJ职业优势与核心需求": [
@@ -56,19 +79,36 @@ class MockVectorDB:
                              "- 挑战性和智力刺激\n"
                              "- 自主性和控制权\n"
                              "- 明确的目标和清晰的反馈",
-                metadata={"source": "mock_mbti_db"}
+                metadata={"source": "mock_mbti_db", "mbti": "INTJ"}
             )
         ],
         # 其他预定义信息...
     }
 
+    # 检索结果的相似度低于该值时视为未命中，返回通用建议
+    MIN_SCORE = 0.1
+    _retriever = None
+
+    @classmethod
+    def seed_documents(cls):
+        return [doc for docs in cls.MBTI_INFO.values() for doc in docs]
+
+    @classmethod
+    def _get_retriever(cls) -> HybridRetriever:
+        # 内置资料很少，所有实例共享一个内存索引
+        if cls._retriever is None:
+            index = LocalVectorIndex()
+            index.add_documents(cls.seed_documents())
+            cls._retriever = HybridRetriever(index, min_similarity=cls.MIN_SCORE)
+        return cls._retriever
+
     def initialize_db(self, data_dir: str = None):
         print("使用模拟向量数据库，不执行实际操作")
 
-    def get_relevant_info(self, query: str, k: int = 5):
-        """返回预定义的MBTI信息"""
-        # 简单匹配查询，返回预定义内容
-        return self.MBTI_INFO.get(query, [
+    def get_relevant_info(self, query: str, k: int = 5, mbti_type: Optional[str] = None):
+        """在预定义的MBTI信息中检索，没有相关内容时返回通用建议"""
+        results = self._get_retriever().get_relevant_info(query, k=k, mbti_type=mbti_type)
+        return results or [
             Document(
                 page_content=f"关于'{query}'的通用MBTI建议：\n"
                              "1. 了解自己的性格优势和劣势\n"
@@ -77,4 +117,4 @@ class MockVectorDB:
                              "4. 与不同性格类型的人合作时保持开放心态",
                 metadata={"source": "mock_mbti_db"}
             )
-        ])
\ No newline at end of file
+        ]
@@ -1,27 +1,87 @@
 import json
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from ..core.common import Speech, DebateInfo
+from ..core.stream_json import IncrementalJSONParser
+from ..core.micro_batcher import MicroBatcher
+from common.singleflight import coalesced_call, coalesced_astream
 from langchain.chat_models import ChatOpenAI
 from langchain.schema import HumanMessage
 from dotenv import load_dotenv
 import re
+import asyncio
+import hashlib
+import weakref
 
 load_dotenv()
 
+# 微批处理共享的评委模型和批处理器：同一事件循环内同参数的评委共用一个 ChatOpenAI（即一个连接池）；
+# 两者都按事件循环隔离，连接不会被另一个事件循环复用
+_SHARED_LLMS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, ChatOpenAI]]" = weakref.WeakKeyDictionary()
+_BATCHERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, MicroBatcher]]" = weakref.WeakKeyDictionary()
+
+
+def _build_llm(params: Tuple) -> ChatOpenAI:
+    model_name, temperature, base_url, api_key, max_tokens = params
+    # 直接用langchain的ChatOpenAI对接deepseek
+    return ChatOpenAI(
+        model_name=model_name,
+        temperature=temperature,
+        base_url=base_url,
+        api_key=api_key,
+        max_tokens=max_tokens
+    )
+
+
+def _shared_llm(params: Tuple) -> ChatOpenAI:
+    """当前事件循环共享的评委模型；不在事件循环中时（如只读取模型参数）返回新的实例"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _build_llm(params)
+    llms = _SHARED_LLMS.setdefault(loop, {})
+    if params not in llms:
+        llms[params] = _build_llm(params)
+    return llms[params]
+
+
 class JudgeAgent:
-    def __init__(self, name: str, dimensions: List[str], prompt_template: str):
+    def __init__(self, name: str, dimensions: List[str], prompt_template: str,
+                 score_first: bool = False, comment_max_chars: Optional[int] = None,
+                 micro_batch: bool = False,
+                 batch_max_size: int = int(os.environ.get("JUDGE_BATCH_MAX_SIZE", 16)),
+                 batch_max_wait_ms: float = float(os.environ.get("JUDGE_BATCH_MAX_WAIT_MS", 5)),
+                 score_cache=None, rate_limiter=None, fallback_scorer=None):
         self.name = name
         self.dimensions = dimensions  # 只负责一个维度
         self.prompt_template = prompt_template
-        # 直接用langchain的ChatOpenAI对接deepseek
-        self.llm = ChatOpenAI(
-            model_name="deepseek-chat",
-            temperature=0.3,
-            base_url=os.environ["DEEPSEEK_BASE_URL"],
-            api_key=os.environ["DEEPSEEK_API_KEY"],
-            max_tokens=1000
-        )
+        # score-first 模式：prompt 要求先输出 score 再输出 comment，
+        # 流式接收时解析到 score（以及可选的评语长度上限）后即取消调用
+        self.score_first = score_first
+        self.comment_max_chars = comment_max_chars
+        # 微批处理：call_deepseek_llm 先进入批处理器，凑批后在共享连接池上并发派发；
+        # score-first 的 stream_score 是逐条流式调用，不经过批处理器
+        self.micro_batch = micro_batch
+        self.batch_max_size = batch_max_size
+        self.batch_max_wait_ms = batch_max_wait_ms
+        # 评分缓存：以完整prompt的哈希为键（prompt不变即可复用），需提供 get(key) / set(key, score)
+        self.score_cache = score_cache
+        # 限流器：批量任务时遵守服务商的速率限制
+        self.rate_limiter = rate_limiter
+        # 兜底评分器（如 HeuristicScorer）：评委调用或解析失败时用本地启发式分数代替固定的5.0
+        self.fallback_scorer = fallback_scorer
+        llm_params = ("deepseek-chat", 0.3, os.environ["DEEPSEEK_BASE_URL"], os.environ["DEEPSEEK_API_KEY"], 1000)
+        self._llm_key = llm_params
+        # 微批处理时不持有自己的模型，每次取用当前事件循环共享的实例
+        self._llm = None if micro_batch else _build_llm(llm_params)
+
+    @property
+    def llm(self) -> ChatOpenAI:
+        return self._llm if self._llm is not None else _shared_llm(self._llm_key)
+
+    @llm.setter
+    def llm(self, value):
+        self._llm = value
 
     def _extract_json(self, text: str) -> str:
         # 先去除 markdown 代码块标记
@@ -33,6 +93,15 @@ class JudgeAgent:
             return text
         except Exception:
             pass
+        # 尝试截取最外层的 {...}（支持嵌套对象）
+        start, end = text.find("{"), text.rfind("}")
+        if 0 <= start < end:
+            candidate = text[start:end + 1]
+            try:
+                json.loads(candidate)
+                return candidate
+            except Exception:
+                pass
         # 尝试用正则提取第一个合法JSON对象
         match = re.search(r'\{[\s\S]*?\}', text)
         if match:
@@ -48,38 +117,159 @@ class JudgeAgent:
     async def score_speech(self, speech: Speech, debate_info: DebateInfo) -> Dict[str, float]:
         scores = {}
         for dim in self.dimensions:
-            prompt = self.prompt_template.format(
-                motion=getattr(debate_info, 'motion', ''),  
-                stage=speech.stage,
-                debater=speech.debater,
-                mbti_type=getattr(speech, 'mbti_type', '未知'),
-                dimension=dim,
-                content=speech.content
-            )
-            try:
-                text = await self.call_deepseek_llm(prompt)
-                clean_text = self._extract_json(text)
-                try:
-                    score_json = json.loads(clean_text)
-                    if not isinstance(score_json, dict):
-                        raise ValueError("Response is not a JSON object")
-                    scores[dim] = float(score_json.get("score", 5.0))
-                except (json.JSONDecodeError, ValueError) as e:
-                    print(f"JSON解析失败: {e}, 原始响应: {text}")
-                    scores[dim] = 5.0
-            except Exception as e:
-                print(f"API调用失败: {e}")
-                scores[dim] = 5.0
+            key = self.cache_key(self.build_prompt(speech, debate_info, dim)) if self.score_cache is not None else None
+            score = await self._cached_score(key) if key else None
+            if score is None:
+                score = await self.sample_score(speech, debate_info, dim)
+                if key and score is not None:
+                    self.score_cache.set(key, score)
+            if score is None and self.fallback_scorer is not None:
+                score = self.fallback_score(speech, debate_info, dim)
+            scores[dim] = score if score is not None else 5.0
         return scores
 
-    async def call_deepseek_llm(self, prompt: str) -> str:
-        import asyncio
-        loop = asyncio.get_event_loop()
-        # 支持同步和异步llm.invoke
-        if hasattr(self.llm, 'ainvoke'):
-            result = await self.llm.ainvoke(prompt)
-        else:
-            result = await loop.run_in_executor(None, lambda: self.llm.invoke(prompt))
+    async def _cached_score(self, key: str) -> Optional[float]:
+        # 缓存提供 aget 时异步读取（数据库缓存的查询不阻塞事件循环）
+        aget = getattr(self.score_cache, "aget", None)
+        return await aget(key) if aget is not None else self.score_cache.get(key)
+
+    def fallback_score(self, speech: Speech, debate_info: DebateInfo, dim: str) -> Optional[float]:
+        # 兜底分数不写入缓存，评委恢复后会重新评分
+        try:
+            side = str(speech.debater)[:3]
+            opponents = [s.content for s in getattr(debate_info, 'speeches', None) or []
+                         if str(s.debater)[:3] != side and s.content]
+            features = self.fallback_scorer.features(speech.content, speech.stage,
+                                                     getattr(speech, 'mbti_type', None), opponents)
+            return self.fallback_scorer.score_dimension(dim, features)
+        except Exception as e:
+            print(f"兜底评分失败: {e}")
+            return None
+
+    def cache_key(self, prompt: str) -> str:
+        model = (getattr(self.llm, 'model_name', ''), getattr(self.llm, 'temperature', ''))
+        return hashlib.sha256(f"{model}|{prompt}".encode("utf-8")).hexdigest()
+
+    def build_prompt(self, speech: Speech, debate_info: DebateInfo, dim: str) -> str:
+        return self.prompt_template.format(
+            motion=getattr(debate_info, 'motion', ''),
+            stage=speech.stage,
+            debater=speech.debater,
+            mbti_type=getattr(speech, 'mbti_type', '未知'),
+            dimension=dim,
+            content=speech.content
+        )
+
+    async def sample_score(self, speech: Speech, debate_info: DebateInfo, dim: str,
+                           independent: bool = False) -> Optional[float]:
+        """对单个维度采样一次评分，调用或解析失败时返回None（由调用方决定兜底策略）。
+        independent=True 时不与相同prompt的在途请求合并（集成评分的多次采样必须各自调用）"""
+        prompt = self.build_prompt(speech, debate_info, dim)
+        try:
+            if self.score_first:
+                score, _ = await self.stream_score(prompt, coalesce=not independent)
+                return score
+            text = await self.call_deepseek_llm(prompt, coalesce=not independent)
+            clean_text = self._extract_json(text)
+            try:
+                score_json = json.loads(clean_text)
+                if not isinstance(score_json, dict):
+                    raise ValueError("Response is not a JSON object")
+                if "score" not in score_json:
+                    raise ValueError("Response has no score")
+                return float(score_json["score"])
+            except (json.JSONDecodeError, ValueError, TypeError) as e:
+                print(f"JSON解析失败: {e}, 原始响应: {text}")
+                return None
+        except Exception as e:
+            print(f"API调用失败: {e}")
+            return None
+
+    def _get_batcher(self) -> MicroBatcher:
+        loop = asyncio.get_running_loop()
+        batchers = _BATCHERS.setdefault(loop, {})
+        key = (self._llm_key, self.batch_max_size, self.batch_max_wait_ms)
+        if key not in batchers:
+            llm = self.llm
+            max_concurrency = self.batch_max_size
+
+            async def dispatch(prompts: List[str]):
+                # 一批请求在同一个客户端连接池上多路并发，按完成顺序返回；单条失败只影响对应的 future
+                async for index, result in llm.abatch_as_completed(
+                        prompts, config={"max_concurrency": max_concurrency}, return_exceptions=True):
+                    yield index, result
+
+            batchers[key] = MicroBatcher(dispatch, self.batch_max_size, self.batch_max_wait_ms)
+        return batchers[key]
+
+    async def _acquire(self):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+
+    async def call_deepseek_llm(self, prompt: str, coalesce: bool = True) -> str:
+        # 相同prompt的并发调用（如多场热门辩题同时评分）合并为一次上游请求；
+        # 限流令牌在实际发起请求时才获取，被合并的调用不占用令牌
+        max_temperature = None if coalesce else -1
+
+        async def call():
+            await self._acquire()
+            if self.micro_batch:
+                return await self._get_batcher().submit(prompt)
+            # 支持同步和异步llm.invoke
+            if hasattr(self.llm, 'ainvoke'):
+                return await self.llm.ainvoke(prompt)
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, lambda: self.llm.invoke(prompt))
+
+        result = await coalesced_call(self.llm, prompt, call, max_temperature)
         if hasattr(result, 'content'):
             return result.content
-        return str(result)
\ No newline at end of file
+        return str(result)
+
+    async def _limited_astream(self, prompt: str):
+        await self._acquire()
+        stream = self.llm.astream(prompt)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def stream_score(self, prompt: str, coalesce: bool = True) -> Tuple[Optional[float], str]:
+        """流式调用评委，增量解析JSON，拿到score后提前终止，返回(score, 已收到的评语)。
+        流式请求需要逐条读取并提前取消，因此不进入微批处理器（仍会与相同的在途请求合并）"""
+        parser = IncrementalJSONParser()
+        received = []
+        stream = coalesced_astream(self.llm, prompt, max_temperature=None if coalesce else -1,
+                                   factory=lambda: self._limited_astream(prompt))
+        try:
+            async for chunk in stream:
+                text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                received.append(text)
+                parser.feed(text)
+                if "score" not in parser.fields:
+                    continue
+                comment = parser.partial_value("comment")
+                if self.comment_max_chars is None or "comment" in parser.fields \
+                        or len(comment) >= self.comment_max_chars:
+                    break
+        finally:
+            # 关闭生成器即取消底层HTTP流（合并的请求在所有调用方都关闭后取消），不再为剩余的评语付费
+            await stream.aclose()
+        score = parser.fields.get("score")
+        if score is None:
+            # 未按 score-first 格式返回时，退回整段解析
+            full_text = "".join(received)
+            try:
+                score = json.loads(self._extract_json(full_text)).get("score")
+            except (json.JSONDecodeError, ValueError, AttributeError) as e:
+                print(f"JSON解析失败: {e}, 原始响应: {full_text}")
+                return None, ""
+        comment = parser.partial_value("comment")
+        if self.comment_max_chars is not None:
+            comment = comment[:self.comment_max_chars]
+        try:
+            return float(score), comment
+        except (TypeError, ValueError):
+            print(f"评分格式错误: {score}")
+            return None, comment
@@ -8,6 +8,15 @@ class DebateStage(Enum):
     FREE_DEBATE = "自由辩论"
     SUMMARY = "总结"
 
+@dataclass
+class EnsembleConfig:
+    """多评委采样（集成评分）配置：先少量采样，分歧大或排名接近时再追加"""
+    min_samples: int = 2                  # 每个维度的初始采样次数
+    max_samples: int = 5                  # 每个维度的最大采样次数
+    disagreement_threshold: float = 0.75  # 样本标准差超过该值视为评委分歧，需要追加采样
+    rank_margin: float = 0.5              # 相邻名次总分差小于该值视为排名接近，需要追加采样
+    call_budget: int = 400                # 每场辩论允许的评委调用总数
+
 @dataclass
 class DebateConfig:
     motion: str
@@ -45,4 +54,40 @@ class DebateConfig:
 ```json
 {{"score": 7.5, "comment": "观点明确但论证可以更深入，发言中的“xx"内容论证有力，有力证明了论点。}}
 
-""" 
\ No newline at end of file
+"""
+    # score-first 模式：要求先输出score再输出comment，便于流式解析到分数后提前终止
+    score_first_prompt_template = prompt_template + """
+注意：JSON中必须先输出score字段，再输出comment字段，不要在score之前输出任何其他字段。
+"""
+
+    # 比较评分模式：同一环节的多条发言放在一次请求中横向比较打分
+    comparative_prompt_template = """
+你是一名专业的辩论评委，请对同一辩论环节中的以下多条发言进行横向比较评分。
+
+辩题: {motion}
+辩论阶段: {stage}
+评分维度: {dimensions}
+
+{speeches}
+
+请把这些发言放在一起比较，严格区分不同辩手在每个维度的表现，根据实际表现拉开分数，同一维度最高分和最低分至少相差1分。
+请只返回JSON，键为发言编号，值为该发言在每个维度上的分数（0-10分，保留两位小数），格式如下:
+{example}
+"""
+    # 两两比较模式：大环节用归并排序，只需判断两条发言在各维度上谁更好
+    pairwise_prompt_template = """
+你是一名专业的辩论评委，请比较以下两条辩论发言在各评分维度上的表现。
+
+辩题: {motion}
+辩论阶段: {stage}
+评分维度: {dimensions}
+
+发言A（辩手: {debater_a}，MBTI类型: {mbti_a}）:
+{content_a}
+
+发言B（辩手: {debater_b}，MBTI类型: {mbti_b}）:
+{content_b}
+
+请只返回JSON，键为评分维度，值为该维度上表现更好的一方（"A"或"B"），格式如下:
+{example}
+"""
\ No newline at end of file
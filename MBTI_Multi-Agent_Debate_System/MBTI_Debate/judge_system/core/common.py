@@ -14,6 +14,7 @@ class Speech:
     debater: str
     stage: str
     content: str
+    mbti_type: Optional[str] = None
     #timestamp: str
 
 @dataclass
@@ -48,6 +49,9 @@ class SingleScore(BaseModel):
     dimension: str
     score: float
     comment: Optional[str] = ""
+    # 多次采样（集成评分）时的样本方差与有效样本数；单次评分时方差为空
+    variance: Optional[float] = None
+    samples: int = 1
 
 # 单条发言的所有维度评分
 class SpeechScoreResult(BaseModel):
@@ -58,6 +62,7 @@ class SpeechScoreResult(BaseModel):
     dimension_scores: List[SingleScore]
     total_score: float
     average_score: float
+    stage_rank: Optional[int] = None  # 比较评分模式下该发言在本环节内的名次
 
 # 辩手最终得分
 class DebaterFinalScore(BaseModel):
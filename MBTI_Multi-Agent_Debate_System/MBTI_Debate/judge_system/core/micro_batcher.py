@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """跨请求微批处理：收集 max_wait_ms 内到达的请求，凑满 max_batch_size 或超时后统一派发。
+
+    dispatch 接收一批输入，按完成顺序逐个产出 (输入下标, 结果)（结果可以是异常），
+    每条结果到达时立即交给对应调用方的 future，不等待同批中较慢的请求。
+    """
+
+    def __init__(self, dispatch: Callable[[List[Any]], AsyncIterator[Tuple[int, Any]]],
+                 max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.dispatch = dispatch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches_sent = 0
+        self.items_sent = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            # 调用方已取消的请求不再派发
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if batch:
+                loop.create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        self.batches_sent += 1
+        self.items_sent += len(batch)
+        try:
+            async for index, result in self.dispatch([item for item, _ in batch]):
+                future = batch[index][1]
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(RuntimeError("批处理未返回全部请求的结果"))
@@ -0,0 +1,158 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# 解析器状态
+_SEEK_OBJECT = 0    # 跳过 ```json 等前缀，寻找第一个 {
+_EXPECT_KEY = 1     # 等待字段名（或 } 结束）
+_IN_KEY = 2         # 正在读取字段名
+_EXPECT_COLON = 3   # 等待冒号
+_EXPECT_VALUE = 4   # 等待字段值
+_IN_STRING = 5      # 正在读取字符串值
+_IN_SCALAR = 6      # 正在读取数字 / true / false / null
+_IN_NESTED = 7      # 正在读取嵌套的对象或数组（原样缓存，结束后整体解析）
+_AFTER_VALUE = 8    # 等待逗号或 }
+_DONE = 9
+
+
+class IncrementalJSONParser:
+    """流式增量解析评委返回的顶层JSON对象。
+
+    每次 feed 一段增量文本，字段值一旦完整即可从 fields 中读取；
+    正在接收中的字符串字段可通过 partial_value 读取已到达的部分，
+    便于在拿到 score 后（或评语达到长度上限后）提前终止流式调用。
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.current_key: Optional[str] = None
+        self._state = _SEEK_OBJECT
+        self._buf: List[str] = []
+        self._escape = False
+        self._in_nested_string = False
+        self._depth = 0
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """输入一段增量文本，返回本次新完成的字段"""
+        completed = {}
+        for ch in chunk:
+            if self._state == _DONE:
+                break
+            self._step(ch, completed)
+        return completed
+
+    def partial_value(self, key: str) -> str:
+        """返回字段当前已接收到的字符串内容（字段已完成时返回完整值）"""
+        if key in self.fields:
+            value = self.fields[key]
+            return value if isinstance(value, str) else str(value)
+        if key == self.current_key and self._state == _IN_STRING:
+            return _decode_partial_string("".join(self._buf))
+        return ""
+
+    def _finish_value(self, raw: str, completed: Dict[str, Any]):
+        try:
+            value = json.loads(raw, strict=False)
+        except (json.JSONDecodeError, ValueError):
+            value = raw
+        self.fields[self.current_key] = value
+        completed[self.current_key] = value
+        self.current_key = None
+        self._buf = []
+        self._state = _AFTER_VALUE
+
+    def _step(self, ch: str, completed: Dict[str, Any]):
+        state = self._state
+        if state == _SEEK_OBJECT:
+            if ch == "{":
+                self._state = _EXPECT_KEY
+        elif state == _EXPECT_KEY:
+            if ch == '"':
+                self._buf = []
+                self._state = _IN_KEY
+            elif ch == "}":
+                self._state = _DONE
+        elif state == _IN_KEY:
+            if self._escape:
+                self._buf.append(ch)
+                self._escape = False
+            elif ch == "\\":
+                self._buf.append(ch)
+                self._escape = True
+            elif ch == '"':
+                self.current_key = _decode_partial_string("".join(self._buf))
+                self._buf = []
+                self._state = _EXPECT_COLON
+            else:
+                self._buf.append(ch)
+        elif state == _EXPECT_COLON:
+            if ch == ":":
+                self._state = _EXPECT_VALUE
+        elif state == _EXPECT_VALUE:
+            if ch.isspace():
+                return
+            self._buf = [ch]
+            if ch == '"':
+                self._buf = []
+                self._state = _IN_STRING
+            elif ch in "{[":
+                self._depth = 1
+                self._state = _IN_NESTED
+            else:
+                self._state = _IN_SCALAR
+        elif state == _IN_STRING:
+            if self._escape:
+                self._buf.append(ch)
+                self._escape = False
+            elif ch == "\\":
+                self._buf.append(ch)
+                self._escape = True
+            elif ch == '"':
+                self._finish_value('"' + "".join(self._buf) + '"', completed)
+            else:
+                self._buf.append(ch)
+        elif state == _IN_SCALAR:
+            if ch in ",}" or ch.isspace():
+                self._finish_value("".join(self._buf), completed)
+                if ch == ",":
+                    self._state = _EXPECT_KEY
+                elif ch == "}":
+                    self._state = _DONE
+            else:
+                self._buf.append(ch)
+        elif state == _IN_NESTED:
+            self._buf.append(ch)
+            if self._in_nested_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_nested_string = False
+            elif ch == '"':
+                self._in_nested_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value("".join(self._buf), completed)
+        elif state == _AFTER_VALUE:
+            if ch == ",":
+                self._state = _EXPECT_KEY
+            elif ch == "}":
+                self._state = _DONE
+
+
+def _decode_partial_string(raw: str) -> str:
+    """解码可能被截断的JSON字符串内容（去掉末尾不完整的转义序列）"""
+    for cut in range(0, 6):
+        candidate = raw[:len(raw) - cut] if cut else raw
+        try:
+            return json.loads('"' + candidate + '"', strict=False)
+        except (json.JSONDecodeError, ValueError):
+            continue
+    return raw
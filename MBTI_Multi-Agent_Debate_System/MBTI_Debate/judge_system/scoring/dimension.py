@@ -1,12 +1,21 @@
 import asyncio
-from typing import List, Dict
+import json
+import os
+from typing import List, Dict, Tuple
 from ..core.common import SpeechScoreResult, DebaterFinalScore, DebateScoreReport
 from ..agents.judge_agent import JudgeAgent
+
+# 批量评语每次请求包含的辩手数：评委的 max_tokens=1000，中文评语每段约两三百token，一次最多容纳三段左右
+COMMENT_BATCH_SIZE = int(os.environ.get("COMMENT_BATCH_SIZE", 3))
 #负责将多个评委对辩手的评分结果进行汇总、加权计算和排名，最终生成辩手的综合评分报告
 class ScoreAggregator:
-    def __init__(self, dimensions: List[str], weights: Dict[str, float]):
+    def __init__(self, dimensions: List[str], weights: Dict[str, float], batch_comments: bool = False,
+                 comment_batch_size: int = COMMENT_BATCH_SIZE):
         self.dimensions = dimensions
         self.weights = weights
+        # 批量模式：每次请求生成一组辩手的综合评语（各组并发），缺失的再逐个补调
+        self.batch_comments = batch_comments
+        self.comment_batch_size = max(1, comment_batch_size)
 
     async def gen_overall_comment_llm(self, dimension_averages: Dict[str, float], debater_name: str, mbti_type: str, judge_agent: JudgeAgent) -> str:
         prompt = f"请根据以下各项评分为{debater_name}（MBTI类型：{mbti_type}）生成一段简洁、专业的中文综合评语：\n"
@@ -16,7 +25,44 @@ class ScoreAggregator:
         comment = await judge_agent.call_deepseek_llm(prompt)
         return comment.strip()
 
-    async def aggregate_speech_scores_async(self, speech_score_results: List[SpeechScoreResult], judge_agent: JudgeAgent) -> Dict[str, DebaterFinalScore]:
+    async def gen_overall_comments_batch_llm(self, debaters: Dict[str, Tuple[Dict[str, float], str]], judge_agent: JudgeAgent) -> Dict[str, str]:
+        """按 comment_batch_size 分组并发请求，为所有辩手生成综合评语，返回 辩手->评语；解析失败或缺失的辩手不在结果中"""
+        names = list(debaters)
+        groups = [names[i:i + self.comment_batch_size] for i in range(0, len(names), self.comment_batch_size)]
+        comments = {}
+        for part in await asyncio.gather(*[
+            self._gen_comments_group({name: debaters[name] for name in group}, judge_agent) for group in groups
+        ]):
+            comments.update(part)
+        return comments
+
+    async def _gen_comments_group(self, debaters: Dict[str, Tuple[Dict[str, float], str]], judge_agent: JudgeAgent) -> Dict[str, str]:
+        # 组内辩手的评语放在一个JSON中返回，整组输出需在评委的 max_tokens 之内，否则JSON被截断、整组解析失败
+        prompt = "请根据以下各位辩手的各项评分，分别为每位辩手生成一段简洁、专业的中文综合评语：\n"
+        for name, (dimension_averages, mbti_type) in debaters.items():
+            prompt += f"\n辩手 {name}（MBTI类型：{mbti_type}）\n"
+            for dim, score in dimension_averages.items():
+                prompt += f"{dim}: {score:.2f}\n"
+        prompt += "\n要求：突出优点，指出不足，整体评价自然流畅，每段评语不超过150字。\n"
+        prompt += "请只返回一个JSON对象，键为辩手名称，值为该辩手的综合评语，格式如下:\n"
+        prompt += json.dumps({name: "综合评语" for name in debaters}, ensure_ascii=False)
+        try:
+            text = await judge_agent.call_deepseek_llm(prompt)
+            result = json.loads(judge_agent._extract_json(text))
+            if not isinstance(result, dict):
+                raise ValueError("Response is not a JSON object")
+        except Exception as e:
+            print(f"批量综合评语生成失败: {e}")
+            return {}
+        comments = {}
+        for name, comment in result.items():
+            key = str(name).strip().lower()
+            if key in debaters and isinstance(comment, str) and comment.strip():
+                comments[key] = comment.strip()
+        return comments
+
+    async def aggregate_speech_scores_async(self, speech_score_results: List[SpeechScoreResult], judge_agent: JudgeAgent,
+                                            with_comments: bool = True) -> Dict[str, DebaterFinalScore]:
         debater_scores = {}
         mbti_map = {}
         for speech_score in speech_score_results:
@@ -29,12 +75,10 @@ class ScoreAggregator:
         #print("聚合分组key：", list(debater_scores.keys()), flush=True)
         #测试是否分组成功，避免评分遗漏
         final_scores = {}
-        tasks = []
         for name, dim_scores in debater_scores.items():
             dimension_averages = {dim: (sum(scores)/len(scores) if scores else 0) for dim, scores in dim_scores.items()}
             total_score = sum(dimension_averages[dim] * self.weights.get(dim, 1.0) for dim in self.dimensions)
             mbti_type = mbti_map.get(name, '未知')
-            tasks.append(self.gen_overall_comment_llm(dimension_averages, name, mbti_type, judge_agent))
             final_scores[name] = {
                 'debater_name': name,
                 'mbti_type': mbti_type,
@@ -42,9 +86,21 @@ class ScoreAggregator:
                 'total_score': total_score,  # 修正字段名
                 'rank': 0,  # 排名后再赋值
             }
-        comments = await asyncio.gather(*tasks)
-        for i, name in enumerate(final_scores):
-            final_scores[name]['overall_comment'] = comments[i]
+        comments = {}
+        if not with_comments:
+            # 只需要分数（评级、批量重算等）时不调用LLM生成评语
+            comments = {name: "" for name in final_scores}
+        elif self.batch_comments and final_scores:
+            comments = await self.gen_overall_comments_batch_llm(
+                {name: (d['dimension_averages'], d['mbti_type']) for name, d in final_scores.items()}, judge_agent)
+        # 非批量模式或批量结果缺失的辩手，逐个生成
+        missing = [name for name in final_scores if name not in comments]
+        tasks = [self.gen_overall_comment_llm(final_scores[name]['dimension_averages'], name,
+                                              final_scores[name]['mbti_type'], judge_agent) for name in missing]
+        for name, comment in zip(missing, await asyncio.gather(*tasks)):
+            comments[name] = comment
+        for name in final_scores:
+            final_scores[name]['overall_comment'] = comments[name]
         sorted_scores = sorted(final_scores.values(), key=lambda x: x['total_score'], reverse=True)
         for i, debater in enumerate(sorted_scores):
             debater['rank'] = i + 1
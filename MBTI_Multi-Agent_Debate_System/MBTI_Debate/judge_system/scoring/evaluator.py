@@ -1,23 +1,338 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from ..agents.judge_agent import JudgeAgent
+from ..config.dabate_config import DebateConfig, EnsembleConfig
 from ..core.common import Speech, DebateInfo, DifySpeechInput, SingleScore, SpeechScoreResult, DebateStage, FreeDebateSummaryInput
 from ..scoring.dimension import ScoreAggregator
 import asyncio
+import json
+import math
+import statistics
 #负责协调多个 JudgeAgent 对辩论发言进行评分，并根据指定的维度和权重进行聚合计算
 class Evaluator:
-    def __init__(self, judge_agents: List[JudgeAgent], dimensions: List[str], weights: Dict[str, float]):
+    def __init__(self, judge_agents: List[JudgeAgent], dimensions: List[str], weights: Dict[str, float],
+                 ensemble: Optional[EnsembleConfig] = None,
+                 comparative: bool = False, comparative_group_size: int = 4,
+                 mbti_map: Optional[Dict[str, str]] = None, motion: str = "",
+                 comparative_call_budget: int = 400):
         self.judge_agents = judge_agents
         self.dimensions = dimensions
         self.weights = weights
         self.score_aggregator = ScoreAggregator(dimensions, weights)
+        # 集成评分模式：为空时保持每个维度单次评分
+        self.ensemble = ensemble
+        self.calls_used = 0  # 本场辩论已消耗的评委调用次数
+        # 比较评分模式：不超过 comparative_group_size 条的环节一次请求横向打分，
+        # 更大的环节用两两比较的归并排序排名，再以首尾两条发言的独立评分校准分数
+        self.comparative = comparative
+        self.comparative_group_size = comparative_group_size
+        # 比较评分每场辩论允许的评委调用总数（同时启用集成评分时以 ensemble.call_budget 为准）
+        self.comparative_call_budget = comparative_call_budget
+        # 辩手->MBTI，发言本身没有带MBTI时使用（DebateConfig.mbti_map）
+        self.mbti_map = mbti_map or {}
+        self.motion = motion
 
-    async def evaluate_single_speech(self, speech_input: DifySpeechInput) -> SpeechScoreResult:
-        speech = Speech(
-            debater=speech_input.debater_name,
-            stage=speech_input.stage,
-            content=speech_input.content
+    def _to_speech(self, s: DifySpeechInput, content: Optional[str] = None) -> Speech:
+        mbti_type = s.mbti_type if s.mbti_type and s.mbti_type != "未知" else self.mbti_map.get(s.debater_name)
+        return Speech(debater=s.debater_name, stage=s.stage, content=s.content if content is None else content,
+                      mbti_type=mbti_type)
+
+    def _debate_info(self, speeches: List[DifySpeechInput]) -> DebateInfo:
+        """评委评分的上下文：同一环节的全部发言（兜底评分据此计算对对方论点的回应程度）"""
+        return DebateInfo(self.motion, [], [], [self._to_speech(s) for s in speeches])
+
+    def remaining_budget(self) -> int:
+        if self.ensemble:
+            budget = self.ensemble.call_budget
+        elif self.comparative:
+            budget = self.comparative_call_budget
+        else:
+            return 0
+        return max(budget - self.calls_used, 0)
+
+    async def _sample(self, judge: JudgeAgent, speech: Speech, dim: str, n: int,
+                      debate_info: DebateInfo) -> List[float]:
+        """在预算内对某维度追加n次采样，返回成功的分数"""
+        n = min(n, self.remaining_budget())
+        if n <= 0:
+            return []
+        self.calls_used += n
+        # 多次采样必须各自调用上游，不能与相同prompt的在途请求合并，否则方差恒为0
+        results = await asyncio.gather(*[judge.sample_score(speech, debate_info, dim, independent=True)
+                                         for _ in range(n)])
+        return [r for r in results if r is not None]
+
+    def _needs_more(self, samples: List[float]) -> bool:
+        if len(samples) >= self.ensemble.max_samples:
+            return False
+        if len(samples) < self.ensemble.min_samples:
+            return True
+        return statistics.stdev(samples) > self.ensemble.disagreement_threshold if len(samples) > 1 else False
+
+    async def _ensemble_sample_speech(self, speech: Speech, debate_info: DebateInfo) -> Dict[str, List[float]]:
+        """按维度集成采样：先采 min_samples 次，样本分歧超过阈值时逐次追加，直到一致、上限或预算耗尽"""
+        samples: Dict[str, List[float]] = {}
+        judge_dims: List[Tuple[JudgeAgent, str]] = [(j, d) for j in self.judge_agents for d in j.dimensions]
+
+        async def run_dim(judge, dim):
+            dim_samples = await self._sample(judge, speech, dim, self.ensemble.min_samples, debate_info)
+            while self._needs_more(dim_samples) and self.remaining_budget() > 0:
+                new = await self._sample(judge, speech, dim, 1, debate_info)
+                if not new:
+                    break  # 调用持续失败时不再消耗预算
+                dim_samples.extend(new)
+            samples[dim] = dim_samples
+
+        await asyncio.gather(*[run_dim(j, d) for j, d in judge_dims])
+        return samples
+
+    def _dimension_mean(self, judge: JudgeAgent, speech: Speech, debate_info: DebateInfo, dim: str,
+                        samples: List[float]) -> float:
+        """样本均值；所有采样都失败时用评委的兜底评分，没有兜底评分器时才退回5.0（samples=0 会体现在结果中）"""
+        if samples:
+            return sum(samples) / len(samples)
+        score = judge.fallback_score(speech, debate_info, dim) if judge.fallback_scorer is not None else None
+        return score if score is not None else 5.0
+
+    async def _refine_close_ranks(self, speeches: List[Speech], all_samples: List[Dict[str, List[float]]],
+                                  debate_info: DebateInfo):
+        """相邻名次总分差小于 rank_margin 时，为两条发言的各维度再各追加一次采样；
+        总分与最终聚合一致，按维度权重加权"""
+        judge_dims = [(j, d) for j in self.judge_agents for d in j.dimensions]
+        while self.remaining_budget() > 0:
+            totals = [sum(self.weights.get(d, 1.0) * self._dimension_mean(j, sp, debate_info, d, s.get(d, []))
+                          for j, d in judge_dims)
+                      for sp, s in zip(speeches, all_samples)]
+            order = sorted(range(len(totals)), key=lambda i: totals[i], reverse=True)
+            close = set()
+            for a, b in zip(order, order[1:]):
+                if totals[a] - totals[b] < self.ensemble.rank_margin:
+                    close.update((a, b))
+            tasks = []
+            for i in close:
+                for judge, dim in judge_dims:
+                    if len(all_samples[i].get(dim, [])) < self.ensemble.max_samples:
+                        tasks.append((i, dim, self._sample(judge, speeches[i], dim, 1, debate_info)))
+            if not tasks:
+                return
+            results = await asyncio.gather(*[t for _, _, t in tasks])
+            if not any(results):
+                return
+            for (i, dim, _), new in zip(tasks, results):
+                all_samples[i].setdefault(dim, []).extend(new)
+
+    def _ensemble_dimension_scores(self, speech: Speech, debate_info: DebateInfo,
+                                   samples: Dict[str, List[float]]) -> List[SingleScore]:
+        dimension_scores = []
+        for judge in self.judge_agents:
+            for dim in judge.dimensions:
+                dim_samples = samples.get(dim, [])
+                variance = statistics.variance(dim_samples) if len(dim_samples) > 1 else None
+                dimension_scores.append(SingleScore(
+                    dimension=dim, score=self._dimension_mean(judge, speech, debate_info, dim, dim_samples), comment="",
+                    variance=variance, samples=len(dim_samples)
+                ))
+        return dimension_scores
+
+    async def _evaluate_ensemble(self, items: List[Tuple[str, str, str, Any, Speech]],
+                                 debate_info: DebateInfo) -> List[SpeechScoreResult]:
+        """集成评分：items 为 (speech_id, debater_name, mbti_type, stage, Speech)"""
+        speeches = [item[4] for item in items]
+        all_samples = list(await asyncio.gather(*[self._ensemble_sample_speech(sp, debate_info) for sp in speeches]))
+        await self._refine_close_ranks(speeches, all_samples, debate_info)
+        results = []
+        for (speech_id, debater_name, mbti_type, stage, speech), samples in zip(items, all_samples):
+            dimension_scores = self._ensemble_dimension_scores(speech, debate_info, samples)
+            total_score = sum(ds.score for ds in dimension_scores)
+            results.append(SpeechScoreResult(
+                speech_id=speech_id,
+                debater_name=debater_name,
+                mbti_type=mbti_type,
+                stage=stage,
+                dimension_scores=dimension_scores,
+                total_score=total_score,
+                average_score=total_score / len(dimension_scores)
+            ))
+        return results
+
+    def _judge_for(self, dim: str) -> JudgeAgent:
+        for judge in self.judge_agents:
+            if dim in judge.dimensions:
+                return judge
+        return self.judge_agents[0]
+
+    async def _score_group(self, speeches: List[DifySpeechInput], stage) -> Dict[int, Dict[str, float]]:
+        """一次请求横向比较整组发言，返回 发言下标->各维度分数；解析失败的发言不在结果中"""
+        if self.remaining_budget() < 1:
+            return {}
+        judge = self.judge_agents[0]
+        speeches_text = "\n\n".join(
+            f"发言编号 S{i + 1}（辩手: {s.debater_name}，MBTI类型: {s.mbti_type}）:\n{s.content}"
+            for i, s in enumerate(speeches)
         )
-        debate_info = DebateInfo("", [], [], [])
+        example = json.dumps({f"S{i + 1}": {dim: 7.5 for dim in self.dimensions} for i in range(min(len(speeches), 2))},
+                             ensure_ascii=False)
+        prompt = DebateConfig.comparative_prompt_template.format(
+            motion=self.motion, stage=stage, dimensions="、".join(self.dimensions), speeches=speeches_text, example=example
+        )
+        self.calls_used += 1
+        try:
+            text = await judge.call_deepseek_llm(prompt)
+            data = json.loads(judge._extract_json(text))
+            if not isinstance(data, dict):
+                raise ValueError("Response is not a JSON object")
+        except Exception as e:
+            print(f"比较评分失败: {e}")
+            return {}
+        scores = {}
+        for label, dim_scores in data.items():
+            label = str(label).strip().upper()
+            if not label.startswith("S") or not label[1:].isdigit() or not isinstance(dim_scores, dict):
+                continue
+            index = int(label[1:]) - 1
+            try:
+                parsed = {dim: min(max(float(dim_scores[dim]), 0.0), 10.0) for dim in self.dimensions}
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= index < len(speeches):
+                scores[index] = parsed
+        return scores
+
+    async def _compare_pair(self, a: DifySpeechInput, b: DifySpeechInput, stage) -> Dict[str, Optional[bool]]:
+        """比较两条发言，返回 维度->A是否更好（无法解析时为None）；调用次数由 _rank_pairwise 计入"""
+        judge = self.judge_agents[0]
+        prompt = DebateConfig.pairwise_prompt_template.format(
+            motion=self.motion, stage=stage, dimensions="、".join(self.dimensions),
+            debater_a=a.debater_name, mbti_a=a.mbti_type, content_a=a.content,
+            debater_b=b.debater_name, mbti_b=b.mbti_type, content_b=b.content,
+            example=json.dumps({dim: "A" for dim in self.dimensions}, ensure_ascii=False)
+        )
+        try:
+            text = await judge.call_deepseek_llm(prompt)
+            data = json.loads(judge._extract_json(text))
+            if not isinstance(data, dict):
+                raise ValueError("Response is not a JSON object")
+        except Exception as e:
+            print(f"两两比较失败: {e}")
+            data = {}
+        result = {}
+        for dim in self.dimensions:
+            winner = str(data.get(dim, "")).strip().upper()
+            result[dim] = True if winner == "A" else False if winner == "B" else None
+        return result
+
+    def _pairwise_cost(self, n: int) -> int:
+        """两两比较排名最多需要的评委调用数：各维度归并排序的比较次数（同一对只比较一次）加上锚点评分"""
+        depth = math.ceil(math.log2(n)) if n > 1 else 0
+        comparisons = n * depth - 2 ** depth + 1
+        return min(n * (n - 1) // 2, comparisons * len(self.dimensions)) + 2 * len(self.dimensions)
+
+    async def _rank_pairwise(self, speeches: List[DifySpeechInput], stage) -> Dict[int, Dict[str, float]]:
+        """归并排序两两比较：同一对发言只比较一次，结果在各维度的排序间共享；
+        预算不足或锚点评分不可用时返回空结果，整个环节退回逐条独立评分"""
+        cost = self._pairwise_cost(len(speeches))
+        if cost > self.remaining_budget():
+            print(f"比较评分预算不足（需要 {cost} 次，剩余 {self.remaining_budget()} 次），改为逐条评分")
+            return {}
+        # 先按最多需要的次数预留预算（多个环节并发评分），结束后按实际调用次数结算
+        self.calls_used += cost
+        pair_tasks: Dict[Tuple[int, int], asyncio.Future] = {}
+        try:
+            return await self._rank_pairwise_within_budget(speeches, stage, pair_tasks)
+        finally:
+            self.calls_used -= cost - len(pair_tasks) - 2 * len(self.dimensions)
+
+    async def _rank_pairwise_within_budget(self, speeches: List[DifySpeechInput], stage,
+                                           pair_tasks: Dict[Tuple[int, int], asyncio.Future]
+                                           ) -> Dict[int, Dict[str, float]]:
+        async def better(i: int, j: int, dim: str) -> bool:
+            key = (min(i, j), max(i, j))
+            if key not in pair_tasks:
+                pair_tasks[key] = asyncio.ensure_future(self._compare_pair(speeches[key[0]], speeches[key[1]], stage))
+            a_better = (await pair_tasks[key])[dim]
+            if a_better is None:
+                return i < j  # 比较失败时保持原顺序
+            return a_better if i == key[0] else not a_better
+
+        async def merge_sort(indices: List[int], dim: str) -> List[int]:
+            if len(indices) <= 1:
+                return indices
+            mid = len(indices) // 2
+            left, right = await asyncio.gather(merge_sort(indices[:mid], dim), merge_sort(indices[mid:], dim))
+            merged = []
+            while left and right:
+                if await better(left[0], right[0], dim):
+                    merged.append(left.pop(0))
+                else:
+                    merged.append(right.pop(0))
+            return merged + left + right
+
+        orders = await asyncio.gather(*[merge_sort(list(range(len(speeches))), dim) for dim in self.dimensions])
+        # 用排名首尾两条发言的独立评分作为锚点，把名次线性映射为校准后的分数
+        debate_info = self._debate_info(speeches)
+
+        async def anchor(judge: JudgeAgent, speech: Speech, dim: str) -> Optional[float]:
+            score = await judge.sample_score(speech, debate_info, dim)
+            # 评委调用失败时用兜底评分（与逐条评分一致）
+            if score is None and judge.fallback_scorer is not None:
+                score = judge.fallback_score(speech, debate_info, dim)
+            return score
+
+        async def anchors(dim: str, order: List[int]) -> Optional[Tuple[float, float]]:
+            judge = self._judge_for(dim)
+            top, bottom = await asyncio.gather(*[anchor(judge, self._to_speech(speeches[i]), dim)
+                                                 for i in (order[0], order[-1])])
+            if top is None or bottom is None:
+                return None
+            top, bottom = max(top, bottom), min(top, bottom)
+            if top - bottom < 1.0:
+                # 与评分要求一致：最高分和最低分至少相差1分
+                mid = (top + bottom) / 2
+                top, bottom = min(mid + 0.5, 10.0), max(mid - 0.5, 0.0)
+            return top, bottom
+
+        anchor_pairs = await asyncio.gather(*[anchors(dim, order) for dim, order in zip(self.dimensions, orders)])
+        if any(pair is None for pair in anchor_pairs):
+            print("比较评分的锚点评分不可用，改为逐条评分")
+            return {}
+        scores: Dict[int, Dict[str, float]] = {i: {} for i in range(len(speeches))}
+        for dim, order, (top, bottom) in zip(self.dimensions, orders, anchor_pairs):
+            for pos, i in enumerate(order):
+                scores[i][dim] = round(top - (top - bottom) * pos / max(len(order) - 1, 1), 2)
+        return scores
+
+    async def _evaluate_comparative(self, stage_speeches: List[DifySpeechInput], stage) -> List[SpeechScoreResult]:
+        if len(stage_speeches) <= self.comparative_group_size:
+            scores = await self._score_group(stage_speeches, stage)
+        else:
+            scores = await self._rank_pairwise(stage_speeches, stage)
+        results: List[SpeechScoreResult] = []
+        for i, s in enumerate(stage_speeches):
+            if i not in scores:
+                continue
+            dimension_scores = [SingleScore(dimension=dim, score=score, comment="") for dim, score in scores[i].items()]
+            total_score = sum(ds.score for ds in dimension_scores)
+            results.append(SpeechScoreResult(
+                speech_id=s.speech_id,
+                debater_name=s.debater_name,
+                mbti_type=s.mbti_type or "未知",
+                stage=s.stage,
+                dimension_scores=dimension_scores,
+                total_score=total_score,
+                average_score=total_score / len(dimension_scores)
+            ))
+        # 比较评分未覆盖的发言退回逐条独立评分
+        missing = [s for i, s in enumerate(stage_speeches) if i not in scores]
+        debate_info = self._debate_info(stage_speeches)
+        results.extend(await asyncio.gather(*[self.evaluate_single_speech(s, debate_info) for s in missing]))
+        results.sort(key=lambda r: r.total_score, reverse=True)
+        for rank, r in enumerate(results, start=1):
+            r.stage_rank = rank
+        return results
+
+    async def evaluate_single_speech(self, speech_input: DifySpeechInput,
+                                     debate_info: Optional[DebateInfo] = None) -> SpeechScoreResult:
+        speech = self._to_speech(speech_input)
+        debate_info = debate_info or self._debate_info([speech_input])
         # 并发所有judge.score_speech
         judge_tasks = [judge.score_speech(speech, debate_info) for judge in self.judge_agents]
         judge_results = await asyncio.gather(*judge_tasks)
@@ -41,7 +356,15 @@ class Evaluator:
     async def evaluate_stage(self, speeches: List[DifySpeechInput], stage: DebateStage) -> List[SpeechScoreResult]:
         # 普通环节：对每条发言评分（并发）
         stage_speeches = [s for s in speeches if s.stage == stage]
-        tasks = [self.evaluate_single_speech(s) for s in stage_speeches]
+        if self.comparative and stage_speeches:
+            return await self._evaluate_comparative(stage_speeches, stage)
+        debate_info = self._debate_info(stage_speeches)
+        if self.ensemble:
+            return await self._evaluate_ensemble([
+                (s.speech_id, s.debater_name, s.mbti_type or "未知", s.stage, self._to_speech(s))
+                for s in stage_speeches
+            ], debate_info)
+        tasks = [self.evaluate_single_speech(s, debate_info) for s in stage_speeches]
         return await asyncio.gather(*tasks)
 
     async def evaluate_free_debate(self, speeches: List[DifySpeechInput]) -> List[SpeechScoreResult]:
@@ -49,21 +372,20 @@ class Evaluator:
         free_speeches = [s for s in speeches if s.stage == DebateStage.FREE_DEBATE]
         debater_map: Dict[str, List[str]] = {}
         mbti_map: Dict[str, str] = {}
+        speech_map: Dict[str, DifySpeechInput] = {}
         for s in free_speeches:
             debater_map.setdefault(s.debater_name, []).append(s.content)
             mbti_map[s.debater_name] = s.mbti_type
+            speech_map[s.debater_name] = s
+        # 自由辩论按辩手合并发言，对方的发言都是回应对象
+        debate_info = self._debate_info(free_speeches)
         async def score_debater(debater, all_speeches):
             summary_input = FreeDebateSummaryInput(
                 debater_name=debater,
                 mbti_type=mbti_map.get(debater, "未知"),
                 all_speeches=all_speeches
             )
-            speech = Speech(
-                debater=debater,
-                stage=DebateStage.FREE_DEBATE,
-                content="\n".join(all_speeches)
-            )
-            debate_info = DebateInfo("", [], [], [])
+            speech = self._to_speech(speech_map[debater], "\n".join(all_speeches))
             judge_tasks = [judge.score_speech(speech, debate_info) for judge in self.judge_agents]
             judge_results = await asyncio.gather(*judge_tasks)
             dimension_scores = []
@@ -82,6 +404,12 @@ class Evaluator:
                 total_score=total_score,
                 average_score=average_score
             )
+        if self.ensemble:
+            return await self._evaluate_ensemble([
+                (f"free_{debater}", debater, mbti_map.get(debater, "未知"), DebateStage.FREE_DEBATE,
+                 self._to_speech(speech_map[debater], "\n".join(all_speeches)))
+                for debater, all_speeches in debater_map.items()
+            ], debate_info)
         tasks = [score_debater(debater, all_speeches) for debater, all_speeches in debater_map.items()]
         return await asyncio.gather(*tasks)
 
@@ -97,3 +425,4 @@ class Evaluator:
         free_results = await self.evaluate_free_debate(speeches)
         results.extend(free_results)
         return results
+
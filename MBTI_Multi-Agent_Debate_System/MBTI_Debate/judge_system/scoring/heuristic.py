@@ -0,0 +1,115 @@
+import re
+from typing import List, Dict, Optional, Iterable
+from ..core.common import DifySpeechInput, SpeechScoreResult, SingleScore
+from ...constants import MBTI_STYLES
+#本地启发式评分：只用文本特征，毫秒级完成，不调用LLM。
+#用于LLM评委返回前的临时分数，以及评委调用失败时的兜底分数（代替固定的5.0）
+
+# 各环节发言字数要求（与辩手生成发言时的prompt一致），(下限, 上限)
+STAGE_LENGTH_LIMITS = {
+    "OPENING": (300, 500), "立论": (300, 500),
+    "CROSS_EXAM": (50, 300), "攻辩": (50, 300), "质询": (50, 300),
+    "FREE_DEBATE": (30, 200), "自由辩论": (30, 200),
+    "SUMMARY": (400, 600), "总结": (400, 600), "总结陈词": (400, 600),
+}
+
+LOGIC_MARKERS = ["因为", "所以", "因此", "首先", "其次", "最后", "如果", "那么", "由此", "综上", "进而", "一方面", "另一方面"]
+EVIDENCE_MARKERS = ["数据", "研究", "调查", "统计", "报告", "例如", "比如", "案例", "事实", "显示", "%", "％"]
+REBUTTAL_MARKERS = ["对方", "反驳", "然而", "但是", "并非", "错误", "漏洞", "恰恰", "请问", "难道", "忽略", "偷换", "混淆", "站不住"]
+QUOTE_PATTERN = re.compile(r"[“「『\"]([^”」』\"]{2,60})[”」』\"]")
+PUNCTUATION = re.compile(r"[\s，。、；：！？,.;:!?（）()“”「」『』\"'《》…—-]+")
+
+
+def _clip(value: float, low: float = 0.0, high: float = 1.0) -> float:
+    return max(low, min(high, value))
+
+
+def _ngrams(text: str, n: int) -> List[str]:
+    text = PUNCTUATION.sub("", text)
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+def _count(text: str, markers: Iterable[str]) -> int:
+    return sum(text.count(m) for m in markers)
+
+
+class HeuristicScorer:
+    """基于文本特征的本地评分器：长度是否符合环节要求、逻辑连接词、论据、反驳标记、引用对方、重复度、MBTI风格关键词重合"""
+
+    def __init__(self, dimensions: List[str]):
+        self.dimensions = dimensions
+        self._style_grams = {mbti: set(_ngrams(style, 2)) for mbti, style in MBTI_STYLES.items()}
+
+    def features(self, content: str, stage: str, mbti_type: Optional[str] = None,
+                 opponent_texts: Iterable[str] = ()) -> Dict[str, float]:
+        """提取各项文本特征，均归一化到0~1"""
+        content = content or ""
+        length = len(PUNCTUATION.sub("", content))
+        low, high = STAGE_LENGTH_LIMITS.get(str(getattr(stage, "value", stage)), (100, 500))
+        if length < low:
+            length_fit = length / low
+        elif length > high:
+            length_fit = _clip(1 - (length - high) / high)
+        else:
+            length_fit = 1.0
+        grams = _ngrams(content, 4)
+        repetition = 1 - len(set(grams)) / len(grams) if grams else 0.0
+        # 引用对方：直接复述对方发言的6字片段，或使用引号引用
+        opponent_grams = set()
+        for text in opponent_texts:
+            opponent_grams.update(_ngrams(text, 6))
+        echoed = len(set(_ngrams(content, 6)) & opponent_grams)
+        quoted = len(QUOTE_PATTERN.findall(content))
+        style = self._style_grams.get((mbti_type or "").upper())
+        style_overlap = len(style & set(_ngrams(content, 2))) / len(style) if style else 0.0
+        return {
+            "length_fit": length_fit,
+            "logic": _clip(_count(content, LOGIC_MARKERS) / 4),
+            "evidence": _clip((_count(content, EVIDENCE_MARKERS) + len(re.findall(r"\d+", content)) / 2) / 4),
+            "rebuttal": _clip(_count(content, REBUTTAL_MARKERS) / 4),
+            "quoting": _clip(echoed / 3 + quoted / 2),
+            "repetition": repetition,
+            "style": _clip(style_overlap * 3),
+        }
+
+    def score_dimension(self, dim: str, f: Dict[str, float]) -> float:
+        """按维度名称组合特征，得到0~10分"""
+        fluency = 1 - f["repetition"]
+        if "逻辑" in dim:
+            score = 2 + 3 * f["logic"] + 3 * f["length_fit"] + 2 * fluency
+        elif "论点" in dim or "论据" in dim:
+            score = 2 + 4 * f["evidence"] + 3 * f["length_fit"] + 1 * fluency
+        elif "MBTI" in dim:
+            score = 3 + 5 * f["style"] + 2 * f["length_fit"]
+        elif "反驳" in dim:
+            score = 2 + 4 * f["rebuttal"] + 3 * f["quoting"] + 1 * f["length_fit"]
+        else:
+            score = 2 + 2 * f["logic"] + 2 * f["evidence"] + 2 * f["rebuttal"] + 2 * f["length_fit"]
+        # 大段重复内容额外扣分
+        score -= 4 * max(0.0, f["repetition"] - 0.3)
+        return round(_clip(score, 0.0, 10.0), 2)
+
+    def score(self, content: str, stage: str, mbti_type: Optional[str] = None,
+              opponent_texts: Iterable[str] = ()) -> Dict[str, float]:
+        f = self.features(content, stage, mbti_type, opponent_texts)
+        return {dim: self.score_dimension(dim, f) for dim in self.dimensions}
+
+    def score_speeches(self, speeches: List[DifySpeechInput]) -> List[SpeechScoreResult]:
+        """对整场辩论逐条打临时分，对方发言（正反方按辩手名前缀区分）作为引用检测的参照"""
+        results = []
+        for s in speeches:
+            side = s.debater_name[:3]
+            opponents = [o.content for o in speeches if o.debater_name[:3] != side and o.content]
+            scores = self.score(s.content, s.stage, s.mbti_type, opponents)
+            dimension_scores = [SingleScore(dimension=dim, score=score, comment="") for dim, score in scores.items()]
+            total_score = sum(ds.score for ds in dimension_scores)
+            results.append(SpeechScoreResult(
+                speech_id=s.speech_id,
+                debater_name=s.debater_name,
+                mbti_type=s.mbti_type or "未知",
+                stage=s.stage,
+                dimension_scores=dimension_scores,
+                total_score=total_score,
+                average_score=total_score / len(dimension_scores) if dimension_scores else 0.0
+            ))
+        return results
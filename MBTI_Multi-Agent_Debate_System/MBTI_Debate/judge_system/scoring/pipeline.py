@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import json
+from typing import List, Dict, Tuple, Hashable
+from ..agents.judge_agent import JudgeAgent
+from ..config.dabate_config import DebateConfig, EnsembleConfig
+from ..core.common import DifySpeechInput, DebaterFinalScore, SpeechScoreResult
+from .dimension import ScoreAggregator
+from .evaluator import Evaluator
+from .heuristic import HeuristicScorer
+from .vectorized import ScoreMatrix, aggregate
+#把一场已存储的辩论（发言表或旧的 DebateHistory.history）转换为评分输入，并跑完整的评委评分流程
+
+# 统一stage字段映射
+STAGE_MAP = {
+    "立论": "OPENING",
+    "攻辩": "CROSS_EXAM",
+    "自由辩论": "FREE_DEBATE",
+    "总结": "SUMMARY",
+    "总结陈词": "SUMMARY"
+}
+
+
+def normalize_speeches(history: List[dict], mbti_config: Dict[str, str]) -> List[DifySpeechInput]:
+    """把存储的发言记录统一转换为 DifySpeechInput"""
+    speech_inputs = []
+    for s in history or []:
+        # 判断是否为标准格式
+        if all(k in s for k in ("debater_name", "mbti_type", "stage", "content", "speech_id")):
+            s = dict(s)
+            s["debater_name"] = s["debater_name"].strip().lower()
+            s["stage"] = STAGE_MAP.get(s["stage"], s["stage"])
+            speech_inputs.append(DifySpeechInput(**s))
+        else:
+            debater_name = (s.get("debater_name") or s.get("agent_id") or "").strip().lower()
+            mbti_type = s.get("mbti_type") or mbti_config.get(debater_name, "未知")
+            stage = s.get("stage")
+            stage = STAGE_MAP.get(stage, stage)
+            content = s.get("content")
+            speech_id = s.get("speech_id") or f"{debater_name}_{s.get('round', 1)}"
+            speech_inputs.append(DifySpeechInput(
+                debater_name=debater_name,
+                mbti_type=mbti_type,
+                stage=stage,
+                content=content,
+                speech_id=speech_id
+            ))
+    return speech_inputs
+
+
+def speech_rows_to_inputs(speeches) -> List[DifySpeechInput]:
+    """发言表（debate_speeches）的行直接转换为 DifySpeechInput，环节已是统一代码，无需再映射"""
+    return [DifySpeechInput(
+        debater_name=s.agent_id,
+        mbti_type=s.mbti or "未知",
+        stage=s.stage,
+        content=s.content,
+        speech_id=f"{s.agent_id}_{s.round if s.round is not None else 1}"
+    ) for s in speeches]
+
+
+def load_speech_inputs(speeches, record) -> List[DifySpeechInput]:
+    """优先使用发言表中的发言；尚未迁移的旧记录回退到 history JSON"""
+    if speeches:
+        return speech_rows_to_inputs(speeches)
+    return normalize_speeches(record.history, record.mbti_config or {})
+
+
+def build_debate_config(topic: str, mbti_config: Dict[str, str]) -> DebateConfig:
+    return DebateConfig(
+        motion=topic,
+        pro_debaters=[k for k in mbti_config if k.startswith("pro")],
+        con_debaters=[k for k in mbti_config if k.startswith("opp")],
+        mbti_map=mbti_config
+    )
+
+
+async def score_debate(topic: str, mbti_config: Dict[str, str], speech_inputs: List[DifySpeechInput],
+                       ensemble: bool = False, comparative: bool = False, with_comments: bool = True,
+                       score_cache=None, rate_limiter=None, config: DebateConfig = None
+                       ) -> Tuple[Dict[str, DebaterFinalScore], List[SpeechScoreResult], Evaluator]:
+    """对一场辩论的所有发言评分并聚合，返回(辩手最终得分, 每条发言得分, 评估器)"""
+    config = config or build_debate_config(topic, mbti_config)
+    # 聚合只需要分数：score-first流式评分，解析到score即终止；
+    # 其余评委请求（综合评语、比较评分）进入跨请求微批处理，共享连接池；
+    # 评委调用失败时用本地启发式分数兜底
+    fallback_scorer = HeuristicScorer(config.dimensions)
+    judge_agents = [
+        JudgeAgent(f"Judge-{dim}", [dim], prompt_template=config.score_first_prompt_template, score_first=True,
+                   micro_batch=True, score_cache=score_cache, rate_limiter=rate_limiter,
+                   fallback_scorer=fallback_scorer)
+        for dim in config.dimensions
+    ]
+    # ensemble=true 时启用集成评分：分歧大或排名接近时才追加采样
+    # comparative=true 时各环节横向比较评分（大环节两两比较排序）
+    evaluator = Evaluator(judge_agents, config.dimensions, config.weights,
+                          ensemble=EnsembleConfig() if ensemble else None, comparative=comparative,
+                          mbti_map=config.mbti_map, motion=config.motion)
+    # 评分遍历所有实际出现的stage
+    stages = set(s.stage for s in speech_inputs)
+    speech_scores = []
+    stage_results = await asyncio.gather(*[evaluator.evaluate_stage(speech_inputs, stage) for stage in stages])
+    for r in stage_results:
+        speech_scores.extend(r)
+    # 自由辩论特殊处理
+    if "FREE_DEBATE" in stages:
+        speech_scores.extend(await evaluator.evaluate_free_debate(speech_inputs))
+    aggregator = ScoreAggregator(config.dimensions, config.weights, batch_comments=True)
+    final_scores = await aggregator.aggregate_speech_scores_async(speech_scores, judge_agents[0],
+                                                                   with_comments=with_comments)
+    return final_scores, speech_scores, evaluator
+
+
+async def provisional_scores(topic: str, mbti_config: Dict[str, str], speech_inputs: List[DifySpeechInput]
+                             ) -> Tuple[Dict[str, DebaterFinalScore], List[SpeechScoreResult]]:
+    """本地启发式临时评分（不调用LLM），用于评委结果返回前先行展示"""
+    config = build_debate_config(topic, mbti_config)
+    speech_scores = HeuristicScorer(config.dimensions).score_speeches(speech_inputs)
+    aggregator = ScoreAggregator(config.dimensions, config.weights)
+    final_scores = await aggregator.aggregate_speech_scores_async(speech_scores, None, with_comments=False)
+    return final_scores, speech_scores
+
+
+def team_totals(final_scores: Dict[str, DebaterFinalScore]) -> Tuple[float, float]:
+    """正方、反方辩手总分之和"""
+    pro = sum(s.total_score for name, s in final_scores.items() if name.startswith("pro"))
+    opp = sum(s.total_score for name, s in final_scores.items() if name.startswith("opp"))
+    return pro, opp
+
+
+def config_fingerprint(config: DebateConfig) -> Tuple[str, str]:
+    """返回(评委prompt指纹, 完整配置指纹)：前者变化需要重新调用评委，仅后者变化只需本地重新加权"""
+    prompt_part = json.dumps({"dimensions": config.dimensions, "prompt": config.score_first_prompt_template},
+                             ensure_ascii=False, sort_keys=True)
+    weights_part = json.dumps(config.weights, ensure_ascii=False, sort_keys=True)
+    prompt_hash = hashlib.sha256(prompt_part.encode("utf-8")).hexdigest()[:16]
+    config_hash = hashlib.sha256((prompt_part + weights_part).encode("utf-8")).hexdigest()[:16]
+    return prompt_hash, config_hash
+
+
+async def reweight_scores(speech_scores: List[SpeechScoreResult], config: DebateConfig) -> Dict[str, DebaterFinalScore]:
+    """评委分数不变、只改权重时，纯本地重新聚合，不调用LLM"""
+    return reweight_many([(0, speech_scores)], config).get(0, {})
+
+
+def reweight_many(items: List[Tuple[Hashable, List[SpeechScoreResult]]],
+                  config: DebateConfig) -> Dict[Hashable, Dict[str, DebaterFinalScore]]:
+    """批量本地重新聚合多场辩论：合并为一个评分矩阵一次计算，结果与逐场聚合一致（评语为空）"""
+    items = [(debate_id, scores) for debate_id, scores in items if scores]
+    if not items:
+        return {}
+    matrix = ScoreMatrix.concat([ScoreMatrix.from_results(scores, config.dimensions, debate_id)
+                                 for debate_id, scores in items])
+    return aggregate(matrix, config.weights).to_final_scores()
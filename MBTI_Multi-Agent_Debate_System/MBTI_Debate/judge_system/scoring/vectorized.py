@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Hashable
+import numpy as np
+from ..core.common import SpeechScoreResult, DebaterFinalScore
+#基于NumPy的批量评分聚合：一次处理大量辩论的 发言×维度×采样 评分矩阵，
+#计算结果与 ScoreAggregator 的逐场聚合一致（加权总分、排名完全相同）
+
+
+@dataclass
+class ScoreMatrix:
+    """列式评分矩阵：scores[发言, 维度, 采样]，缺失值为 NaN"""
+    scores: np.ndarray
+    dimensions: List[str]
+    debate_ids: np.ndarray      # 每条发言所属辩论
+    debater_names: List[str]    # 每条发言的辩手（已统一为小写）
+    mbti_types: List[str]
+
+    @classmethod
+    def from_results(cls, results: List[SpeechScoreResult], dimensions: List[str],
+                     debate_id: Hashable = 0) -> "ScoreMatrix":
+        """由一场辩论的发言评分构建矩阵（每个维度的分数作为一个采样）"""
+        dim_index = {dim: i for i, dim in enumerate(dimensions)}
+        samples = max([sum(1 for ds in r.dimension_scores if ds.dimension == dim)
+                       for r in results for dim in dimensions] or [1])
+        scores = np.full((len(results), len(dimensions), max(samples, 1)), np.nan)
+        for s, r in enumerate(results):
+            filled = [0] * len(dimensions)
+            for ds in r.dimension_scores:
+                d = dim_index.get(ds.dimension)
+                if d is None:
+                    continue
+                scores[s, d, filled[d]] = ds.score
+                filled[d] += 1
+        return cls(
+            scores=scores,
+            dimensions=list(dimensions),
+            debate_ids=np.array([debate_id] * len(results), dtype=object),
+            debater_names=[r.debater_name.strip().lower() if r.debater_name else "" for r in results],
+            mbti_types=[getattr(r, 'mbti_type', '未知') for r in results],
+        )
+
+    @classmethod
+    def concat(cls, matrices: List["ScoreMatrix"]) -> "ScoreMatrix":
+        if not matrices:
+            raise ValueError("没有可合并的评分矩阵")
+        dimensions = matrices[0].dimensions
+        samples = max(m.scores.shape[2] for m in matrices)
+        padded = []
+        for m in matrices:
+            if m.dimensions != dimensions:
+                raise ValueError("评分矩阵的维度不一致")
+            pad = np.full(m.scores.shape[:2] + (samples - m.scores.shape[2],), np.nan)
+            padded.append(np.concatenate([m.scores, pad], axis=2))
+        return cls(
+            scores=np.concatenate(padded, axis=0),
+            dimensions=list(dimensions),
+            debate_ids=np.concatenate([m.debate_ids for m in matrices]),
+            debater_names=[n for m in matrices for n in m.debater_names],
+            mbti_types=[t for m in matrices for t in m.mbti_types],
+        )
+
+
+@dataclass
+class AggregateResult:
+    """按 (辩论, 辩手) 分组的聚合结果，各数组第一维与 groups 对应"""
+    groups: List[Tuple[Hashable, str]]
+    mbti_types: List[str]
+    dimensions: List[str]
+    dimension_averages: np.ndarray   # (G, D) 各维度平均分（无分数的维度为0，与逐场聚合一致）
+    dimension_variances: np.ndarray  # (G, D) 各维度发言间方差（样本数<2时为NaN）
+    score_counts: np.ndarray         # (G, D) 参与平均的分数个数
+    total_scores: np.ndarray         # (G,) 加权总分
+    ci_low: np.ndarray               # (G,) 加权总分95%置信区间
+    ci_high: np.ndarray
+    ranks: np.ndarray                # (G,) 辩论内排名
+
+    def to_final_scores(self) -> Dict[Hashable, Dict[str, DebaterFinalScore]]:
+        """转换为与 ScoreAggregator 相同的结构：辩论 -> {辩手: DebaterFinalScore}（按排名排序，评语为空）"""
+        result: Dict[Hashable, Dict[str, DebaterFinalScore]] = {}
+        for g in np.lexsort((self.ranks, np.array([str(k[0]) for k in self.groups]))):
+            debate_id, name = self.groups[g]
+            result.setdefault(debate_id, {})[name] = DebaterFinalScore(
+                debater_name=name,
+                mbti_type=self.mbti_types[g],
+                dimension_averages={dim: float(self.dimension_averages[g, d]) for d, dim in enumerate(self.dimensions)},
+                total_score=float(self.total_scores[g]),
+                rank=int(self.ranks[g]),
+                overall_comment=""
+            )
+        return result
+
+
+def speech_means(matrix: ScoreMatrix) -> Tuple[np.ndarray, np.ndarray]:
+    """每条发言各维度的采样均值与采样方差 (S, D)；无样本为NaN"""
+    valid = ~np.isnan(matrix.scores)
+    counts = valid.sum(axis=2)
+    sums = np.where(valid, matrix.scores, 0.0).sum(axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, sums / counts, np.nan)
+        sq = np.where(valid, (matrix.scores - means[:, :, None]) ** 2, 0.0).sum(axis=2)
+        variances = np.where(counts > 1, sq / (counts - 1), np.nan)
+    return means, variances
+
+
+def aggregate(matrix: ScoreMatrix, weights: Dict[str, float], z: float = 1.96) -> AggregateResult:
+    """批量计算各辩手的维度均值、方差、加权总分、置信区间和辩论内排名"""
+    # 分组：(辩论, 辩手)，保持首次出现的顺序（与逐场聚合的字典顺序一致）
+    group_index: Dict[Tuple[Hashable, str], int] = {}
+    mbti_types: List[str] = []
+    g = np.empty(len(matrix.debater_names), dtype=np.int64)
+    for s, key in enumerate(zip(matrix.debate_ids, matrix.debater_names)):
+        if key not in group_index:
+            group_index[key] = len(group_index)
+            mbti_types.append(matrix.mbti_types[s])
+        g[s] = group_index[key]
+        mbti_types[g[s]] = matrix.mbti_types[s]  # 与逐场聚合一致：取该辩手最后一条发言的类型
+    n_groups, (n_speeches, n_dims, n_samples) = len(group_index), matrix.scores.shape
+
+    # 与逐场聚合相同：每个维度分数（每个采样）各算一项，按 发言→采样 的顺序展开
+    flat = matrix.scores.transpose(0, 2, 1).reshape(n_speeches * n_samples, n_dims)
+    rows = np.repeat(g, n_samples)
+    valid = ~np.isnan(flat)
+    values = np.where(valid, flat, 0.0)
+    sums = np.zeros((n_groups, n_dims))
+    counts = np.zeros((n_groups, n_dims))
+    # np.add.at 按顺序逐项累加，与逐场聚合的求和顺序相同，结果逐位一致
+    np.add.at(sums, rows, values)
+    np.add.at(counts, rows, valid.astype(float))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = np.where(counts > 0, sums / counts, 0.0)
+        sq = np.zeros((n_groups, n_dims))
+        np.add.at(sq, rows, np.where(valid, (values - averages[rows]) ** 2, 0.0))
+        variances = np.where(counts > 1, sq / (counts - 1), np.nan)
+
+    w = np.array([weights.get(dim, 1.0) for dim in matrix.dimensions])
+    totals = np.zeros(n_groups)
+    for d in range(n_dims):
+        totals = totals + averages[:, d] * w[d]
+
+    # 加权总分的置信区间：各维度均值的标准误按权重合成（维度间视为独立）
+    with np.errstate(invalid="ignore", divide="ignore"):
+        se2 = np.where(counts > 1, variances / counts, 0.0)
+    half_width = z * np.sqrt((se2 * w ** 2).sum(axis=1))
+
+    # 辩论内排名：总分降序，同分按首次出现顺序（与 sorted(..., reverse=True) 的稳定排序一致）
+    groups = list(group_index.keys())
+    debate_codes = np.unique(np.array([str(k[0]) for k in groups]), return_inverse=True)[1]
+    order = np.lexsort((np.arange(n_groups), -totals, debate_codes))
+    ranks = np.empty(n_groups, dtype=np.int64)
+    position = 0
+    for i, idx in enumerate(order):
+        if i == 0 or debate_codes[idx] != debate_codes[order[i - 1]]:
+            position = 0
+        position += 1
+        ranks[idx] = position
+
+    return AggregateResult(
+        groups=groups,
+        mbti_types=mbti_types,
+        dimensions=list(matrix.dimensions),
+        dimension_averages=averages,
+        dimension_variances=variances,
+        score_counts=counts.astype(np.int64),
+        total_scores=totals,
+        ci_low=totals - half_width,
+        ci_high=totals + half_width,
+        ranks=ranks,
+    )
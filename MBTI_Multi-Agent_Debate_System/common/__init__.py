@@ -0,0 +1 @@
+# 辩论评委与建议服务共用的基础组件
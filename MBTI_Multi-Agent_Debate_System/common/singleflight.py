@@ -0,0 +1,191 @@
+# common/singleflight.py
+
+import asyncio
+import hashlib
+import json
+import os
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+LLM_SINGLEFLIGHT_ENABLED = os.environ.get("LLM_SINGLEFLIGHT", "true").lower() in ("1", "true", "yes")
+# 温度不高于该值的模型才合并请求；温度更高的人格需要输出的多样性，各自独立调用
+LLM_SINGLEFLIGHT_MAX_TEMPERATURE = float(os.environ.get("LLM_SINGLEFLIGHT_MAX_TEMPERATURE", 0.5))
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class _Flight:
+    """一次共享的流式请求：已收到的分片全部缓存，后加入的订阅者从头回放"""
+    __slots__ = ("chunks", "done", "error", "event", "subscribers", "task")
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.event = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+
+class SingleFlight:
+    """
+    同一事件循环内的请求合并：相同键的并发调用共享一次上游请求，结果分发给所有等待方。
+    - do：普通调用，全部等待方都取消后才取消上游请求
+    - stream：流式调用，上游分片写入广播缓冲区，每个订阅者独立迭代；全部订阅者提前退出时取消上游
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Flight] = {}
+        self.upstream = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            self.upstream += 1
+            call.task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is call else None)
+        else:
+            self.coalesced += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, factory))
+            self.upstream += 1
+        else:
+            self.coalesced += 1
+        flight.subscribers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(flight.chunks):
+                    position += 1
+                    yield flight.chunks[position - 1]
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.event.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # 没有订阅者了：取消上游，后来的相同请求重新发起
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+                flight.task.cancel()
+
+    async def _pump(self, key: str, flight: _Flight, factory: Callable[[], AsyncIterator[Any]]):
+        stream = factory()
+        try:
+            async for chunk in stream:
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            flight.notify()
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+
+    def stats(self) -> dict:
+        return {"upstream": self.upstream, "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._streams)}
+
+
+_FLIGHTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SingleFlight]" = weakref.WeakKeyDictionary()
+
+
+def get_singleflight() -> SingleFlight:
+    """当前事件循环的请求合并器"""
+    loop = asyncio.get_running_loop()
+    flight = _FLIGHTS.get(loop)
+    if flight is None:
+        flight = _FLIGHTS[loop] = SingleFlight()
+    return flight
+
+
+def should_coalesce(llm, max_temperature: Optional[float] = None) -> bool:
+    if not LLM_SINGLEFLIGHT_ENABLED:
+        return False
+    temperature = getattr(llm, "temperature", None)
+    limit = LLM_SINGLEFLIGHT_MAX_TEMPERATURE if max_temperature is None else max_temperature
+    return temperature is not None and temperature <= limit
+
+
+def request_key(llm, prompt: Any, **params: Any) -> str:
+    """按 模型类型 + 模型参数 + 调用参数 + prompt 计算合并键"""
+    if isinstance(prompt, str):
+        prompt_text = prompt
+    else:
+        prompt_text = json.dumps([(getattr(m, "type", ""), getattr(m, "content", str(m))) for m in prompt],
+                                 ensure_ascii=False)
+    try:
+        identity = dict(llm._identifying_params)
+    except Exception:
+        identity = {"model_name": getattr(llm, "model_name", None), "temperature": getattr(llm, "temperature", None)}
+    identity["_type"] = type(llm).__name__
+    identity["_base_url"] = getattr(llm, "openai_api_base", None) or getattr(llm, "api_url", None)
+    meta = json.dumps([identity, params], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(f"{meta}|{prompt_text}".encode("utf-8")).hexdigest()
+
+
+async def coalesced_call(llm, prompt: Any, fn: Callable[[], Awaitable[Any]],
+                         max_temperature: Optional[float] = None) -> Any:
+    """满足温度条件时与相同的在途请求合并，否则直接调用 fn"""
+    if not should_coalesce(llm, max_temperature):
+        return await fn()
+    return await get_singleflight().do(request_key(llm, prompt), fn)
+
+
+async def coalesced_ainvoke(llm, prompt: Any, config: Optional[dict] = None,
+                            max_temperature: Optional[float] = None) -> Any:
+    # 合并后回调（如用量统计）只在实际发起请求的调用上触发
+    return await coalesced_call(llm, prompt, lambda: llm.ainvoke(prompt, config=config), max_temperature)
+
+
+async def coalesced_astream(llm, prompt: Any, config: Optional[dict] = None,
+                            max_temperature: Optional[float] = None,
+                            factory: Optional[Callable[[], AsyncIterator[Any]]] = None) -> AsyncIterator[Any]:
+    """流式版本：相同的在途请求共享一个上游流，分片广播给所有调用方；factory 可替换实际发起流式请求的方式"""
+    if factory is None:
+        factory = lambda: llm.astream(prompt, config=config)
+    if should_coalesce(llm, max_temperature):
+        stream = get_singleflight().stream(request_key(llm, prompt), factory)
+    else:
+        stream = factory()
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        # 调用方提前关闭时立即关闭内层流（取消上游或退订广播），不等垃圾回收
+        await stream.aclose()
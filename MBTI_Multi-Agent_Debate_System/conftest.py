@@ -0,0 +1,23 @@
+# pytest 公共配置：单元测试不访问真实的模型服务，只需要占位的环境变量即可构造客户端
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+for _name in ("DEEPSEEK_API_KEY", "OPENAI_API_KEY", "ZHIPU_API_KEY", "QWEN_API_KEY", "DOUBAO_API_KEY",
+              "SPARK_APP_ID", "SPARK_API_KEY", "SPARK_API_SECRET",
+              "DOUBAO_ACCESS_KEY_ID", "DOUBAO_ACCESS_KEY_SECRET"):
+    os.environ.setdefault(_name, "test")
+for _name in ("DEEPSEEK_BASE_URL", "ZHIPU_BASE_URL", "SPARK_BASE_URL", "DOUBAO_BASE_URL"):
+    os.environ.setdefault(_name, "http://127.0.0.1:9")
+os.environ.setdefault("DATABASE_ECHO", "false")
+# 导入 main 时会建表：指向临时数据库，不改动仓库中的 user_info.db
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+
+# 以下是需要真实模型服务、手动运行的脚本，不作为单元测试收集
+collect_ignore = [
+    "test/test_1.py",
+    "MBTI_Advice/test_2.py",
+    "MBTI_Debate/judge_system/test/test_j.py",
+]
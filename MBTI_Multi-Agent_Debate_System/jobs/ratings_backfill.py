@@ -0,0 +1,78 @@
+"""
+MBTI 评级回填任务：按 id 顺序分批评分所有历史辩论并计入评级。
+每批的评级更新与检查点在同一事务中提交，任务被中断后重新运行即可从上次位置继续。
+
+用法: python -m jobs.ratings_backfill --batch-size 20
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from sqlalchemy.orm import defer
+
+from MBTI_Debate.judge_system.scoring.pipeline import load_speech_inputs, score_debate, team_totals
+from user_database import SessionLocal, engine, Base
+from user_database.models import DebateHistory
+from user_database.ratings import get_checkpoint, save_checkpoint, is_debate_rated, record_debate_result
+from user_database.speeches import get_speeches
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "ratings_backfill"
+
+
+async def rate_debate(db, record: DebateHistory) -> bool:
+    """评分一场辩论并计入评级（不提交事务），返回是否有更新"""
+    if is_debate_rated(db, record.id) or not record.mbti_config:
+        return False
+    speech_inputs = load_speech_inputs(get_speeches(db, record.id), record)
+    if not speech_inputs:
+        return False
+    final_scores, _, _ = await score_debate(record.topic, record.mbti_config, speech_inputs, with_comments=False)
+    pro_score, opp_score = team_totals(final_scores)
+    return record_debate_result(db, record.id, record.mbti_config, pro_score, opp_score, commit=False)
+
+
+async def run_backfill(batch_size: int = 20, max_batches: int = None):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        checkpoint = get_checkpoint(db, JOB_NAME)
+        db.commit()
+        last_id, processed = checkpoint.last_id, checkpoint.processed
+        batches = 0
+        processed_this_run = 0
+        started = time.monotonic()
+        while max_batches is None or batches < max_batches:
+            records = db.query(DebateHistory).options(defer(DebateHistory.history)).filter(
+                DebateHistory.id > last_id
+            ).order_by(DebateHistory.id).limit(batch_size).all()
+            if not records:
+                break
+            rated = 0
+            for record in records:
+                try:
+                    rated += await rate_debate(db, record)
+                except Exception as e:
+                    logger.error(f"辩论 {record.id} 评级失败，已跳过: {e}", exc_info=True)
+            last_id = records[-1].id
+            processed += len(records)
+            processed_this_run += len(records)
+            save_checkpoint(db, checkpoint, last_id, processed)
+            batches += 1
+            elapsed = time.monotonic() - started
+            logger.info(f"已处理到辩论 {last_id}，本批计入 {rated} 场，累计 {processed} 场，"
+                        f"{processed_this_run / elapsed if elapsed else 0:.2f} 场/秒")
+        return processed
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="回填MBTI评级")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--max-batches", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(run_backfill(args.batch_size, args.max_batches))
@@ -0,0 +1,200 @@
+"""
+批量重算任务：评委维度、权重或prompt模板变化后，重新计算所有已存储辩论的评分。
+
+- 按 id 分页读取 DebateHistory，每场辩论的结果单独提交（失败时回滚，不影响同页的其他辩论），
+  每页结束后提交检查点，可随时中断后继续（已按当前配置重算过的辩论直接跳过）
+- 可在接口所在的事件循环中作为后台任务运行：数据库读写都放到线程中执行，不阻塞事件循环
+- 评委prompt未变、只改权重时，直接用已存的发言分数本地重新加权，不调用LLM；
+  每页的这类辩论合并成一个评分矩阵向量化计算
+- 需要调用评委时复用评分缓存（prompt不变的维度直接命中），并按 max_rps 限流
+- 定期输出吞吐量与预计剩余时间
+
+用法: python -m jobs.rescore --batch-size 20 --max-rps 2
+"""
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import defer
+
+from MBTI_Debate.judge_system.core.common import SpeechScoreResult
+from MBTI_Debate.judge_system.core.rate_limiter import AsyncRateLimiter
+from MBTI_Debate.judge_system.scoring.pipeline import load_speech_inputs, score_debate, build_debate_config, \
+    config_fingerprint, reweight_many
+from user_database import SessionLocal, Base
+from user_database.models import DebateHistory
+from user_database.ratings import get_checkpoint, save_checkpoint
+from user_database.scores import DBScoreCache, get_debate_score, save_debate_score
+from user_database.speeches import get_speeches
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "rescore"
+
+# 当前/最近一次任务的进度，供 /admin/rescore/status 查询
+PROGRESS = {"running": False}
+
+
+def reweight_batch(db, records, prompt_hash: str, config_hash: str) -> dict:
+    """一页中只需本地重新加权的辩论：批量计算，返回 {辩论id: 辩手最终得分}"""
+    items = []
+    for record in records:
+        existing = get_debate_score(db, record.id)
+        if existing and existing.config_hash != config_hash and existing.prompt_hash == prompt_hash \
+                and existing.speech_scores:
+            items.append((record.id, [SpeechScoreResult(**s) for s in existing.speech_scores]))
+    return reweight_many(items, build_debate_config("", {}))
+
+
+@dataclass
+class RescorePlan:
+    """重算一场辩论所需的数据（从数据库读出后与会话无关）"""
+    mode: str  # skipped / local / llm
+    record_id: int = 0
+    topic: str = ""
+    mbti_config: Dict[str, str] = field(default_factory=dict)
+    config: object = None
+    old_comments: Dict[str, str] = field(default_factory=dict)
+    speech_inputs: List = field(default_factory=list)
+    speech_scores: List[SpeechScoreResult] = field(default_factory=list)
+    final_scores: Optional[dict] = None
+
+
+def plan_rescore(db, record: DebateHistory, prompt_hash: str, config_hash: str,
+                 reweighted: dict = None) -> RescorePlan:
+    """读取一场辩论并决定处理方式；只需本地重新加权时直接算出结果"""
+    existing = get_debate_score(db, record.id)
+    if existing and existing.config_hash == config_hash:
+        return RescorePlan("skipped")
+    plan = RescorePlan("llm", record.id, record.topic, record.mbti_config or {},
+                       build_debate_config(record.topic, record.mbti_config or {}),
+                       # 重算只更新分数和排名，保留已有的综合评语
+                       {d["debater_name"]: d.get("overall_comment", "") for d in (existing.final_scores or [])}
+                       if existing else {})
+    if existing and existing.prompt_hash == prompt_hash and existing.speech_scores:
+        plan.mode = "local"
+        plan.speech_scores = [SpeechScoreResult(**s) for s in existing.speech_scores]
+        plan.final_scores = (reweighted or {}).get(record.id) or \
+            reweight_many([(record.id, plan.speech_scores)], plan.config)[record.id]
+        return plan
+    if not record.mbti_config:
+        return RescorePlan("skipped")
+    plan.speech_inputs = load_speech_inputs(get_speeches(db, record.id), record)
+    if not plan.speech_inputs:
+        return RescorePlan("skipped")
+    return plan
+
+
+def save_rescore(db, plan: RescorePlan, prompt_hash: str, config_hash: str, cache: DBScoreCache):
+    """写入重算结果和新的评委分数缓存（不提交事务）"""
+    cache.commit(commit=False)
+    final_list = []
+    for s in plan.final_scores.values():
+        d = s.model_dump(mode="json")
+        d["overall_comment"] = plan.old_comments.get(s.debater_name, d["overall_comment"])
+        final_list.append(d)
+    save_debate_score(db, plan.record_id, prompt_hash, config_hash, final_list,
+                      [s.model_dump(mode="json") for s in plan.speech_scores], commit=False)
+
+
+async def rescore_debate(db, record: DebateHistory, prompt_hash: str, config_hash: str,
+                         cache: DBScoreCache, limiter: AsyncRateLimiter, reweighted: dict = None) -> str:
+    """重算一场辩论（不提交事务），返回 skipped / local / llm；数据库读写在线程中执行"""
+    plan = await asyncio.to_thread(plan_rescore, db, record, prompt_hash, config_hash, reweighted)
+    if plan.mode == "skipped":
+        return plan.mode
+    if plan.mode == "llm":
+        plan.final_scores, plan.speech_scores, _ = await score_debate(
+            plan.topic, plan.mbti_config, plan.speech_inputs, with_comments=False,
+            score_cache=cache, rate_limiter=limiter, config=plan.config
+        )
+    await asyncio.to_thread(save_rescore, db, plan, prompt_hash, config_hash, cache)
+    return plan.mode
+
+
+def load_page(db, last_id: int, batch_size: int):
+    """读取 last_id 之后的一页辩论，返回 (记录, 对应的id)；id 在此读出，之后提交或回滚时不再触发查询"""
+    records = db.query(DebateHistory).options(defer(DebateHistory.history)).filter(
+        DebateHistory.id > last_id
+    ).order_by(DebateHistory.id).limit(batch_size).all()
+    return records, [record.id for record in records]
+
+
+def start_checkpoint(db, job_name: str):
+    Base.metadata.create_all(bind=db.get_bind())
+    checkpoint = get_checkpoint(db, job_name)
+    db.commit()
+    remaining = db.query(func.count(DebateHistory.id)).filter(DebateHistory.id > checkpoint.last_id).scalar()
+    return checkpoint, checkpoint.last_id, checkpoint.processed, dict(checkpoint.state or {}), remaining
+
+
+async def run_rescore(batch_size: int = 20, max_rps: float = 2.0, max_batches: int = None,
+                      session_factory=SessionLocal):
+    prompt_hash, config_hash = config_fingerprint(build_debate_config("", {}))
+    job_name = f"{JOB_NAME}:{config_hash}"
+    limiter = AsyncRateLimiter(max_rps, burst=max(1, int(max_rps)))
+    # 提交后不过期对象：本页其余记录的字段仍可直接读取
+    db = session_factory(expire_on_commit=False)
+    try:
+        checkpoint, last_id, processed, state, remaining = await asyncio.to_thread(start_checkpoint, db, job_name)
+        counts = dict(state.get("counts", {"skipped": 0, "local": 0, "llm": 0, "failed": 0}))
+        total = processed + remaining
+        PROGRESS.clear()
+        PROGRESS.update(running=True, job_name=job_name, config_hash=config_hash, total=total,
+                        processed=processed, counts=counts, rate=0.0, eta_seconds=None,
+                        started_at=datetime.utcnow().isoformat())
+        cache = DBScoreCache(db)
+        started = time.monotonic()
+        processed_this_run = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            records, ids = await asyncio.to_thread(load_page, db, last_id, batch_size)
+            if not records:
+                break
+            try:
+                reweighted = await asyncio.to_thread(reweight_batch, db, records, prompt_hash, config_hash)
+            except Exception as e:
+                reweighted = {}
+                logger.warning(f"批量重新加权失败，改为逐场计算: {e}")
+            for record, record_id in zip(records, ids):
+                try:
+                    mode = await rescore_debate(db, record, prompt_hash, config_hash, cache, limiter, reweighted)
+                    await asyncio.to_thread(db.commit)
+                    counts[mode] += 1
+                except Exception as e:
+                    # 回滚本场的写入，会话恢复可用，同页的其他辩论继续重算
+                    await asyncio.to_thread(db.rollback)
+                    counts["failed"] += 1
+                    logger.error(f"辩论 {record_id} 重算失败，已跳过: {e}", exc_info=True)
+            last_id = ids[-1]
+            processed += len(records)
+            processed_this_run += len(records)
+            await asyncio.to_thread(save_checkpoint, db, checkpoint, last_id, processed, {"counts": counts})
+            batches += 1
+            elapsed = time.monotonic() - started
+            rate = processed_this_run / elapsed if elapsed else 0.0
+            eta = (total - processed) / rate if rate else None
+            PROGRESS.update(processed=processed, counts=dict(counts), rate=round(rate, 3),
+                            eta_seconds=round(eta, 1) if eta is not None else None,
+                            cache_hits=cache.hits, cache_misses=cache.misses)
+            logger.info(f"重算进度 {processed}/{total}，{rate:.2f} 场/秒，"
+                        f"预计剩余 {eta or 0:.0f} 秒，统计 {counts}，缓存命中 {cache.hits}/{cache.hits + cache.misses}")
+        return dict(PROGRESS)
+    finally:
+        PROGRESS["running"] = False
+        await asyncio.to_thread(db.close)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="评分配置变化后批量重算已存储辩论的评分")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--max-rps", type=float, default=2.0, help="评委请求每秒上限")
+    parser.add_argument("--max-batches", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(run_rescore(args.batch_size, args.max_rps, args.max_batches))
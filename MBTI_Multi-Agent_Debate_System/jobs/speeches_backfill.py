@@ -0,0 +1,64 @@
+"""
+发言表迁移任务：把旧辩论记录中整段的 history JSON 按 id 顺序分批拆分写入 debate_speeches。
+每批的发言与检查点在同一事务中提交，任务被中断后重新运行即可从上次位置继续；已拆分过的辩论直接跳过。
+加 --clear-json 时拆分后清空原 history 字段，释放空间。
+
+用法: python -m jobs.speeches_backfill --batch-size 200 [--clear-json]
+"""
+import argparse
+import logging
+import time
+
+from user_database import SessionLocal, Base
+from user_database.models import DebateHistory
+from user_database.ratings import get_checkpoint, save_checkpoint
+from user_database.speeches import backfill_debate
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "speeches_backfill"
+
+
+def run_backfill(batch_size: int = 200, clear_json: bool = False, max_batches: int = None,
+                 session_factory=SessionLocal) -> int:
+    db = session_factory()
+    try:
+        Base.metadata.create_all(bind=db.get_bind())
+        checkpoint = get_checkpoint(db, JOB_NAME)
+        db.commit()
+        last_id, processed = checkpoint.last_id, checkpoint.processed
+        batches = 0
+        started = time.monotonic()
+        while max_batches is None or batches < max_batches:
+            records = db.query(DebateHistory).filter(
+                DebateHistory.id > last_id
+            ).order_by(DebateHistory.id).limit(batch_size).all()
+            if not records:
+                break
+            written = 0
+            for record in records:
+                try:
+                    # 发言全部转换成功后才写入，单场数据有误不影响同批的其他辩论
+                    written += backfill_debate(db, record, clear_json=clear_json)
+                except Exception as e:
+                    logger.error(f"辩论 {record.id} 发言拆分失败，已跳过: {e}", exc_info=True)
+            last_id = records[-1].id
+            processed += len(records)
+            save_checkpoint(db, checkpoint, last_id, processed)
+            batches += 1
+            elapsed = time.monotonic() - started
+            logger.info(f"已迁移到辩论 {last_id}，本批写入 {written} 条发言，累计 {processed} 场，"
+                        f"用时 {elapsed:.1f} 秒")
+        return processed
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="把辩论历史的 history JSON 迁移到发言表")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--clear-json", action="store_true", help="迁移后清空原 history 字段")
+    parser.add_argument("--max-batches", type=int, default=None)
+    args = parser.parse_args()
+    run_backfill(args.batch_size, args.clear_json, args.max_batches)
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -6,19 +6,25 @@ import logging
 
 import asyncio
 import json
+import os
+import secrets
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import JSONResponse
 
-from MBTI_Debate.judge_system.agents.judge_agent import JudgeAgent
-from MBTI_Debate.judge_system.config.dabate_config import DebateConfig
-from MBTI_Debate.judge_system.core.common import DifySpeechInput
-from MBTI_Debate.judge_system.scoring.dimension import ScoreAggregator
-from MBTI_Debate.judge_system.scoring.evaluator import Evaluator
-from user_database import SessionLocal, engine
-from user_database.crud import create_user, get_user_by_username, authenticate_user, \
-    create_debate_history_by_name, get_user_debate_history_by_name, \
-    create_advice_history_by_name, get_user_advice_history_by_name
+from MBTI_Debate.judge_system.scoring.pipeline import load_speech_inputs, score_debate, team_totals, \
+    build_debate_config, config_fingerprint, provisional_scores
+from user_database import SessionLocal, AsyncSessionLocal, engine, async_engine
+from user_database.async_crud import create_user, get_user_by_username, authenticate_user, \
+    get_user_debate_history_by_name, get_debate_transcripts, get_debate_summaries, get_user_advice_history_by_name, \
+    get_debate_history_by_id, get_advice_history_by_id
+from user_database.ratings import record_debate_result, get_leaderboard, get_pair_ratings
+from user_database.scores import DBScoreCache, get_debate_score, save_debate_score
+from user_database.speeches import get_speeches
+from user_database.pagination import decode_cursor, split_page, page_size, preview
+from user_database.write_behind import history_writer
+from jobs import rescore as rescore_job
 from user_database import Base
 
 from MBTI_Debate.constants import MBTI_TYPES
@@ -26,12 +32,19 @@ from MBTI_Debate.core.debate_engine import DebateEngine
 from MBTI_Debate.core.debate_manager import DebateManager
 
 from MBTI_Advice.agents.mbti_agent import MBTIAdviceAgent
-from MBTI_Advice.memory.conversation_memory import MBTIConversationMemory
-from user_database.models import AdviceHistory, DebateHistory
+from MBTI_Advice.agents.advice_runner import generate_advice_concurrently, stream_advice_concurrently
+from MBTI_Advice.agents.agent_pool import agent_pool
+from MBTI_Advice.llms.http_client import aclose_clients
+from MBTI_Advice.utils.metrics import advice_metrics
+from MBTI_Advice.utils.semantic_cache import advice_cache
+from MBTI_Advice.memory.conversation_memory import conversation_memory
+from MBTI_Advice.memory.summarizer import conversation_summarizer
+from user_database.models import DebateHistory, create_missing_indexes
 
 
 # 建表
 Base.metadata.create_all(bind=engine)
+create_missing_indexes(engine)
 
 app = FastAPI(
     title="MBTI思辩交互系统",
@@ -53,6 +66,36 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+prewarm_task = None
+
+
+@app.on_event("startup")
+async def prewarm_agent_pool():
+    # 后台预热全部MBTI类型的建议Agent，不阻塞服务启动；预热完成前的请求按需构建
+    global prewarm_task
+    prewarm_task = asyncio.create_task(asyncio.to_thread(agent_pool.prewarm))
+    # 历史记录后台批量写入
+    history_writer.start()
+
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    # 关闭自定义模型客户端（通义千问、讯飞星火）共享的连接池
+    await aclose_clients()
+
+
+@app.on_event("shutdown")
+async def flush_history_writer():
+    # 写完队列中尚未落库的历史记录（需在释放数据库连接池之前）
+    await history_writer.close()
+
+
+@app.on_event("shutdown")
+async def close_db_engine():
+    # 释放异步数据库连接池
+    await async_engine.dispose()
+
+
 # 定义数据模型
 class UserLoginRequest(BaseModel):
     user_name: str
@@ -74,11 +117,14 @@ class AdviceRequest(BaseModel):
     user_name: str
     question: str
     mbti_types: list[str]
+    use_agent: bool = None  # true 时使用ReAct Agent（多轮调用），默认走单次调用的快速路径
+    personalize: bool = True  # false 时不带对话历史；与问题无关的历史也不会带入，这类请求可直接命中相似问题的缓存回答
 
 
 class AdviceResponse(BaseModel):
     user_name: str
     responses: dict[str, str]
+    errors: dict[str, str] = {}  # 超时或失败的类型及原因（其余类型照常返回）
 
 
 # 辩论相关模型
@@ -88,6 +134,13 @@ class DebateRequest(BaseModel):
     mbti_config: dict[str, str]
 
 
+class DebateScoreRequest(BaseModel):
+    user_name: str
+    topic: str
+    ensemble: bool = False
+    comparative: bool = False
+
+
 class DebateResponse(BaseModel):
     user_name: str
     topic: str
@@ -112,8 +165,14 @@ def read_root():
     return {"欢迎使用": "MBTI思辩交互系统", "文档": "/docs"}
 
 
-# 数据库会话管理
-def get_db():
+# 数据库会话管理：异步会话，接口中的数据库读写不阻塞事件循环
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# 同步会话，供评分缓存、评级等同步模块使用
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
@@ -123,18 +182,18 @@ def get_db():
 
 # 用户认证相关API
 @app.post("/register", response_model=UserResponse)
-def user_register(request: UserRegisterRequest, db: Session = Depends(get_db)):
+async def user_register(request: UserRegisterRequest, db: AsyncSession = Depends(get_db)):
     """用户注册"""
-    if get_user_by_username(db, request.user_name):
+    if await get_user_by_username(db, request.user_name):
         raise HTTPException(status_code=400, detail="用户名已存在")
-    user = create_user(db, request.user_name, request.password)
+    user = await create_user(db, request.user_name, request.password)
     return UserResponse(msg="注册成功", user_id=user.id)
 
 
 @app.post("/login", response_model=UserResponse)
-def user_login(request: UserLoginRequest, db: Session = Depends(get_db)):
+async def user_login(request: UserLoginRequest, db: AsyncSession = Depends(get_db)):
     """用户登录"""
-    user = authenticate_user(db, request.user_name, request.password)
+    user = await authenticate_user(db, request.user_name, request.password)
     if not user:
         raise HTTPException(status_code=400, detail="用户名或密码错误")
     return UserResponse(msg="登录成功", user_id=user.id)
@@ -160,33 +219,72 @@ async def test_api():
 
 # 建议功能API
 @app.post("/advice", response_model=AdviceResponse)
-async def get_advice(request: AdviceRequest,db: Session = Depends(get_db)):
+async def get_advice(request: AdviceRequest):
     """获取MBTI建议（支持多选mbti类型）"""
     try:
         for mbti in request.mbti_types:
             if mbti not in MBTI_TYPES:
                 raise HTTPException(status_code=400, detail=f"无效的MBTI类型: {mbti}")
-        # 初始化对话记忆
-        memory = MBTIConversationMemory()
-        responses = {}
-        for mbti in request.mbti_types:
-            agent = MBTIAdviceAgent(mbti)
-            advice = agent.generate_advice(request.question, memory.get_history(request.user_name))
-            responses[mbti] = advice
-            memory.add_message(request.user_name, mbti, advice, is_user=False)
-        create_advice_history_by_name(
-            db=db,
+        # 共享的对话记忆（跨请求保留）：每个类型只带 摘要 + 与自己相关的最近对话
+        memory = conversation_memory
+        histories = await memory.aget_histories(request.user_name, request.mbti_types) if request.personalize else {}
+        # 所有类型并发生成，单个类型超时或失败时返回其余类型的结果
+        responses, errors = await generate_advice_concurrently(
+            request.mbti_types, request.question, use_agent=request.use_agent, histories=histories
+        )
+        if not responses:
+            raise HTTPException(status_code=504, detail={"msg": "所有MBTI类型的建议生成均失败", "errors": errors})
+        await memory.aadd_exchange(request.user_name, request.question, responses)
+        for mbti in responses:
+            # 后台刷新该类型的滚动摘要，不占用本次请求耗时
+            conversation_summarizer.schedule(request.user_name, mbti)
+        # 建议历史放入后台写入队列，不等待落库
+        await history_writer.add_advice(
             user_name=request.user_name,
             question=request.question,
             mbti_types=request.mbti_types,
             responses=responses
         )
-        return AdviceResponse(user_name=request.user_name, responses=responses)
+        return AdviceResponse(user_name=request.user_name, responses=responses, errors=errors)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"建议生成失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"建议生成失败: {str(e)}")
 
 
+@app.post("/advice/stream")
+async def stream_advice(request: AdviceRequest):
+    """流式获取MBTI建议：各类型并发生成，增量内容按类型标记合并为一个NDJSON流"""
+    for mbti in request.mbti_types:
+        if mbti not in MBTI_TYPES:
+            raise HTTPException(status_code=400, detail=f"无效的MBTI类型: {mbti}")
+    memory = conversation_memory
+    histories = await memory.aget_histories(request.user_name, request.mbti_types) if request.personalize else {}
+
+    async def advice_stream():
+        try:
+            async for event in stream_advice_concurrently(request.mbti_types, request.question, histories=histories):
+                if event["type"] == "complete" and event["responses"]:
+                    # 全部类型结束后写入对话记忆和建议历史
+                    responses = event["responses"]
+                    await memory.aadd_exchange(request.user_name, request.question, responses)
+                    for mbti in responses:
+                        conversation_summarizer.schedule(request.user_name, mbti)
+                    await history_writer.add_advice(
+                        user_name=request.user_name,
+                        question=request.question,
+                        mbti_types=request.mbti_types,
+                        responses=responses
+                    )
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"流式建议生成失败: {e}", exc_info=True)
+            yield json.dumps({"type": "error", "error": f"生成失败: {str(e)}"}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(advice_stream(), media_type="application/x-ndjson")
+
+
 @app.post("/advice/followup")
 async def get_followup_advice(request: dict):
     """获取追问建议（支持@MBTI类型，仅被@到的类型回复）"""
@@ -208,23 +306,46 @@ async def get_followup_advice(request: dict):
         targets = mbti_targets if mbti_targets else at_mbti
         if not targets:
             raise HTTPException(status_code=400, detail="未指定需要回复的MBTI类型")
-        # 初始化对话记忆
-        memory = MBTIConversationMemory()
-        responses = {}
-        for mbti in targets:
-            agent = MBTIAdviceAgent(mbti)
-            advice = agent.generate_advice(question, memory.get_history(user_name))
-            responses[mbti] = advice
-            memory.add_message(user_name, mbti, advice, is_user=False)
-        return {"user_name": user_name, "responses": responses}
+        # 共享的对话记忆，追问可以看到之前的对话（摘要 + 最近对话）
+        memory = conversation_memory
+        personalize = request.get("personalize", True)
+        histories = await memory.aget_histories(user_name, targets) if personalize else {}
+        responses, errors = await generate_advice_concurrently(targets, question, use_agent=request.get("use_agent"),
+                                                               histories=histories)
+        if not responses:
+            raise HTTPException(status_code=504, detail={"msg": "所有MBTI类型的建议生成均失败", "errors": errors})
+        await memory.aadd_exchange(user_name, question, responses)
+        for mbti in responses:
+            conversation_summarizer.schedule(user_name, mbti)
+        return {"user_name": user_name, "responses": responses, "errors": errors}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"追问建议生成失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"追问建议生成失败: {str(e)}")
 
 
+@app.get("/history/writer/stats")
+def get_history_writer_stats():
+    """历史记录后台写入队列的积压条数、已写入批次/行数和失败条数"""
+    return history_writer.stats()
+
+
+@app.get("/advice/metrics")
+def get_advice_metrics():
+    """各MBTI类型建议生成的耗时、LLM调用次数和token用量（按快速路径/Agent模式分别统计）"""
+    return advice_metrics.snapshot()
+
+
+@app.get("/advice/cache/stats")
+def get_advice_cache_stats():
+    """建议语义缓存的命中率、各类型条目数和节省的生成耗时"""
+    return advice_cache.stats()
+
+
 # 辩论功能API
 @app.post("/debate")
-async def start_debate(request: dict,db: Session = Depends(get_db)):
+async def start_debate(request: dict):
     topic = request.get("topic")
     mbti_config = request.get("mbti_config")
     user_name = request.get("user_name")
@@ -242,9 +363,10 @@ async def start_debate(request: dict,db: Session = Depends(get_db)):
 
     async def debate_stream():
         try:
-            history = []
-            for speech in engine.run_full_debate(free_debate_rounds=5):
-                history.append(speech)
+            # 辩论记录和每条发言放入后台写入队列，按批追加到发言表
+            record = await history_writer.start_debate(user_name, topic, mbti_config)
+            for seq, speech in enumerate(engine.run_full_debate(free_debate_rounds=5)):
+                await history_writer.add_speech(record, seq, speech, mbti_config)
 
                 # 发送发言开始信号
                 yield json.dumps({
@@ -272,16 +394,8 @@ async def start_debate(request: dict,db: Session = Depends(get_db)):
 
                 await asyncio.sleep(0.1)  # 发言间隔
 
-            # 辩论完成后保存历史记录
-            #history_records.append({"topic": topic, "mbti_config": mbti_config, "history": history})
-
-            create_debate_history_by_name(
-                db=db,
-                user_name=user_name,
-                topic=topic,
-                mbti_config=mbti_config,
-                history=history
-            )
+            # 完成前等待发言全部落库，随后的评分请求可以读到完整记录
+            await history_writer.flush()
             # 发送完成信号
             yield json.dumps({
                 "type": "complete",
@@ -296,152 +410,295 @@ async def start_debate(request: dict,db: Session = Depends(get_db)):
 
 
 # 修改历史记录获取接口
-@app.get("/history/debate")
-def get_debate_history(user_name: str, db: Session = Depends(get_db)):
-    """获取用户辩论历史记录"""
-    records = get_user_debate_history_by_name(db, user_name)
+DEBATE_DETAIL_FIELDS = ("id", "user_name", "topic", "mbti_config", "history", "speech_count", "created_at")
+ADVICE_DETAIL_FIELDS = ("id", "user_name", "question", "mbti_types", "responses", "created_at")
+
+
+def parse_fields(fields: str, allowed: tuple, default: tuple) -> set:
+    """解析逗号分隔的字段选择参数"""
+    if not fields:
+        return set(default)
+    selected = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = selected - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知字段: {', '.join(sorted(unknown))}")
+    return selected
+
+
+def parse_cursor(cursor: str):
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def debate_history_page(db: AsyncSession, user_name: str, limit: int, cursor: str):
+    """一页辩论历史摘要（不含发言内容），返回 (列表, 下一页游标)"""
+    limit = page_size(limit)
+    records = await get_user_debate_history_by_name(db, user_name, limit + 1, parse_cursor(cursor))
+    records, next_cursor = split_page(records, limit)
+    summaries = await get_debate_summaries(db, [record.id for record in records])
     return [{
         "id": record.id,
         "user_name": record.user_name,
         "topic": record.topic,
         "mbti_config": record.mbti_config,
-        "history": record.history,
+        "speech_count": summaries[record.id]["speech_count"],
+        "preview": summaries[record.id]["preview"],
+        "created_at": record.created_at.isoformat()
+    } for record in records], next_cursor
+
+
+async def advice_history_page(db: AsyncSession, user_name: str, limit: int, cursor: str):
+    """一页建议历史摘要（不含各类型的回答），返回 (列表, 下一页游标)"""
+    limit = page_size(limit)
+    records = await get_user_advice_history_by_name(db, user_name, limit + 1, parse_cursor(cursor),
+                                                    with_responses=False)
+    records, next_cursor = split_page(records, limit)
+    return [{
+        "id": record.id,
+        "user_name": record.user_name,
+        "question": preview(record.question),
+        "mbti_types": record.mbti_types,
         "created_at": record.created_at.isoformat()
-    } for record in records]
+    } for record in records], next_cursor
+
+
+# 历史记录列表只返回摘要，按游标分页；完整内容通过详情接口获取
+@app.get("/history/debate")
+async def get_debate_history(user_name: str, limit: int = 10, cursor: str = None, db: AsyncSession = Depends(get_db)):
+    """获取用户辩论历史记录（摘要），next_cursor 为空表示没有更多记录"""
+    items, next_cursor = await debate_history_page(db, user_name, limit, cursor)
+    return {"items": items, "next_cursor": next_cursor}
 
 @app.get("/history/debate/{record_id}")
-def get_debate_history_detail(record_id: int, db: Session = Depends(get_db)):
-    """获取辩论历史详情"""
-    record = db.query(DebateHistory).filter(DebateHistory.id == record_id).first()
+async def get_debate_history_detail(record_id: int, fields: str = None, stages: str = None,
+                                    db: AsyncSession = Depends(get_db)):
+    """获取辩论历史详情：fields 选择返回的字段（逗号分隔），stages 只返回指定环节的发言"""
+    selected = parse_fields(fields, DEBATE_DETAIL_FIELDS, ("id", "topic", "mbti_config", "history", "created_at"))
+    record = await get_debate_history_by_id(db, record_id)
     if not record:
         raise HTTPException(status_code=404, detail="记录不存在")
-    return {
+    result = {
         "id": record.id,
+        "user_name": record.user_name,
         "topic": record.topic,
         "mbti_config": record.mbti_config,
-        "history": record.history,
         "created_at": record.created_at.isoformat()
     }
+    if "history" in selected:
+        try:
+            stage_list = [s.strip() for s in stages.split(",") if s.strip()] if stages else None
+            result["history"] = (await get_debate_transcripts(db, [record.id], stage_list))[record.id]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if "speech_count" in selected:
+        result["speech_count"] = (await get_debate_summaries(db, [record.id]))[record.id]["speech_count"]
+    return {k: v for k, v in result.items() if k in selected}
 
 @app.get("/history/advice")
-def get_advice_history(user_name: str, db: Session = Depends(get_db)):
-    """获取用户建议历史记录"""
-    records = get_user_advice_history_by_name(db, user_name)
-    return [{
-        "id": record.id,
-        "user_name": record.user_name,
-        "question": record.question,
-        "mbti_types": record.mbti_types,
-        "responses": record.responses,
-        "created_at": record.created_at.isoformat()
-    } for record in records]
+async def get_advice_history(user_name: str, limit: int = 10, cursor: str = None, db: AsyncSession = Depends(get_db)):
+    """获取用户建议历史记录（摘要），next_cursor 为空表示没有更多记录"""
+    items, next_cursor = await advice_history_page(db, user_name, limit, cursor)
+    return {"items": items, "next_cursor": next_cursor}
 
 @app.get("/history/advice/{record_id}")
-def get_advice_history_detail(record_id: int, db: Session = Depends(get_db)):
-    """获取建议历史详情"""
-    record = db.query(AdviceHistory).filter(AdviceHistory.id == record_id).first()
+async def get_advice_history_detail(record_id: int, fields: str = None, db: AsyncSession = Depends(get_db)):
+    """获取建议历史详情：fields 选择返回的字段（逗号分隔）"""
+    selected = parse_fields(fields, ADVICE_DETAIL_FIELDS, ("id", "question", "mbti_types", "responses", "created_at"))
+    record = await get_advice_history_by_id(db, record_id, with_responses="responses" in selected)
     if not record:
         raise HTTPException(status_code=404, detail="记录不存在")
-    return {
-        "id": record.id,
-        "question": record.question,
-        "mbti_types": record.mbti_types,
-        "responses": record.responses,
-        "created_at": record.created_at.isoformat()
-    }
+    return {field: (record.created_at.isoformat() if field == "created_at" else getattr(record, field))
+            for field in ADVICE_DETAIL_FIELDS if field in selected}
 
 @app.get("/history")
-def get_all_history(user_name: str, db: Session = Depends(get_db)):
-    debate_history = get_user_debate_history_by_name(db, user_name)
-    advice_history = get_user_advice_history_by_name(db, user_name)
+async def get_all_history(user_name: str, limit: int = 10, debate_cursor: str = None, advice_cursor: str = None,
+                          db: AsyncSession = Depends(get_db)):
+    debate_history, debate_next = await debate_history_page(db, user_name, limit, debate_cursor)
+    advice_history, advice_next = await advice_history_page(db, user_name, limit, advice_cursor)
     return {
-        "debate_history": [{
-            "id": record.id,
-            "user_name": record.user_name,
-            "topic": record.topic,
-            "mbti_config": record.mbti_config,
-            "history": record.history,
-            "created_at": record.created_at.isoformat()
-        } for record in debate_history],
-        "advice_history": [{
-            "id": record.id,
-            "user_name": record.user_name,
-            "question": record.question,
-            "mbti_types": record.mbti_types,
-            "responses": record.responses,
-            "created_at": record.created_at.isoformat()
-        } for record in advice_history]
+        "debate_history": debate_history,
+        "debate_next_cursor": debate_next,
+        "advice_history": advice_history,
+        "advice_next_cursor": advice_next
     }
 
-@app.get("/debate_score/view")
-async def view_debate_score(user_name: str, topic: str, db: Session = Depends(get_db)):
-    record = db.query(DebateHistory).filter(DebateHistory.user_name==user_name, DebateHistory.topic==topic).order_by(DebateHistory.id.desc()).first()
+def latest_debate_record(db: Session, user_name: str, topic: str) -> DebateHistory:
+    record = db.query(DebateHistory).options(defer(DebateHistory.history)).filter(DebateHistory.user_name==user_name, DebateHistory.topic==topic).order_by(DebateHistory.id.desc()).first()
     if not record:
         raise HTTPException(status_code=404, detail="未找到对应辩论历史")
-    mbti_config = record.mbti_config
-    # 统一stage字段映射
-    stage_map = {
-        "立论": "OPENING",
-        "攻辩": "CROSS_EXAM",
-        "自由辩论": "FREE_DEBATE",
-        "总结": "SUMMARY",
-        "总结陈词": "SUMMARY"
-    }
-    speech_inputs = []
-    for s in record.history:
-        # 判断是否为标准格式
-        if all(k in s for k in ("debater_name", "mbti_type", "stage", "content", "speech_id")):
-            s["debater_name"] = s["debater_name"].strip().lower()
-            s["stage"] = stage_map.get(s["stage"], s["stage"])
-            speech_inputs.append(DifySpeechInput(**s))
-        else:
-            debater_name = (s.get("debater_name") or s.get("agent_id") or "").strip().lower()
-            mbti_type = s.get("mbti_type") or mbti_config.get(debater_name, "未知")
-            stage = s.get("stage")
-            stage = stage_map.get(stage, stage)
-            content = s.get("content")
-            speech_id = s.get("speech_id") or f"{debater_name}_{s.get('round', 1)}"
-            speech_inputs.append(DifySpeechInput(
-                debater_name=debater_name,
-                mbti_type=mbti_type,
-                stage=stage,
-                content=content,
-                speech_id=speech_id
-            ))
-    #print("所有speech_inputs的debater_name和mbti_type：", [(s.debater_name, s.mbti_type) for s in speech_inputs], flush=True)
-    # 评分遍历所有实际出现的stage
-    all_stages = set(s.stage for s in speech_inputs)
-    config = DebateConfig(
-        motion=topic,
-        pro_debaters=[k for k in mbti_config if k.startswith("pro")],
-        con_debaters=[k for k in mbti_config if k.startswith("opp")],
-        mbti_map=mbti_config
+    return record
+
+
+def debate_speech_inputs(db: Session, record: DebateHistory):
+    return load_speech_inputs(get_speeches(db, record.id), record)
+
+
+def load_debate_for_scoring(db: Session, user_name: str, topic: str):
+    """读取用户最近一场该辩题的辩论及其发言（同步查询，接口中放到线程中执行），返回 (记录, 发言)"""
+    record = latest_debate_record(db, user_name, topic)
+    return record, debate_speech_inputs(db, record)
+
+
+def save_score_and_rating(db: Session, record_id: int, topic: str, mbti_config: dict, final_scores: dict,
+                          speech_scores: list, score_cache: DBScoreCache, save_scores: bool):
+    """保存评分结果与新的评委分数缓存，并计入MBTI评级（同步写入，接口中放到线程中执行）"""
+    if save_scores:
+        try:
+            prompt_hash, config_hash = config_fingerprint(build_debate_config(topic, mbti_config))
+            score_cache.commit(commit=False)
+            save_debate_score(db, record_id, prompt_hash, config_hash,
+                              [s.model_dump(mode="json") for s in final_scores.values()],
+                              [s.model_dump(mode="json") for s in speech_scores])
+        except Exception as e:
+            db.rollback()
+            logger.error(f"评分结果保存失败: {e}", exc_info=True)
+    try:
+        pro_score, opp_score = team_totals(final_scores)
+        record_debate_result(db, record_id, mbti_config, pro_score, opp_score)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"评级更新失败: {e}", exc_info=True)
+
+
+def stored_score(db: Session, record: DebateHistory, topic: str):
+    """已保存且评分配置未变的评分结果，没有时返回 None"""
+    stored = get_debate_score(db, record.id)
+    _, config_hash = config_fingerprint(build_debate_config(topic, record.mbti_config))
+    if stored and stored.config_hash == config_hash and stored.final_scores:
+        return stored.final_scores
+    return None
+
+
+def score_view(final_scores, speech_scores=None, judge_calls=None) -> dict:
+    """评分结果的接口输出；final_scores 为辩手最终得分（对象或已保存的字典）"""
+    rows = [s if isinstance(s, dict) else s.model_dump(mode="json") for s in final_scores]
+    result = {"scores": [{
+        "debater_name": s["debater_name"],
+        "mbti_type": s["mbti_type"],
+        "total_score": s["total_score"],
+        "overall_comment": s["overall_comment"],
+        "rank": s["rank"]
+    } for s in rows]}
+    if speech_scores is not None:
+        # 集成/比较评分时附带每条发言各维度的分数（方差、采样数、环节内名次）
+        result["speech_scores"] = [s.model_dump() for s in speech_scores]
+        result["judge_calls"] = judge_calls
+    return result
+
+
+@app.post("/debate_score")
+async def score_debate_view(request: DebateScoreRequest, db: Session = Depends(get_sync_db)):
+    """对用户最近一场该辩题的辩论评分：保存评分结果并计入MBTI评级（每场辩论只计一次）"""
+    # 同步会话上的读写都放到线程中执行，不阻塞事件循环
+    record, speech_inputs = await asyncio.to_thread(load_debate_for_scoring, db, request.user_name, request.topic)
+    record_id, mbti_config = record.id, record.mbti_config
+    # 评委分数写入缓存，配置变化后批量重算时未变的维度可直接复用
+    score_cache = DBScoreCache(db)
+    detailed = request.ensemble or request.comparative
+    final_scores, speech_scores, evaluator = await score_debate(
+        request.topic, mbti_config, speech_inputs, ensemble=request.ensemble, comparative=request.comparative,
+        score_cache=score_cache
+    )
+    await asyncio.to_thread(save_score_and_rating, db, record_id, request.topic, mbti_config, final_scores,
+                            speech_scores, score_cache, not detailed)
+    return score_view(final_scores.values(), speech_scores if detailed else None,
+                      evaluator.calls_used if detailed else None)
+
+
+@app.get("/debate_score/view")
+async def view_debate_score(user_name: str, topic: str, ensemble: bool = False, comparative: bool = False,
+                            db: Session = Depends(get_sync_db)):
+    """查看评分（只读）：已保存且配置未变的评分直接返回；否则现场评分但不保存、不计入评级（保存用 POST /debate_score）"""
+    detailed = ensemble or comparative
+    record = await asyncio.to_thread(latest_debate_record, db, user_name, topic)
+    if not detailed:
+        stored = await asyncio.to_thread(stored_score, db, record, topic)
+        if stored:
+            return score_view(stored)
+    speech_inputs = await asyncio.to_thread(debate_speech_inputs, db, record)
+    # 只读取已有的评委分数缓存，新分数不落库
+    final_scores, speech_scores, evaluator = await score_debate(
+        topic, record.mbti_config, speech_inputs, ensemble=ensemble, comparative=comparative,
+        score_cache=DBScoreCache(db)
     )
-    judge_agents = [
-        JudgeAgent(f"Judge-{dim}", [dim], prompt_template=config.prompt_template) for dim in config.dimensions
-    ]
-    evaluator = Evaluator(judge_agents, config.dimensions, config.weights)
-    # 评分遍历所有实际出现的stage
-    async def evaluate_all_stages(speeches, stages):
-        results = []
-        tasks = [evaluator.evaluate_stage(speeches, stage) for stage in stages]
-        stage_results = await asyncio.gather(*tasks)
-        for r in stage_results:
-            results.extend(r)
-        # 自由辩论特殊处理
-        if "FREE_DEBATE" in stages:
-            free_results = await evaluator.evaluate_free_debate(speeches)
-            results.extend(free_results)
-        return results
-    speech_scores = await evaluate_all_stages(speech_inputs, all_stages)
-    aggregator = ScoreAggregator(config.dimensions, config.weights)
-    final_scores = await aggregator.aggregate_speech_scores_async(speech_scores, judge_agents[0])
-    return {"scores": [
-        {
+    return score_view(final_scores.values(), speech_scores if detailed else None,
+                      evaluator.calls_used if detailed else None)
+
+
+@app.get("/debate_score/provisional")
+async def view_provisional_debate_score(user_name: str, topic: str, db: Session = Depends(get_sync_db)):
+    """本地启发式临时评分：毫秒级返回，不调用评委，可在 /debate_score/view 完成前先行展示"""
+    record, speech_inputs = await asyncio.to_thread(load_debate_for_scoring, db, user_name, topic)
+    final_scores, speech_scores = await provisional_scores(topic, record.mbti_config, speech_inputs)
+    return {
+        "provisional": True,
+        "scores": [{
             "debater_name": s.debater_name,
             "mbti_type": s.mbti_type,
             "total_score": s.total_score,
-            "overall_comment": s.overall_comment,
             "rank": s.rank
-        } for s in final_scores.values()
-    ]}
\ No newline at end of file
+        } for s in final_scores.values()],
+        "speech_scores": [s.model_dump() for s in speech_scores]
+    }
+
+
+@app.get("/leaderboard")
+def get_leaderboard_view(limit: int = 16, db: Session = Depends(get_sync_db)):
+    """MBTI评级排行榜（直接读取物化评级表）"""
+    return {"leaderboard": [{
+        "mbti": r.mbti,
+        "rating": round(r.rating, 1),
+        "games": r.games,
+        "wins": r.wins,
+        "losses": r.losses,
+        "draws": r.draws,
+        "win_rate": round(r.wins / r.games, 3) if r.games else 0.0
+    } for r in get_leaderboard(db, limit)]}
+
+
+@app.get("/leaderboard/{mbti}")
+def get_pairing_leaderboard(mbti: str, db: Session = Depends(get_sync_db)):
+    """某个MBTI类型对阵其他类型的评级与战绩"""
+    mbti = mbti.upper()
+    if mbti not in MBTI_TYPES:
+        raise HTTPException(status_code=400, detail=f"无效的MBTI类型: {mbti}")
+    return {"mbti": mbti, "pairings": [{
+        "opponent_mbti": r.opponent_mbti,
+        "rating": round(r.rating, 1),
+        "games": r.games,
+        "wins": r.wins,
+        "losses": r.losses,
+        "draws": r.draws
+    } for r in get_pair_ratings(db, mbti)]}
+
+
+# 批量重算：评委维度/权重/prompt变化后在后台重算所有已存储辩论的评分
+rescore_task = None
+# 管理接口的访问令牌（请求头 X-Admin-Token）；未配置时管理接口禁用，只能用命令行 python -m jobs.rescore
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="管理接口未启用")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="管理令牌无效")
+
+
+@app.post("/admin/rescore", dependencies=[Depends(require_admin)])
+async def start_rescore(batch_size: int = 20, max_rps: float = 2.0):
+    """启动批量重算任务（已在运行时返回409）"""
+    global rescore_task
+    if rescore_task is not None and not rescore_task.done():
+        raise HTTPException(status_code=409, detail="重算任务正在运行")
+    # 在接口所在的事件循环中作为后台任务运行（评委客户端按事件循环共享）；任务的数据库读写都在线程中执行
+    rescore_task = asyncio.create_task(rescore_job.run_rescore(batch_size=batch_size, max_rps=max_rps))
+    return {"msg": "重算任务已启动"}
+
+
+@app.get("/admin/rescore/status", dependencies=[Depends(require_admin)])
+def get_rescore_status():
+    """重算进度：已处理/总数、各处理方式计数、吞吐量和预计剩余时间"""
+    return rescore_job.PROGRESS
@@ -0,0 +1,27 @@
+# 测试公共夹具
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from user_database.models import Base, User
+
+
+@pytest.fixture
+def async_db(tmp_path):
+    """临时 SQLite 数据库：open_db(*用户名) 在当前事件循环中建表、创建用户，返回异步会话工厂，退出时释放引擎"""
+    @asynccontextmanager
+    async def open_db(*user_names):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'history.db'}")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            async with factory() as db:
+                db.add_all([User(user_name=name, password="x") for name in user_names])
+                await db.commit()
+            yield factory
+        finally:
+            await engine.dispose()
+
+    return open_db
@@ -0,0 +1,115 @@
+import asyncio
+
+from MBTI_Advice.agents import advice_runner
+from MBTI_Advice.agents.advice_runner import generate_advice_concurrently, stream_advice_concurrently
+from MBTI_Advice.utils.metrics import AdviceMetrics
+
+
+class FakeAgent:
+    """按类型返回固定回答；started 记录所有类型都已开始生成（并发时才会全部到齐）"""
+
+    def __init__(self, mbti, started, behaviour):
+        self.mbti = mbti
+        self.started = started
+        self.behaviour = behaviour
+
+    async def agenerate_advice(self, question, history="", use_agent=None):
+        self.started.add(self.mbti)
+        action = self.behaviour.get(self.mbti)
+        if action == "error":
+            raise RuntimeError("upstream down")
+        if action == "hang":
+            await asyncio.sleep(10)
+        # 等到其他类型也开始生成后才返回：串行执行时会超时
+        while len(self.started) < len(self.behaviour):
+            await asyncio.sleep(0.01)
+        return f"{self.mbti}: {question} / {history}"
+
+
+def run(mbti_types, behaviour, **kwargs):
+    started = set()
+    return asyncio.run(generate_advice_concurrently(
+        mbti_types, "要不要换工作", "共同历史", agent_factory=lambda mbti: FakeAgent(mbti, started, behaviour),
+        **kwargs))
+
+
+def test_types_run_concurrently_with_per_type_history():
+    behaviour = {mbti: None for mbti in ("INTJ", "ENFP", "ISTJ")}
+    responses, errors = run(["INTJ", "ENFP", "INTJ", "ISTJ"], behaviour, timeout=2,
+                            histories={"ENFP": "ENFP的历史"})
+    assert errors == {}
+    assert list(responses) == ["INTJ", "ENFP", "ISTJ"]
+    assert responses["ENFP"] == "ENFP: 要不要换工作 / ENFP的历史"
+    assert responses["INTJ"] == "INTJ: 要不要换工作 / 共同历史"
+
+
+def test_failure_or_timeout_of_one_type_keeps_the_others():
+    behaviour = {"INTJ": None, "ENFP": "error", "ISTJ": "hang"}
+    responses, errors = run(list(behaviour), behaviour, timeout=2, timeouts={"ISTJ": 0.2})
+    assert list(responses) == ["INTJ"]
+    assert errors["ENFP"] == "生成失败: upstream down"
+    assert errors["ISTJ"] == "生成超时（0.2秒）"
+
+
+class StreamingAgent:
+    """流式返回预设的分段；"error" 表示输出一段后上游出错，cached 表示命中语义缓存"""
+
+    def __init__(self, chunks, cached=None, delay=0.0):
+        self.chunks = chunks
+        self.cached = cached
+        self.delay = delay
+        self.stored = None
+
+    def effective_history(self, question, history):
+        return history
+
+    def lookup_cached(self, question, history):
+        return self.cached
+
+    def store_cached(self, question, history, answer, latency):
+        self.stored = answer
+
+    async def astream_advice(self, question, history="", usage=None):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            if chunk == "error":
+                raise RuntimeError("upstream down")
+            yield chunk
+
+
+def collect_stream(agents, monkeypatch, **kwargs):
+    monkeypatch.setattr(advice_runner, "advice_metrics", AdviceMetrics())
+
+    async def main():
+        return [event async for event in stream_advice_concurrently(
+            list(agents), "要不要换工作", agent_factory=agents.get, **kwargs)]
+
+    return asyncio.run(main())
+
+
+def test_stream_multiplexes_personas_in_order(monkeypatch):
+    agents = {"INTJ": StreamingAgent(["先", "想", "清楚"], delay=0.05), "ENFP": StreamingAgent(["去", "试试"]),
+              "ISTJ": StreamingAgent([], cached="看看存款")}
+    events = collect_stream(agents, monkeypatch)
+    assert events[-1] == {"type": "complete", "errors": {},
+                          "responses": {"ENFP": "去试试", "ISTJ": "看看存款", "INTJ": "先想清楚"}}
+    for mbti, agent in agents.items():
+        own = [e for e in events if e.get("mbti") == mbti]
+        # 每个类型：开始 -> 增量 -> 完成，增量拼起来就是完整回复
+        assert own[0]["type"] == "persona_start" and own[-1]["type"] == "persona_complete"
+        assert "".join(e["content"] for e in own if e["type"] == "delta") == own[-1]["content"]
+    # 快的类型先完成，不等待慢的类型
+    completed = [e["mbti"] for e in events if e["type"] == "persona_complete"]
+    assert completed[-1] == "INTJ"
+    assert agents["INTJ"].stored == "先想清楚" and agents["ISTJ"].stored is None
+
+
+def test_stream_error_in_one_persona_does_not_stop_others(monkeypatch):
+    agents = {"INTJ": StreamingAgent(["一半", "error"]), "ENFP": StreamingAgent(["完整", "回答"], delay=0.02),
+              "ISTJ": StreamingAgent(["太慢"], delay=1)}
+    events = collect_stream(agents, monkeypatch, timeout=0.3)
+    errors = {e["mbti"]: e for e in events if e["type"] == "persona_error"}
+    assert errors["INTJ"]["error"] == "生成失败: upstream down" and errors["INTJ"]["partial"] == "一半"
+    assert errors["ISTJ"]["error"] == "生成超时（0.3秒）"
+    assert events[-1]["responses"] == {"ENFP": "完整回答"}
+    assert set(events[-1]["errors"]) == {"INTJ", "ISTJ"}
@@ -0,0 +1,59 @@
+import threading
+import time
+
+from MBTI_Advice.agents.agent_pool import MBTIAgentPool
+
+
+class Factory:
+    """记录构建次数的Agent工厂；构建较慢，便于观察并发请求是否只构建一次"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.built = []
+
+    def __call__(self, mbti):
+        time.sleep(self.delay)
+        self.built.append(mbti)
+        return object()
+
+
+def test_agents_are_reused_and_built_once_under_concurrency():
+    factory = Factory(delay=0.05)
+    pool = MBTIAgentPool(max_size=4, agent_factory=factory, version_fn=lambda mbti: "v1")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.get("INTJ"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert factory.built == ["INTJ"]
+    assert len({id(agent) for agent in results}) == 1
+    assert pool.get("INTJ") is results[0]
+    assert (pool.stats()["hits"], pool.stats()["misses"]) == (8, 1)
+
+
+def test_lru_eviction_and_config_change_rebuild():
+    factory = Factory()
+    versions = {"INTJ": "v1", "ENFP": "v1", "ISTJ": "v1"}
+    pool = MBTIAgentPool(max_size=2, agent_factory=factory, version_fn=versions.get)
+    intj = pool.get("INTJ")
+    pool.get("ENFP")
+    pool.get("INTJ")  # INTJ 刚用过，淘汰最久未用的 ENFP
+    pool.get("ISTJ")
+    assert pool.stats()["types"] == ["INTJ", "ISTJ"]
+    assert pool.get("INTJ") is intj
+    versions["INTJ"] = "v2"
+    assert pool.get("INTJ") is not intj
+    assert factory.built == ["INTJ", "ENFP", "ISTJ", "INTJ"]
+
+
+def test_prewarm_reports_failures():
+    def factory(mbti):
+        if mbti == "ENFP":
+            raise RuntimeError("缺少密钥")
+        return object()
+
+    pool = MBTIAgentPool(max_size=16, agent_factory=factory, version_fn=lambda mbti: "v1")
+    errors = pool.prewarm(["INTJ", "ENFP", "ISTJ"])
+    assert errors == {"ENFP": "缺少密钥"}
+    assert sorted(pool.stats()["types"]) == ["INTJ", "ISTJ"]
@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+from MBTI_Debate.judge_system.core.common import DebateStage, DifySpeechInput
+from MBTI_Debate.judge_system.scoring.evaluator import Evaluator
+
+DIMS = ["A", "B"]
+# 各辩手的真实水平：两两比较时水平高的一方胜出
+STRENGTH = {f"d{i}": i for i in range(6)}
+
+
+class FakeJudge:
+    """两两比较按 STRENGTH 判定胜负；锚点评分返回 anchor_scores 中的分数（None 表示调用失败）"""
+
+    def __init__(self, anchor_scores=None, fallback=None):
+        self.dimensions = DIMS
+        self.anchor_scores = anchor_scores or {}
+        self.fallback_scorer = object() if fallback is not None else None
+        self.fallback = fallback
+        self.prompts = []
+        self.single_calls = 0
+
+    async def call_deepseek_llm(self, prompt):
+        self.prompts.append(prompt)
+        # 按在提示词中出现的先后确定 A、B 两条发言
+        first, second = sorted((name for name in STRENGTH if name in prompt), key=prompt.index)
+        winner = "A" if STRENGTH[first] > STRENGTH[second] else "B"
+        return json.dumps({dim: winner for dim in DIMS})
+
+    def _extract_json(self, text):
+        return text
+
+    async def sample_score(self, speech, debate_info, dim, independent=False):
+        return self.anchor_scores.get(speech.debater, 5.0)
+
+    def fallback_score(self, speech, debate_info, dim):
+        return self.fallback
+
+    async def score_speech(self, speech, debate_info):
+        self.single_calls += 1
+        return {dim: 6.0 for dim in DIMS}
+
+
+def speeches(n=6):
+    # 按水平从低到高发言，排名应完全倒过来
+    return [DifySpeechInput(debater_name=f"d{i}", mbti_type="INTJ", stage=DebateStage.OPENING,
+                            content=f"d{i} 的发言", speech_id=f"s{i}")
+            for i in range(n)]
+
+
+def evaluate(judge, **kwargs):
+    evaluator = Evaluator([judge], DIMS, {d: 1.0 for d in DIMS}, comparative=True, comparative_group_size=2,
+                          motion="人工智能利大于弊", **kwargs)
+    return evaluator, asyncio.run(evaluator.evaluate_stage(speeches(), DebateStage.OPENING))
+
+
+def test_pairwise_ranking_orders_by_strength_and_uses_motion():
+    judge = FakeJudge({"d5": 9.0, "d0": 3.0})
+    evaluator, results = evaluate(judge)
+    assert [r.debater_name for r in results] == [f"d{i}" for i in reversed(range(6))]
+    assert [r.stage_rank for r in results] == list(range(1, 7))
+    assert results[0].dimension_scores[0].score == 9.0 and results[-1].dimension_scores[0].score == 3.0
+    assert all("辩题: 人工智能利大于弊" in prompt for prompt in judge.prompts)
+    # 同一对发言只比较一次，各维度共享结果；调用次数按实际结算
+    assert evaluator.calls_used == len(judge.prompts) + 2 * len(DIMS)
+    assert judge.single_calls == 0
+
+
+def test_failed_anchor_uses_fallback_score():
+    judge = FakeJudge({"d5": None, "d0": 3.0}, fallback=7.5)
+    _, results = evaluate(judge)
+    assert results[0].debater_name == "d5" and results[0].dimension_scores[0].score == 7.5
+
+
+def test_failed_anchor_without_fallback_scores_speeches_independently():
+    judge = FakeJudge({"d5": None})
+    _, results = evaluate(judge)
+    assert judge.single_calls == 6
+    assert {r.total_score for r in results} == {12.0}
+
+
+def test_budget_too_small_skips_pairwise_comparison():
+    judge = FakeJudge()
+    evaluator, results = evaluate(judge, comparative_call_budget=5)
+    assert judge.prompts == [] and evaluator.calls_used == 0
+    assert judge.single_calls == 6 and len(results) == 6
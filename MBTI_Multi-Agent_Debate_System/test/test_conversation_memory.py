@@ -0,0 +1,117 @@
+import asyncio
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import sessionmaker
+
+from MBTI_Advice.memory.conversation_memory import MBTIConversationMemory, USER_ROLE
+
+
+def make_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'memory.db'}")
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return engine, sessionmaker(bind=engine), statements
+
+
+def test_tables_created_on_first_use(tmp_path):
+    engine, factory, _ = make_factory(tmp_path)
+    memory = MBTIConversationMemory(session_factory=factory)
+    assert not inspect(engine).has_table("conversation_messages")
+    memory.add_message("u", "INTJ", "问题", is_user=True)
+    assert inspect(engine).has_table("conversation_messages")
+
+
+def test_cached_session_skips_database_until_revalidation(tmp_path):
+    _, factory, statements = make_factory(tmp_path)
+    memory = MBTIConversationMemory(session_factory=factory, revalidate_seconds=60)
+    memory.add_message("u", "INTJ", "要不要换工作", is_user=True)
+    memory.add_message("u", "INTJ", "先想清楚目标", is_user=False)
+    memory.get_history("u", persona="INTJ")
+    statements.clear()
+    history = memory.get_history("u", persona="INTJ")
+    assert history == "human: [用户] 要不要换工作\nai: [INTJ] 先想清楚目标"
+    assert statements == []
+
+
+def test_sees_writes_from_other_processes_after_revalidation(tmp_path):
+    _, factory, _ = make_factory(tmp_path)
+    ours = MBTIConversationMemory(session_factory=factory, revalidate_seconds=60)
+    other = MBTIConversationMemory(session_factory=factory, revalidate_seconds=60)
+    ours.add_message("u", "INTJ", "第一条", is_user=True)
+    other.add_message("u", "INTJ", "另一个进程写入", is_user=True)
+    assert "另一个进程写入" not in ours.get_history("u")
+    ours.revalidate_seconds = 0
+    assert "另一个进程写入" in ours.get_history("u")
+
+
+def test_interleaved_write_marks_session_stale(tmp_path):
+    _, factory, _ = make_factory(tmp_path)
+    ours = MBTIConversationMemory(session_factory=factory, revalidate_seconds=60)
+    other = MBTIConversationMemory(session_factory=factory, revalidate_seconds=60)
+    ours.add_message("u", "INTJ", "一", is_user=True)
+    other.add_message("u", "INTJ", "二", is_user=True)
+    ours.add_message("u", "INTJ", "三", is_user=True)
+    assert ours.get_history("u") == "human: [用户] 一\nhuman: [用户] 二\nhuman: [用户] 三"
+
+
+def test_failed_write_is_not_kept_with_made_up_id(tmp_path):
+    _, factory, _ = make_factory(tmp_path)
+    memory = MBTIConversationMemory(session_factory=factory)
+    memory.add_message("u", "INTJ", "保存成功", is_user=True)
+
+    def broken():
+        raise RuntimeError("database is locked")
+
+    memory.session_factory = broken
+    memory.add_message("u", "INTJ", "保存失败", is_user=True)
+    memory.session_factory = factory
+    assert memory.get_history("u") == "human: [用户] 保存成功"
+
+
+def test_async_helpers(tmp_path):
+    _, factory, _ = make_factory(tmp_path)
+    memory = MBTIConversationMemory(session_factory=factory)
+
+    async def main():
+        await memory.aadd_exchange("u", "周末去哪玩", {"INTJ": "博物馆", "ENFP": "露营"})
+        return await memory.aget_histories("u", ["INTJ", "ENFP"])
+
+    histories = asyncio.run(main())
+    assert histories["INTJ"] == f"human: [{USER_ROLE}] 周末去哪玩\nai: [INTJ] 博物馆"
+    assert histories["ENFP"] == f"human: [{USER_ROLE}] 周末去哪玩\nai: [ENFP] 露营"
+
+
+def test_messages_are_bounded(tmp_path):
+    _, factory, _ = make_factory(tmp_path)
+    memory = MBTIConversationMemory(session_factory=factory, max_messages=3, max_stored=4)
+    for i in range(5):
+        memory.add_message("u", "INTJ", f"消息{i}", is_user=True)
+    # 没有摘要时保留到 max_stored 条
+    fresh = MBTIConversationMemory(session_factory=factory, max_messages=3, max_stored=4)
+    assert fresh.get_history("u") == "\n".join(f"human: [用户] 消息{i}" for i in range(1, 5))
+
+
+def test_unsummarized_messages_survive_many_persona_rounds(tmp_path):
+    _, factory, _ = make_factory(tmp_path)
+    personas = ["INTJ", "ENFP", "ISTJ", "ESFP"]
+    memory = MBTIConversationMemory(session_factory=factory, max_messages=5)
+    # 每轮写入 1 条问题 + 4 条回答，三轮共 15 条，远超 max_messages
+    for n in range(3):
+        memory.add_exchange("u", f"问题{n}", {p: f"{p}回答{n}" for p in personas})
+    fresh = MBTIConversationMemory(session_factory=factory, max_messages=5)
+    for p in personas:
+        contents = [m[2] for m in fresh.messages_to_fold("u", p, keep_recent=0)]
+        assert contents == [c for n in range(3) for c in (f"问题{n}", f"{p}回答{n}")]
+    # 前两轮折叠进所有类型的摘要后，这些消息才被删除；只有部分类型摘要时用户消息仍保留
+    first_rounds = fresh.messages_to_fold("u", keep_recent=0)[9][0]
+    for p in personas[:-1]:
+        memory.set_summary("u", p, "摘要", first_rounds)
+    memory.add_exchange("u", "问题3", {})
+    remaining = [m[2] for m in MBTIConversationMemory(session_factory=factory).messages_to_fold("u", keep_recent=0)]
+    assert remaining[:2] == ["问题0", "ESFP回答0"] and "INTJ回答1" not in remaining
+    memory.set_summary("u", "ESFP", "摘要", first_rounds)
+    memory.add_exchange("u", "问题4", {})
+    remaining = [m[2] for m in MBTIConversationMemory(session_factory=factory).messages_to_fold("u", keep_recent=0)]
+    assert remaining == ["问题2"] + [f"{p}回答2" for p in personas] + ["问题3", "问题4"]
+    # 写入方的内存缓存同步删除
+    assert [m[2] for m in memory.messages_to_fold("u", keep_recent=0)] == remaining
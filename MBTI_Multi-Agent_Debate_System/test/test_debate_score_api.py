@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import main
+from MBTI_Debate.judge_system.core.common import DebaterFinalScore
+from user_database.models import Base, DebateHistory, DebateScore, MBTIRating, User
+
+CONFIG = {"pro1": "INTJ", "opp1": "ENFP"}
+HISTORY = [{"agent_id": "pro1", "stage": "立论", "round": 1, "content": "开篇立论，论据充分"},
+           {"agent_id": "opp1", "stage": "立论", "round": 1, "content": "反驳"}]
+
+
+def final(name, total, rank):
+    return DebaterFinalScore(debater_name=name, mbti_type=CONFIG[name], dimension_averages={},
+                             total_score=total, rank=rank, overall_comment="评语")
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'api.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add(User(user_name="u", password="x"))
+        db.add(DebateHistory(user_id=1, user_name="u", topic="辩题", mbti_config=CONFIG, history=HISTORY))
+        db.commit()
+    # 记录在事件循环线程上执行的数据库查询
+    state = {"queries_on_loop": 0, "calls": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record_thread(*args):
+        try:
+            asyncio.get_running_loop()
+            state["queries_on_loop"] += 1
+        except RuntimeError:
+            pass
+
+    async def fake_score_debate(topic, mbti_config, speech_inputs, **kwargs):
+        state["calls"] += 1
+        assert [s.debater_name for s in speech_inputs] == ["pro1", "opp1"]
+        return {"pro1": final("pro1", 30.0, 1), "opp1": final("opp1", 20.0, 2)}, [], None
+
+    def get_test_db():
+        with factory() as db:
+            yield db
+
+    monkeypatch.setattr(main, "score_debate", fake_score_debate)
+    main.app.dependency_overrides[main.get_sync_db] = get_test_db
+    yield TestClient(main.app), factory, state
+    main.app.dependency_overrides.clear()
+
+
+def test_score_saves_result_and_view_reuses_it(api):
+    client, factory, state = api
+    params = {"user_name": "u", "topic": "辩题"}
+    assert client.get("/debate_score/view", params=params).status_code == 200
+    with factory() as db:
+        # 查看接口只读：不保存评分、不计入评级
+        assert db.query(DebateScore).count() == 0 and db.query(MBTIRating).count() == 0
+    response = client.post("/debate_score", json=params)
+    assert response.status_code == 200
+    assert [s["debater_name"] for s in response.json()["scores"]] == ["pro1", "opp1"]
+    with factory() as db:
+        assert db.get(DebateScore, 1) is not None
+        assert db.get(MBTIRating, "INTJ").wins == 1
+    # 已保存的评分直接返回，不再调用评委
+    assert client.get("/debate_score/view", params=params).json()["scores"][0]["total_score"] == 30.0
+    assert state["calls"] == 2
+    # 同步会话上的查询都不在事件循环所在的线程中执行
+    assert state["queries_on_loop"] == 0
+
+
+def test_unknown_debate_returns_404(api):
+    client, _, _ = api
+    params = {"user_name": "u", "topic": "不存在"}
+    assert client.post("/debate_score", json=params).status_code == 404
+    assert client.get("/debate_score/view", params=params).status_code == 404
+
+
+def test_provisional_score_uses_same_debate_lookup(api):
+    client, _, state = api
+    response = client.get("/debate_score/provisional", params={"user_name": "u", "topic": "辩题"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["provisional"] and {s["debater_name"] for s in body["scores"]} == {"pro1", "opp1"}
+    assert state["calls"] == 0 and state["queries_on_loop"] == 0
+    assert client.get("/debate_score/provisional", params={"user_name": "u", "topic": "不存在"}).status_code == 404
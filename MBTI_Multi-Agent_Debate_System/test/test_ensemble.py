@@ -0,0 +1,61 @@
+import asyncio
+
+from MBTI_Debate.judge_system.config.dabate_config import EnsembleConfig
+from MBTI_Debate.judge_system.core.common import DifySpeechInput, DebateStage
+from MBTI_Debate.judge_system.scoring.evaluator import Evaluator
+
+
+class FakeJudge:
+    """按 (辩手, 维度) 返回固定分数的评委；分数为None表示调用失败"""
+
+    def __init__(self, dimensions, scores, fallback=None):
+        self.dimensions = dimensions
+        self.scores = scores
+        self.fallback_scorer = object() if fallback is not None else None
+        self.fallback = fallback
+        self.calls = 0
+
+    async def sample_score(self, speech, debate_info, dim, independent=False):
+        self.calls += 1
+        return self.scores[(speech.debater, dim)]
+
+    def fallback_score(self, speech, debate_info, dim):
+        return self.fallback
+
+
+def _speeches():
+    return [DifySpeechInput(debater_name=name, mbti_type="INTJ", stage=DebateStage.OPENING,
+                            content=f"{name} 的立论", speech_id=name)
+            for name in ("pro1", "opp1")]
+
+
+def test_close_ranks_use_weighted_totals():
+    # 不加权时总分只差0.2（会被当作排名接近继续追加采样），按权重加权后相差很大
+    scores = {("pro1", "A"): 8.0, ("pro1", "B"): 5.0, ("opp1", "A"): 5.0, ("opp1", "B"): 8.2}
+    judge = FakeJudge(["A", "B"], scores)
+    ensemble = EnsembleConfig(min_samples=2, max_samples=5, disagreement_threshold=1.0, rank_margin=0.5)
+    evaluator = Evaluator([judge], ["A", "B"], {"A": 3.0, "B": 0.1}, ensemble=ensemble)
+    asyncio.run(evaluator.evaluate_stage(_speeches(), DebateStage.OPENING))
+    assert judge.calls == 8
+
+    judge = FakeJudge(["A", "B"], scores)
+    evaluator = Evaluator([judge], ["A", "B"], {"A": 1.0, "B": 1.0}, ensemble=ensemble)
+    asyncio.run(evaluator.evaluate_stage(_speeches(), DebateStage.OPENING))
+    assert judge.calls > 8
+
+
+def test_failed_dimension_uses_fallback_score():
+    scores = {("pro1", "A"): None, ("opp1", "A"): 7.0}
+    judge = FakeJudge(["A"], scores, fallback=3.4)
+    evaluator = Evaluator([judge], ["A"], {"A": 1.0}, ensemble=EnsembleConfig(rank_margin=0.0))
+    results = {r.speech_id: r for r in asyncio.run(evaluator.evaluate_stage(_speeches(), DebateStage.OPENING))}
+    failed = results["pro1"].dimension_scores[0]
+    assert (failed.score, failed.samples) == (3.4, 0)
+    assert results["opp1"].dimension_scores[0].score == 7.0
+
+
+def test_failed_dimension_without_fallback_scorer():
+    judge = FakeJudge(["A"], {("pro1", "A"): None, ("opp1", "A"): None})
+    evaluator = Evaluator([judge], ["A"], {"A": 1.0}, ensemble=EnsembleConfig(rank_margin=0.0))
+    results = asyncio.run(evaluator.evaluate_stage(_speeches(), DebateStage.OPENING))
+    assert [r.dimension_scores[0].score for r in results] == [5.0, 5.0]
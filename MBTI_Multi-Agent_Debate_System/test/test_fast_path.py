@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from MBTI_Advice.agents.mbti_agent import MBTIAdviceAgent
+from MBTI_Advice.config.settings import settings
+from MBTI_Advice.utils.metrics import AdviceMetrics
+from MBTI_Advice.utils.semantic_cache import SemanticAnswerCache
+from MBTI_Advice.agents import mbti_agent
+
+
+class CountingLLM(FakeListChatModel):
+    """按字符流式返回固定回答，记录收到的提示词"""
+    prompts: list = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages[0].content)
+        return super()._call(messages, stop, run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages[0].content)
+        yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages[0].content)
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+
+def make_agent(monkeypatch):
+    monkeypatch.setattr(settings, "ADVICE_USE_VECTOR_DB", False)
+    metrics = AdviceMetrics()
+    monkeypatch.setattr(mbti_agent, "advice_metrics", metrics)
+    monkeypatch.setattr(mbti_agent, "advice_cache", SemanticAnswerCache())
+    agent = MBTIAdviceAgent("INTJ")
+    agent.llm = CountingLLM(responses=["先列出目标，再评估风险"], prompts=[])
+    return agent, metrics
+
+
+def test_async_fast_path_makes_one_streaming_call(monkeypatch):
+    agent, metrics = make_agent(monkeypatch)
+
+    async def main():
+        chunks = [c async for c in agent.astream_advice("快速路径：要不要转行做设计", "human: [用户] 我是程序员")]
+        answer = await agent.agenerate_advice("快速路径：要不要转行做设计", "human: [用户] 我是程序员",
+                                              use_agent=False)
+        return chunks, answer
+
+    chunks, answer = asyncio.run(main())
+    # 逐段流式返回，拼起来就是完整回答
+    assert len(chunks) > 1 and "".join(chunks) == answer == "先列出目标，再评估风险"
+    assert len(agent.llm.prompts) == 2
+    prompt = agent.llm.prompts[0]
+    assert "对话历史:\nhuman: [用户] 我是程序员" in prompt and "要不要转行做设计" in prompt
+    # 快速路径不初始化 ReAct Agent
+    assert agent._agent is None
+    fast = metrics.snapshot()["INTJ"]["fast"]
+    assert (fast["requests"], fast["avg_llm_calls"], fast["errors"]) == (1, 1.0, 0)
+
+
+def test_sync_fast_path_and_error_metrics(monkeypatch):
+    agent, metrics = make_agent(monkeypatch)
+    assert agent.generate_advice("快速路径：周末怎么安排", use_agent=False) == "先列出目标，再评估风险"
+    assert len(agent.llm.prompts) == 1 and agent._agent is None
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(agent, "stream_advice", broken)
+    with pytest.raises(RuntimeError):
+        agent.generate_advice("快速路径：另一个问题", use_agent=False)
+    fast = metrics.snapshot()["INTJ"]["fast"]
+    assert (fast["requests"], fast["errors"]) == (2, 1)
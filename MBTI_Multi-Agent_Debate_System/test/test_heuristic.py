@@ -0,0 +1,84 @@
+import asyncio
+
+from MBTI_Debate.judge_system.agents.judge_agent import JudgeAgent
+from MBTI_Debate.judge_system.config.dabate_config import DebateConfig
+from MBTI_Debate.judge_system.core.common import DifySpeechInput, DebateStage
+from MBTI_Debate.judge_system.scoring.evaluator import Evaluator
+from MBTI_Debate.judge_system.scoring.heuristic import HeuristicScorer
+
+DIMENSIONS = DebateConfig(motion="", pro_debaters=[], con_debaters=[], mbti_map={}).dimensions
+LOGIC, EVIDENCE, MBTI, REBUTTAL = DIMENSIONS
+
+OPPONENT = "远程办公能够显著提升员工的工作效率，并且大幅降低企业的运营成本。"
+REPLY = ("对方辩友说远程办公能够显著提升员工的工作效率，然而这恰恰忽略了协作成本。"
+         "因为沟通链条变长，所以决策变慢。调查显示，超过40%的团队认为远程协作效率下降。")
+
+
+def test_features_are_normalized():
+    scorer = HeuristicScorer(DIMENSIONS)
+    features = scorer.features(REPLY, DebateStage.CROSS_EXAM, "ISTJ", [OPPONENT])
+    assert set(features) == {"length_fit", "logic", "evidence", "rebuttal", "quoting", "repetition", "style"}
+    assert all(0.0 <= v <= 1.0 for v in features.values())
+
+
+def test_quoting_opponent_raises_rebuttal_score():
+    scorer = HeuristicScorer(DIMENSIONS)
+    alone = scorer.score(REPLY, DebateStage.CROSS_EXAM, "ISTJ")
+    quoting = scorer.score(REPLY, DebateStage.CROSS_EXAM, "ISTJ", [OPPONENT])
+    assert quoting[REBUTTAL] > alone[REBUTTAL]
+    assert quoting[LOGIC] == alone[LOGIC]
+
+
+def test_mbti_style_and_repetition():
+    scorer = HeuristicScorer(DIMENSIONS)
+    styled = "我的论证框架逻辑严密，从前提出发进行演绎推理，层层推进，构建系统的论证。"
+    assert scorer.score(styled, DebateStage.FREE_DEBATE, "INTJ")[MBTI] > \
+        scorer.score(styled, DebateStage.FREE_DEBATE, None)[MBTI]
+    repeated = "远程办公效率高" * 30
+    assert scorer.features(repeated, DebateStage.OPENING)["repetition"] > 0.8
+    assert scorer.score(repeated, DebateStage.OPENING)[LOGIC] < scorer.score(REPLY * 4, DebateStage.OPENING)[LOGIC]
+
+
+def test_score_speeches_uses_other_side_as_opponents():
+    scorer = HeuristicScorer(DIMENSIONS)
+    speeches = [
+        DifySpeechInput(debater_name="pro1", mbti_type="ENTP", stage="攻辩", content=OPPONENT, speech_id="a"),
+        DifySpeechInput(debater_name="opp1", mbti_type="ISTJ", stage="攻辩", content=REPLY, speech_id="b"),
+    ]
+    results = {r.speech_id: r for r in scorer.score_speeches(speeches)}
+    rebuttal = {ds.dimension: ds.score for ds in results["b"].dimension_scores}[REBUTTAL]
+    assert rebuttal == scorer.score(REPLY, "攻辩", "ISTJ", [OPPONENT])[REBUTTAL]
+
+
+class _FailingLLM:
+    model_name = "fake"
+    temperature = 0.3
+
+    async def ainvoke(self, prompt, config=None):
+        raise RuntimeError("upstream down")
+
+
+def test_judge_fallback_receives_mbti_and_opponents():
+    # 评委调用失败时，兜底评分要拿到辩手的MBTI（发言未带时取自 mbti_map）和对方发言
+    scorer = HeuristicScorer(DIMENSIONS)
+    calls = []
+    features = scorer.features
+
+    def spy(content, stage, mbti_type=None, opponent_texts=()):
+        calls.append((content, mbti_type, list(opponent_texts)))
+        return features(content, stage, mbti_type, opponent_texts)
+
+    scorer.features = spy
+    judge = JudgeAgent("rebuttal", [REBUTTAL], DebateConfig.prompt_template, fallback_scorer=scorer)
+    judge.llm = _FailingLLM()
+    evaluator = Evaluator([judge], [REBUTTAL], {REBUTTAL: 1.0}, mbti_map={"opp1": "ISTJ"})
+    speeches = [
+        DifySpeechInput(debater_name="pro1", mbti_type="ENTP", stage="攻辩", content=OPPONENT, speech_id="a"),
+        DifySpeechInput(debater_name="opp1", mbti_type="未知", stage="攻辩", content=REPLY, speech_id="b"),
+    ]
+    results = asyncio.run(evaluator.evaluate_stage(speeches, "攻辩"))
+    reply_call = next(c for c in calls if c[0] == REPLY)
+    assert reply_call[1] == "ISTJ"
+    assert reply_call[2] == [OPPONENT]
+    reply_score = next(r for r in results if r.speech_id == "b").dimension_scores[0].score
+    assert reply_score == scorer.score(REPLY, "攻辩", "ISTJ", [OPPONENT])[REBUTTAL]
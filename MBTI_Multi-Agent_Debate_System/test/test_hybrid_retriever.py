@@ -0,0 +1,89 @@
+import math
+import os
+from collections import Counter
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+from MBTI_Advice.utils.hybrid_retriever import BM25_FILE, BM25Index, HybridRetriever, tokenize
+from MBTI_Advice.utils.local_index import LocalVectorIndex
+
+DOCS = [
+    ("INTJ 擅长制定长期战略规划", "INTJ"),
+    ("ENFP 热情外向，喜欢尝试新鲜事物", "ENFP"),
+    ("职业规划要结合兴趣和能力", None),
+    ("面对压力时先整理情绪，再分析问题", None),
+]
+
+
+def reference_bm25(texts, query, k1=1.5, b=0.75):
+    docs = [Counter(tokenize(t)) for t in texts]
+    avgdl = sum(sum(d.values()) for d in docs) / len(docs)
+    scores = []
+    for d in docs:
+        length = sum(d.values())
+        score = 0.0
+        for term, qtf in Counter(tokenize(query)).items():
+            df = sum(1 for other in docs if term in other)
+            if term not in d:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += qtf * idf * d[term] * (k1 + 1) / (d[term] + k1 * (1 - b + b * length / avgdl))
+        scores.append(score)
+    return scores
+
+
+def test_tokenize_words_and_chinese_bigrams():
+    assert tokenize("INTJ的职业规划, ok") == ["intj", "的职", "职业", "业规", "规划", "ok"]
+    assert tokenize("我") == ["我"]
+
+
+def test_bm25_matches_reference_formula():
+    texts = [t for t, _ in DOCS]
+    index = BM25Index()
+    for i, text in enumerate(texts[:2]):
+        index.add(i, text)
+    index.search("规划")  # 中途计算过一次权重，之后追加的文档需要重新计算
+    for i, text in enumerate(texts[2:], start=2):
+        index.add(i, text)
+    query = "职业规划 压力"
+    ids, scores = index.search(query, k=10)
+    expected = reference_bm25(texts, query)
+    assert ids.tolist() == sorted((i for i, s in enumerate(expected) if s > 0), key=lambda i: -expected[i])
+    assert scores.tolist() == pytest.approx([expected[i] for i in ids])
+    assert len(index.search("完全无关", k=10)[0]) == 0
+    allowed = np.array([True, True, False, True])
+    assert 2 not in index.search(query, k=10, allowed=allowed)[0].tolist()
+
+
+def make_index(path=None):
+    index = LocalVectorIndex(path)
+    index.add_documents([Document(page_content=text, metadata={"mbti": mbti} if mbti else {})
+                         for text, mbti in DOCS])
+    return index
+
+
+def test_retrieval_modes():
+    retriever = HybridRetriever(make_index())
+    assert retriever.search("战略规划", k=1, mode="keyword")[0][0].page_content == DOCS[0][0]
+    assert retriever.search("战略规划", k=1, mode="vector")[0][0].page_content == DOCS[0][0]
+    hybrid = [doc.page_content for doc in retriever.get_relevant_info("职业规划", k=2)]
+    assert hybrid[0] == DOCS[2][0]
+    # 指定类型时只返回该类型和通用资料
+    filtered = {doc.page_content for doc in retriever.get_relevant_info("热情 规划 压力", k=10, mbti_type="INTJ")}
+    assert DOCS[1][0] not in filtered
+
+
+def test_inverted_index_is_saved_and_synced_incrementally(tmp_path):
+    path = str(tmp_path / "kb")
+    index = make_index(path)
+    assert HybridRetriever(index).sync() == len(DOCS)
+    assert os.path.exists(os.path.join(path, BM25_FILE))
+    index.add_texts(["团队合作中要学会倾听"])
+    reopened = HybridRetriever(LocalVectorIndex(path))
+    assert reopened.bm25.doc_count == len(DOCS)
+    # 查询时发现有新文档，只补齐新增的部分
+    assert reopened.search("学会倾听", k=1, mode="keyword")[0][0].page_content == "团队合作中要学会倾听"
+    assert reopened.bm25.doc_count == len(DOCS) + 1
+    assert reopened.sync() == 0
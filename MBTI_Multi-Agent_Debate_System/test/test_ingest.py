@@ -0,0 +1,88 @@
+import json
+import os
+
+from MBTI_Advice.utils.ingest import MANIFEST_FILE, KnowledgeIngestor
+from MBTI_Advice.utils.local_index import LocalVectorIndex
+
+CAREER = "INTJ 擅长制定长期战略规划。适合科研、工程等需要独立思考的工作。\n\n他们重视效率和能力。"
+STRESS = "面对压力时先整理情绪，再分析问题。"
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def make_corpus(root):
+    write(os.path.join(root, "intj", "职业.md"), CAREER)
+    write(os.path.join(root, "通用.txt"), STRESS)
+    write(os.path.join(root, "忽略.json"), "{}")
+
+
+def ingestor(index, **kwargs):
+    return KnowledgeIngestor(index, workers=0, chunk_size=20, chunk_overlap=0, **kwargs)
+
+
+def live_texts(index):
+    allowed = index.allowed_mask()
+    return [text for i, text in index.iter_texts() if allowed is None or allowed[i]]
+
+
+def test_ingest_splits_and_tags_by_path(tmp_path):
+    data = str(tmp_path / "data")
+    make_corpus(data)
+    index = LocalVectorIndex(str(tmp_path / "kb"))
+    stats = ingestor(index).ingest(data)
+    assert (stats.files_seen, stats.files_ingested) == (2, 2)
+    assert stats.chunks == len(index) > 2
+    # 中文按句末标点切分，标点保留在句尾
+    assert all(len(t) <= 20 for t in live_texts(index))
+    assert "INTJ 擅长制定长期战略规划。" in live_texts(index)
+    sources = {index.get_document(i).metadata["source"]: index.get_document(i).metadata.get("mbti")
+               for i in range(len(index))}
+    assert sources == {os.path.join("intj", "职业.md"): "INTJ", "通用.txt": None}
+
+
+def test_reingest_skips_unchanged_and_replaces_changed_files(tmp_path):
+    data = str(tmp_path / "data")
+    make_corpus(data)
+    path = str(tmp_path / "kb")
+    ingestor(LocalVectorIndex(path)).ingest(data)
+    write(os.path.join(data, "通用.txt"), "遇到挫折时给自己一些休息时间。")
+    os.remove(os.path.join(data, "intj", "职业.md"))
+    # 重新打开索引和清单，相当于重新运行导入命令
+    index = LocalVectorIndex(path)
+    stats = ingestor(index).ingest(data)
+    assert (stats.files_skipped, stats.files_ingested, stats.files_removed) == (0, 1, 1)
+    assert live_texts(index) == ["遇到挫折时给自己一些休息时间。"]
+    stats = ingestor(index).ingest(data)
+    assert (stats.files_skipped, stats.files_ingested, stats.chunks) == (1, 0, 0)
+    with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+
+def test_interrupted_file_is_cleaned_up_and_reingested(tmp_path):
+    data = str(tmp_path / "data")
+    write(os.path.join(data, "通用.txt"), STRESS)
+    path = str(tmp_path / "kb")
+    index = LocalVectorIndex(path)
+    # 模拟上次导入中断：已写入部分片段，清单中只有未完成标记
+    index.add_texts(["残留的片段"])
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"path": os.path.join(os.path.abspath(data), "通用.txt"), "hash": "",
+                            "rows": [0, None]}) + "\n")
+    ingestor(LocalVectorIndex(path)).ingest(data)
+    assert live_texts(LocalVectorIndex(path)) == [STRESS]
+
+
+def test_thread_workers_match_inline_embedding(tmp_path):
+    data = str(tmp_path / "data")
+    make_corpus(data)
+    inline = LocalVectorIndex(str(tmp_path / "inline"))
+    ingestor(inline, batch_size=2).ingest(data)
+    threaded = LocalVectorIndex(str(tmp_path / "threaded"))
+    KnowledgeIngestor(threaded, workers=2, use_processes=False, batch_size=2, chunk_size=20,
+                      chunk_overlap=0).ingest(data)
+    assert live_texts(threaded) == live_texts(inline)
+    assert (threaded._vectors() == inline._vectors()).all()
@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from MBTI_Advice.llms import http_client
+from MBTI_Advice.llms.custom_qianwen import CustomQianWenChat
+from MBTI_Advice.llms.custom_spark import CustomChatSpark
+
+
+def sse(*events):
+    return "".join(f"data: {json.dumps(e, ensure_ascii=False)}\n\n" for e in events) + "data: [DONE]\n\n"
+
+
+async def with_transport(handler, body):
+    """把当前事件循环的共享连接池换成模拟服务，运行 body 后按应用关闭时的方式关闭连接池"""
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    http_client._async_clients[asyncio.get_running_loop()] = client
+    try:
+        return await body()
+    finally:
+        await http_client.aclose_clients()
+        assert client.is_closed
+
+
+def test_qwen_async_invoke_and_stream_share_the_loop_client(monkeypatch):
+    monkeypatch.setattr(http_client, "_backoff", lambda attempt: 0)
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        payload = json.loads(request.content)
+        if len(requests) == 1:
+            # 第一次请求临时失败，重试后成功
+            return httpx.Response(503, text="busy")
+        if payload["parameters"].get("incremental_output"):
+            assert request.headers["X-DashScope-SSE"] == "enable"
+            return httpx.Response(200, text=sse({"output": {"text": "先"}}, {"output": {"text": "想清楚"}}))
+        return httpx.Response(200, json={"output": {"text": "先想清楚"},
+                                         "usage": {"input_tokens": 5, "output_tokens": 3}})
+
+    llm = CustomQianWenChat(api_key="k", temperature=0.3)
+
+    async def body():
+        clients = {id(http_client.get_async_client()), id(http_client.get_async_client())}
+        result = await llm.ainvoke("要不要换工作")
+        chunks = [chunk.content async for chunk in llm.astream("要不要换工作")]
+        return clients, result, chunks
+
+    clients, result, chunks = asyncio.run(with_transport(handler, body))
+    assert len(clients) == 1
+    assert result.content == "先想清楚"
+    assert chunks == ["先", "想清楚"]
+    assert len(requests) == 3
+    assert requests[0].headers["Authorization"] == "Bearer k"
+
+
+def test_spark_stream_and_error_is_not_retried():
+    def handler(request):
+        payload = json.loads(request.content)
+        if payload["messages"][0]["content"] == "坏请求":
+            return httpx.Response(401, text="unauthorized")
+        assert payload["stream"] and payload["user"] == "app"
+        return httpx.Response(200, text=sse({"choices": [{"delta": {"content": "去"}}]},
+                                            {"choices": [{"delta": {"content": "试试"}}]}))
+
+    llm = CustomChatSpark(app_id="app", api_key="k", api_secret="s")
+
+    async def body():
+        chunks = [chunk.content async for chunk in llm.astream("周末去哪")]
+        with pytest.raises(http_client.LLMHTTPError, match="HTTP 401"):
+            await llm.ainvoke("坏请求")
+        return chunks
+
+    assert asyncio.run(with_transport(handler, body)) == ["去", "试试"]
+
+
+def test_each_event_loop_gets_its_own_client_and_shutdown_closes_it():
+    import main
+
+    async def open_client():
+        return http_client.get_async_client()
+
+    async def shutdown():
+        client = http_client.get_async_client()
+        await main.close_llm_clients()
+        return client, http_client.get_async_client()
+
+    first, second = asyncio.run(open_client()), asyncio.run(open_client())
+    assert first is not second
+    closed, reopened = asyncio.run(shutdown())
+    assert closed.is_closed and not reopened.is_closed
+    for client in (first, second, reopened):
+        asyncio.run(client.aclose())
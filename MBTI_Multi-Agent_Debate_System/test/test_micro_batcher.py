@@ -0,0 +1,109 @@
+import asyncio
+
+from MBTI_Debate.judge_system.agents.judge_agent import JudgeAgent
+from MBTI_Debate.judge_system.core.micro_batcher import MicroBatcher
+
+
+def make_dispatch(delays, batches):
+    """按输入对应的延迟完成，记录每批的输入"""
+    async def dispatch(items):
+        batches.append(list(items))
+
+        async def run(index, item):
+            await asyncio.sleep(delays.get(item, 0))
+            if item == "bad":
+                return index, ValueError(item)
+            return index, item.upper()
+
+        for coro in asyncio.as_completed([run(i, item) for i, item in enumerate(items)]):
+            yield await coro
+    return dispatch
+
+
+def test_flushes_when_batch_is_full():
+    async def main():
+        batches = []
+        batcher = MicroBatcher(make_dispatch({}, batches), max_batch_size=3, max_wait_ms=1000)
+        results = await asyncio.wait_for(asyncio.gather(*[batcher.submit(x) for x in "abc"]), 0.5)
+        assert results == ["A", "B", "C"]
+        assert batches == [["a", "b", "c"]]
+
+    asyncio.run(main())
+
+
+def test_flushes_after_max_wait():
+    async def main():
+        batches = []
+        batcher = MicroBatcher(make_dispatch({}, batches), max_batch_size=16, max_wait_ms=10)
+        results = await asyncio.gather(*[batcher.submit(x) for x in "ab"])
+        assert results == ["A", "B"]
+        assert batches == [["a", "b"]]
+        assert (batcher.batches_sent, batcher.items_sent) == (1, 2)
+
+    asyncio.run(main())
+
+
+def test_each_future_resolves_when_its_result_arrives():
+    async def main():
+        batcher = MicroBatcher(make_dispatch({"slow": 0.3}, []), max_batch_size=2, max_wait_ms=1000)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        slow = asyncio.ensure_future(batcher.submit("slow"))
+        fast = asyncio.ensure_future(batcher.submit("fast"))
+        assert await fast == "FAST"
+        assert loop.time() - started < 0.2
+        assert not slow.done()
+        assert await slow == "SLOW"
+
+    asyncio.run(main())
+
+
+def test_item_errors_are_isolated():
+    async def main():
+        batcher = MicroBatcher(make_dispatch({}, []), max_batch_size=2, max_wait_ms=1000)
+        results = await asyncio.gather(batcher.submit("bad"), batcher.submit("ok"), return_exceptions=True)
+        assert isinstance(results[0], ValueError)
+        assert results[1] == "OK"
+
+    asyncio.run(main())
+
+
+def test_missing_results_fail_instead_of_hanging():
+    async def main():
+        async def dispatch(items):
+            yield 0, "only-first"
+
+        batcher = MicroBatcher(dispatch, max_batch_size=2, max_wait_ms=1000)
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True), 0.5)
+        assert results[0] == "only-first"
+        assert isinstance(results[1], RuntimeError)
+
+    asyncio.run(main())
+
+
+def test_cancelled_requests_are_not_dispatched():
+    async def main():
+        batches = []
+        batcher = MicroBatcher(make_dispatch({}, batches), max_batch_size=16, max_wait_ms=20)
+        cancelled = asyncio.ensure_future(batcher.submit("x"))
+        kept = asyncio.ensure_future(batcher.submit("y"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        assert await kept == "Y"
+        assert batches == [["y"]]
+
+    asyncio.run(main())
+
+
+def test_judges_share_client_only_within_one_event_loop():
+    async def clients():
+        judges = [JudgeAgent(f"judge{i}", ["逻辑性"], "{content}", micro_batch=True) for i in range(2)]
+        return judges[0].llm, judges[1].llm, judges[0]._get_batcher()
+
+    first_a, first_b, first_batcher = asyncio.run(clients())
+    second_a, _, second_batcher = asyncio.run(clients())
+    assert first_a is first_b
+    # 另一个事件循环（如后台重算任务）使用自己的客户端和连接池
+    assert second_a is not first_a
+    assert second_batcher is not first_batcher
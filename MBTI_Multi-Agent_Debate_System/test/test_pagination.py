@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from user_database.async_crud import (get_debate_summaries, get_user_advice_history_by_name,
+                                      get_user_debate_history_by_name)
+from user_database.models import AdviceHistory, DebateHistory
+from user_database.pagination import decode_cursor, encode_cursor, page_size, preview, split_page
+from user_database.speeches import to_speech_row
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def test_cursor_round_trip_and_invalid_cursor():
+    cursor = encode_cursor(START, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (START, 42)
+    assert decode_cursor(None) is None
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_page_size_and_preview():
+    assert (page_size(None), page_size(0), page_size(-5), page_size(1000)) == (10, 10, 1, 100)
+    assert preview("  短文本 ") == "短文本"
+    assert preview("一" * 100, length=10) == "一" * 10 + "…"
+
+
+async def with_db(async_db, body):
+    async with async_db("u", "other") as factory:
+        async with factory() as db:
+            return await body(db)
+
+
+async def all_pages(fetch, limit):
+    seen, cursor = [], None
+    while True:
+        records = await fetch(limit + 1, decode_cursor(cursor))
+        records, cursor = split_page(records, limit)
+        seen.append([r.id for r in records])
+        if cursor is None:
+            return seen
+
+
+def test_debate_pages_cover_every_record_once(async_db):
+    async def body(db):
+        # 每两条记录时间相同：同一时间的记录按 id 倒序，翻页时不重复也不遗漏
+        for i in range(7):
+            db.add(DebateHistory(user_id=1, user_name="u", topic=f"辩题{i}", mbti_config={},
+                                 created_at=START + timedelta(minutes=i // 2)))
+        db.add(DebateHistory(user_id=2, user_name="other", topic="别人的", mbti_config={}, created_at=START))
+        await db.commit()
+        return await all_pages(lambda limit, before: get_user_debate_history_by_name(db, "u", limit, before), 3)
+
+    pages = asyncio.run(with_db(async_db, body))
+    assert pages == [[7, 6, 5], [4, 3, 2], [1]]
+
+
+def test_advice_pages_without_responses(async_db):
+    async def body(db):
+        for i in range(4):
+            db.add(AdviceHistory(user_id=1, user_name="u", question=f"问题{i}", mbti_types=["INTJ"],
+                                 responses={"INTJ": "回答"}, created_at=START))
+        await db.commit()
+        db.expunge_all()
+        pages = await all_pages(lambda limit, before: get_user_advice_history_by_name(
+            db, "u", limit, before, with_responses=False), 2)
+        records = await get_user_advice_history_by_name(db, "u", 1, with_responses=False)
+        return pages, "responses" in records[0].__dict__
+
+    pages, loaded = asyncio.run(with_db(async_db, body))
+    assert pages == [[4, 3], [2, 1]]
+    assert not loaded
+
+
+def test_summaries_from_speech_table_and_legacy_json(async_db):
+    async def body(db):
+        speeches = [{"agent_id": "pro1", "stage": "立论", "round": 1, "content": "开篇" * 60},
+                    {"agent_id": "opp1", "stage": "立论", "round": 1, "content": "反驳"}]
+        new = DebateHistory(user_id=1, user_name="u", topic="新", mbti_config={"pro1": "INTJ"}, created_at=START)
+        legacy = DebateHistory(user_id=1, user_name="u", topic="旧", mbti_config={}, history=speeches,
+                               created_at=START)
+        db.add_all([new, legacy])
+        await db.flush()
+        db.add_all([to_speech_row(new.id, seq, s, new.mbti_config) for seq, s in enumerate(speeches)])
+        await db.commit()
+        return await get_debate_summaries(db, [new.id, legacy.id])
+
+    summaries = asyncio.run(with_db(async_db, body))
+    expected = {"speech_count": 2, "preview": ("开篇" * 60)[:80] + "…"}
+    assert summaries == {1: expected, 2: expected}
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from user_database import ratings
+from user_database.models import Base, MBTIRating, MBTIPairRating
+from user_database.ratings import INITIAL_RATING, record_debate_result
+
+CONFIG = {"pro1": "INTJ", "opp1": "ENFP"}
+
+
+def make_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ratings.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def test_each_debate_counted_once(tmp_path):
+    factory = make_factory(tmp_path)
+    with factory() as db:
+        assert record_debate_result(db, 1, CONFIG, 30.0, 20.0)
+        assert not record_debate_result(db, 1, CONFIG, 30.0, 20.0)
+        winner, loser = db.get(MBTIRating, "INTJ"), db.get(MBTIRating, "ENFP")
+        assert (winner.games, winner.wins, loser.games, loser.losses) == (1, 1, 1, 1)
+        assert winner.rating > INITIAL_RATING > loser.rating
+        assert winner.rating - INITIAL_RATING == pytest.approx(INITIAL_RATING - loser.rating)
+        pair = db.get(MBTIPairRating, ("INTJ", "ENFP"))
+        assert (pair.games, pair.wins) == (1, 1)
+
+
+def test_concurrent_claim_of_same_debate_is_skipped(tmp_path, monkeypatch):
+    factory = make_factory(tmp_path)
+    with factory() as db:
+        assert record_debate_result(db, 1, CONFIG, 30.0, 20.0)
+    # 另一个请求在本请求检查之后、写入之前已计入同一场辩论
+    monkeypatch.setattr(ratings, "is_debate_rated", lambda db, debate_id: False)
+    with factory() as db:
+        assert not record_debate_result(db, 1, CONFIG, 30.0, 20.0)
+        assert db.get(MBTIRating, "INTJ").games == 1
+        with pytest.raises(IntegrityError):
+            record_debate_result(db, 1, CONFIG, 30.0, 20.0, commit=False)
+
+
+def test_concurrent_debates_do_not_lose_updates(tmp_path):
+    factory = make_factory(tmp_path)
+    debates = 8
+    errors = []
+
+    def rate(debate_id):
+        try:
+            with factory() as db:
+                record_debate_result(db, debate_id, CONFIG, 30.0, 20.0)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=rate, args=(i,)) for i in range(debates)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    with factory() as db:
+        winner, loser = db.get(MBTIRating, "INTJ"), db.get(MBTIRating, "ENFP")
+        assert (winner.games, winner.wins) == (debates, debates)
+        assert (loser.games, loser.losses) == (debates, debates)
+        # 零和：双方评级变化之和为 0，说明没有基于过期评级覆盖写入
+        assert winner.rating + loser.rating == pytest.approx(2 * INITIAL_RATING)
+
+
+def test_missing_rating_row_created_by_another_transaction(tmp_path):
+    factory = make_factory(tmp_path)
+    # 另一个事务在本事务读到"不存在"之后抢先创建了这一行：本事务的插入被忽略，不会主键冲突
+    with factory() as other:
+        other.add(MBTIRating(mbti="ENFP", rating=1600.0, games=1, wins=1, losses=0, draws=0))
+        other.commit()
+    with factory() as db:
+        ratings._insert_missing(db, MBTIRating, mbti="ENFP")
+        assert ratings._current_rating(db, MBTIRating, mbti="INTJ") == INITIAL_RATING
+        assert ratings._current_rating(db, MBTIRating, mbti="ENFP") == 1600.0
+        assert ratings._current_rating(db, MBTIPairRating, mbti="INTJ", opponent_mbti="ENFP") == INITIAL_RATING
+        db.commit()
+        assert db.get(MBTIRating, "ENFP").games == 1
@@ -0,0 +1,44 @@
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from jobs import rescore
+from user_database.models import Base, DebateHistory, DebateScore, User
+
+CONFIG = {"pro1": "INTJ", "opp1": "ENFP"}
+HISTORY = [{"agent_id": "pro1", "stage": "立论", "round": 1, "content": "开篇"},
+           {"agent_id": "opp1", "stage": "立论", "round": 1, "content": "反驳"}]
+
+
+def test_failed_debate_is_rolled_back_and_rest_of_page_continues(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rescore.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add(User(user_name="u", password="x"))
+        for i in range(4):
+            db.add(DebateHistory(user_id=1, user_name="u", topic=f"辩题{i}", mbti_config=CONFIG, history=HISTORY))
+        db.commit()
+
+    async def fake_score_debate(topic, mbti_config, speech_inputs, **kwargs):
+        return {}, [], None
+
+    save = rescore.save_debate_score
+
+    def failing_save(db, debate_id, *args, **kwargs):
+        if debate_id == 2:
+            # 本场写入时数据库报错（用户名重复），会话必须回滚后才能继续使用
+            db.add(User(user_name="u", password="x"))
+            db.flush()
+        return save(db, debate_id, *args, **kwargs)
+
+    monkeypatch.setattr(rescore, "score_debate", fake_score_debate)
+    monkeypatch.setattr(rescore, "save_debate_score", failing_save)
+    progress = asyncio.run(rescore.run_rescore(batch_size=10, max_rps=1000, session_factory=factory))
+    assert progress["counts"] == {"skipped": 0, "local": 0, "llm": 3, "failed": 1}
+    with factory() as db:
+        assert sorted(row.debate_id for row in db.query(DebateScore)) == [1, 3, 4]
+    # 检查点已保存：再次运行时没有剩余的辩论
+    progress = asyncio.run(rescore.run_rescore(batch_size=10, max_rps=1000, session_factory=factory))
+    assert progress["total"] == 4 and progress["counts"]["llm"] == 3
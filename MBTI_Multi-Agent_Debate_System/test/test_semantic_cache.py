@@ -0,0 +1,73 @@
+import pytest
+
+from MBTI_Advice.utils.semantic_cache import SemanticAnswerCache, canonical_question, depends_on_history
+
+# 同义改写：应当命中
+PARAPHRASES = [
+    ("帮我想想今天晚上吃什么", "帮我想想今晚吃什么"),
+    ("帮我想想今天晚上吃什么", "今天晚上吃什么好呢"),
+    ("我应该辞职吗", "我该不该辞职"),
+    ("我要不要换工作", "我应该换工作吗"),
+    ("怎么缓解工作压力", "如何缓解工作上的压力"),
+    ("周末去哪里玩比较好", "周末去哪玩好呢"),
+    ("怎样才能早睡早起", "如何做到早睡早起"),
+    ("我和室友吵架了怎么办", "跟室友吵架了该怎么办"),
+    ("如何提高学习效率", "怎么提高学习效率呢"),
+    ("工作和生活怎么平衡", "怎么平衡工作和生活"),
+]
+# 否定或换了关键内容的问题：不能命中
+DIFFERENT = [
+    ("我应该辞职吗", "我不应该辞职吗"),
+    ("我应该原谅他吗", "我不应该原谅他吗"),
+    ("我喜欢现在的工作", "我不喜欢现在的工作"),
+    ("我要不要换工作", "我要不要买房"),
+    ("帮我想想今天晚上吃什么", "帮我想想明天去哪玩"),
+    ("怎么缓解工作压力", "怎么缓解考试焦虑"),
+    ("我和室友吵架了怎么办", "我和男朋友吵架了怎么办"),
+    ("要不要考研", "要不要考公"),
+    ("如何提高学习效率", "如何提高工作效率"),
+    ("失恋了怎么走出来", "失业了怎么走出来"),
+    ("应该早点结婚吗", "应该晚点结婚吗"),
+]
+
+
+@pytest.mark.parametrize("cached, asked", PARAPHRASES)
+def test_paraphrases_hit(cached, asked):
+    cache = SemanticAnswerCache(enabled=True)
+    cache.store("INTJ", cached, "answer")
+    assert cache.lookup("INTJ", asked) is not None
+
+
+@pytest.mark.parametrize("cached, asked", DIFFERENT)
+def test_different_questions_miss(cached, asked):
+    cache = SemanticAnswerCache(enabled=True)
+    cache.store("INTJ", cached, "answer")
+    assert cache.lookup("INTJ", asked) is None
+
+
+def test_negated_question_does_not_overwrite_entry():
+    cache = SemanticAnswerCache(enabled=True)
+    cache.store("INTJ", "我应该辞职吗", "yes")
+    cache.store("INTJ", "我不应该辞职吗", "no")
+    assert cache.lookup("INTJ", "我该不该辞职")[0] == "yes"
+    assert cache.lookup("INTJ", "我不应该辞职吗")[0] == "no"
+
+
+def test_entries_are_per_type_and_expire():
+    cache = SemanticAnswerCache(enabled=True, ttl_seconds=0)
+    cache.store("INTJ", "要不要考研", "answer")
+    assert cache.lookup("ENFP", "要不要考研") is None
+    assert cache.lookup("INTJ", "要不要考研") is None
+
+
+def test_canonical_question_strips_question_frame():
+    assert canonical_question("请问我该不该辞职呢？") == "辞职"
+    assert canonical_question("我不应该辞职吗") == "不辞职"
+
+
+def test_depends_on_history():
+    history = "human: [USER] 我最近在考虑换工作\nai: [INTJ] 先想清楚你的长期目标"
+    assert not depends_on_history("今天晚上吃什么", "")
+    assert not depends_on_history("帮我想想今天晚上吃什么", history)
+    assert depends_on_history("我要不要换工作", history)
+    assert depends_on_history("那他会怎么看", history)
@@ -0,0 +1,169 @@
+import asyncio
+import statistics
+
+from common.singleflight import SingleFlight, coalesced_call
+from MBTI_Debate.judge_system.agents.judge_agent import JudgeAgent
+from MBTI_Debate.judge_system.config.dabate_config import DebateConfig, EnsembleConfig
+from MBTI_Debate.judge_system.core.common import DifySpeechInput, DebateStage
+from MBTI_Debate.judge_system.scoring.evaluator import Evaluator
+
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    """低温度的假评委模型：每次上游调用返回不同的分数，并记录调用次数"""
+    model_name = "fake"
+    temperature = 0.3
+
+    def __init__(self):
+        self.calls = 0
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name, "temperature": self.temperature}
+
+    async def ainvoke(self, prompt, config=None):
+        self.calls += 1
+        score = 5 + self.calls % 4
+        await asyncio.sleep(0.01)
+        return _Message(f'{{"score": {score}, "comment": "ok"}}')
+
+    async def astream(self, prompt, config=None):
+        self.calls += 1
+        score = 5 + self.calls % 4
+        for piece in ('{"score": ', str(score), ', "comment": "ok"}'):
+            await asyncio.sleep(0.005)
+            yield _Message(piece)
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.tokens = 0
+
+    async def acquire(self):
+        self.tokens += 1
+
+
+def make_judge(score_first=False, rate_limiter=None):
+    judge = JudgeAgent("logic", ["逻辑性"], DebateConfig.score_first_prompt_template if score_first
+                       else DebateConfig.prompt_template, score_first=score_first, rate_limiter=rate_limiter)
+    judge.llm = FakeLLM()
+    return judge
+
+
+def test_do_coalesces_concurrent_calls():
+    async def main():
+        flight = SingleFlight()
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*[flight.do("k", fn) for _ in range(5)])
+        assert results == [1] * 5
+        assert calls == 1
+        assert flight.stats()["coalesced"] == 4
+        # 上一次请求结束后，相同的键重新发起调用
+        assert await flight.do("k", fn) == 2
+
+    asyncio.run(main())
+
+
+def test_stream_broadcasts_to_late_subscribers():
+    async def main():
+        flight = SingleFlight()
+        calls = 0
+
+        async def factory():
+            nonlocal calls
+            calls += 1
+            for i in range(3):
+                await asyncio.sleep(0.005)
+                yield i
+
+        async def collect(delay):
+            await asyncio.sleep(delay)
+            return [chunk async for chunk in flight.stream("k", factory)]
+
+        results = await asyncio.gather(collect(0), collect(0.007))
+        assert results == [[0, 1, 2], [0, 1, 2]]
+        assert calls == 1
+
+    asyncio.run(main())
+
+
+def test_do_cancels_upstream_when_all_waiters_cancel():
+    async def main():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fn():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_high_temperature_is_not_coalesced():
+    async def main():
+        llm = FakeLLM()
+        llm.temperature = 0.9
+        results = await asyncio.gather(*[coalesced_call(llm, "p", lambda: llm.ainvoke("p")) for _ in range(3)])
+        assert llm.calls == 3
+        assert len({r.content for r in results}) > 1
+
+    asyncio.run(main())
+
+
+def test_rate_limiter_charged_once_per_upstream_call():
+    async def main():
+        limiter = CountingLimiter()
+        judge = make_judge(rate_limiter=limiter)
+        await asyncio.gather(*[judge.call_deepseek_llm("same prompt") for _ in range(4)])
+        assert judge.llm.calls == 1
+        assert limiter.tokens == 1
+
+        await asyncio.gather(*[judge.call_deepseek_llm("same prompt", coalesce=False) for _ in range(4)])
+        assert judge.llm.calls == 5
+        assert limiter.tokens == 5
+
+    asyncio.run(main())
+
+
+def _ensemble_speeches():
+    return [DifySpeechInput(debater_name=name, mbti_type="INTJ", stage=DebateStage.OPENING,
+                            content=f"{name} 的立论发言", speech_id=f"s{i}")
+            for i, name in enumerate(["pro1", "con1"])]
+
+
+def test_ensemble_samples_are_independent_calls():
+    # 集成评分的多次采样即使 prompt 相同、并发发出，也必须各自调用上游
+    for score_first in (False, True):
+        async def main():
+            judge = make_judge(score_first=score_first)
+            ensemble = EnsembleConfig(min_samples=5, max_samples=5, rank_margin=0.0, call_budget=100)
+            evaluator = Evaluator([judge], ["逻辑性"], {"逻辑性": 1.0}, ensemble=ensemble)
+            results = await evaluator.evaluate_stage(_ensemble_speeches(), DebateStage.OPENING)
+            assert evaluator.calls_used == 10
+            assert judge.llm.calls == 10
+            for result in results:
+                score = result.dimension_scores[0]
+                assert score.samples == 5
+                assert score.variance is not None and score.variance > 0
+
+        asyncio.run(main())
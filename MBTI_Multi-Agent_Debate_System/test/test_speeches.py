@@ -0,0 +1,83 @@
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from jobs.speeches_backfill import JOB_NAME, run_backfill
+from user_database.async_crud import get_debate_transcripts
+from user_database.models import Base, DebateHistory, DebateSpeech, JobCheckpoint, User
+
+CONFIG = {"pro1": "INTJ", "opp1": "ENFP"}
+HISTORY = [{"agent_id": "pro1", "stage": "立论", "round": 1, "content": "开篇"},
+           {"agent_id": "opp1", "stage": "立论", "round": 1, "content": "反驳"},
+           {"agent_id": "pro1", "stage": "总结陈词", "round": 1, "content": "总结"}]
+
+
+def make_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'speeches.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add(User(user_name="u", password="x"))
+        db.commit()
+    return factory
+
+
+def add_debates(factory, *histories):
+    with factory() as db:
+        records = [DebateHistory(user_id=1, user_name="u", topic="辩题", mbti_config=CONFIG, history=history)
+                   for history in histories]
+        db.add_all(records)
+        db.commit()
+        return [r.id for r in records]
+
+
+def transcripts(tmp_path, debate_ids, stages=None):
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'speeches.db'}")
+        try:
+            async with async_sessionmaker(engine)() as db:
+                return await get_debate_transcripts(db, debate_ids, stages, with_analysis=False)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def test_backfill_splits_history_and_resumes_from_checkpoint(tmp_path):
+    factory = make_factory(tmp_path)
+    bad = HISTORY + [{"agent_id": "opp1", "stage": "未知环节", "content": "?"}]
+    ids = add_debates(factory, HISTORY, bad, HISTORY)
+    assert run_backfill(batch_size=2, clear_json=True, session_factory=factory) == 3
+    with factory() as db:
+        counts = {i: db.query(DebateSpeech).filter_by(debate_id=i).count() for i in ids}
+        # 数据有误的辩论整场跳过，同批的其他辩论照常迁移
+        assert counts == {ids[0]: 3, ids[1]: 0, ids[2]: 3}
+        assert db.get(DebateHistory, ids[0]).history is None
+        assert db.get(JobCheckpoint, JOB_NAME).last_id == ids[2]
+    # 之后新增的辩论在下次运行时从检查点继续，已迁移的不会重复写入
+    new_id, = add_debates(factory, HISTORY)
+    assert run_backfill(batch_size=2, session_factory=factory) == 4
+    with factory() as db:
+        assert db.query(DebateSpeech).count() == 9
+        assert db.get(DebateHistory, new_id).history == HISTORY
+
+
+def test_stage_filter_on_migrated_and_legacy_debates(tmp_path):
+    factory = make_factory(tmp_path)
+    stale = HISTORY + [{"agent_id": "opp1", "stage": "攻辩", "round": 1, "content": "旧数据"}]
+    migrated, legacy = add_debates(factory, stale, HISTORY)
+    with factory() as db:
+        # 只迁移第一场；以发言表为准，残留的 history JSON 不应再被读取
+        db.add_all(DebateSpeech(debate_id=migrated, seq=i, agent_id=s["agent_id"], mbti=CONFIG[s["agent_id"]],
+                                stage={"立论": "OPENING", "总结陈词": "SUMMARY"}[s["stage"]], round=1,
+                                content=s["content"], analysis=[]) for i, s in enumerate(HISTORY))
+        db.commit()
+    result = transcripts(tmp_path, [migrated, legacy], ["总结陈词"])
+    assert [s["content"] for s in result[migrated]] == ["总结"]
+    assert result[legacy] == [HISTORY[2]]
+    # 已迁移的辩论在该环节没有发言时返回空列表，不回退到 history JSON
+    result = transcripts(tmp_path, [migrated, legacy], ["攻辩"])
+    assert result == {migrated: [], legacy: []}
+    assert [s["content"] for s in transcripts(tmp_path, [migrated])[migrated]] == ["开篇", "反驳", "总结"]
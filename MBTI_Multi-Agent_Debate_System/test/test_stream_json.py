@@ -0,0 +1,50 @@
+import json
+
+from MBTI_Debate.judge_system.core.stream_json import IncrementalJSONParser
+
+RESPONSE = '```json\n{"score": 8.5, "comment": "论点清晰，\\"论据\\"充分\\n结构完整", ' \
+           '"tags": ["逻辑", {"k": "}"}], "final": true, "extra": null}\n```'
+
+
+def feed_chars(parser, text):
+    completed = {}
+    for ch in text:
+        completed.update(parser.feed(ch))
+    return completed
+
+
+def test_char_by_char_matches_json_loads():
+    parser = IncrementalJSONParser()
+    completed = feed_chars(parser, RESPONSE)
+    expected = json.loads(RESPONSE[len("```json\n"):-len("\n```")])
+    assert parser.done
+    assert parser.fields == expected
+    assert completed == expected
+
+
+def test_score_available_before_rest_of_response():
+    parser = IncrementalJSONParser()
+    prefix = RESPONSE[:RESPONSE.index('"comment"')]
+    assert parser.feed(prefix) == {"score": 8.5}
+    assert not parser.done
+
+
+def test_partial_string_value():
+    parser = IncrementalJSONParser()
+    parser.feed('{"comment": "论点清晰，\\"论')
+    assert parser.current_key == "comment"
+    assert parser.partial_value("comment") == '论点清晰，"论'
+    # 截断在转义序列中间时去掉不完整的部分
+    parser.feed("据\\")
+    assert parser.partial_value("comment") == '论点清晰，"论据'
+    parser.feed('n结构"}')
+    assert parser.fields["comment"] == '论点清晰，"论据\n结构'
+    assert parser.partial_value("comment") == parser.fields["comment"]
+
+
+def test_scalar_ended_by_closing_brace():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"score":7}') == {"score": 7}
+    assert parser.done
+    # 对象结束后的内容不再解析
+    assert parser.feed(', "more": 1}') == {}
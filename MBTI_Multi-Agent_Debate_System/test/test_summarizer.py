@@ -0,0 +1,42 @@
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from MBTI_Advice.memory.conversation_memory import MBTIConversationMemory
+from MBTI_Advice.memory.summarizer import ConversationSummarizer
+
+PERSONAS = ["INTJ", "ENFP", "ISTJ", "ESFP"]
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt)
+        return f"摘要{len(self.prompts)}"
+
+
+def test_folds_messages_older_than_the_recent_window(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'memory.db'}")
+    memory = MBTIConversationMemory(session_factory=sessionmaker(bind=engine), max_messages=5)
+    llm = FakeLLM()
+    summarizer = ConversationSummarizer(memory, llm=llm, keep_recent=2, min_batch=2)
+    # 三轮共 15 条消息，超过 max_messages：最早一轮仍在，可以折叠进各类型的摘要
+    for n in range(3):
+        memory.add_exchange("u", f"问题{n}", {p: f"{p}回答{n}" for p in PERSONAS})
+
+    async def refresh_all():
+        return [await summarizer.refresh("u", p) for p in PERSONAS]
+
+    assert asyncio.run(refresh_all()) == [True] * len(PERSONAS)
+    for prompt, p in zip(llm.prompts, PERSONAS):
+        assert "[用户] 问题0" in prompt and f"[{p}] {p}回答0" in prompt and f"{p}回答1" in prompt
+        assert f"{p}回答2" not in prompt
+    # 折叠后的旧消息在下次写入时删除，历史中以摘要代替
+    memory.add_exchange("u", "问题3", {})
+    assert [m[2] for m in memory.messages_to_fold("u", keep_recent=0)] == \
+        ["问题2"] + [f"{p}回答2" for p in PERSONAS] + ["问题3"]
+    history = memory.get_history("u", persona="ENFP")
+    assert history.startswith("对话摘要: 摘要2") and "ENFP回答2" in history and "ENFP回答1" not in history
@@ -0,0 +1,120 @@
+import asyncio
+import os
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from MBTI_Advice.agents.mbti_agent import MBTIAdviceAgent
+from MBTI_Advice.config.settings import settings
+from MBTI_Advice.utils.local_index import DOCS_FILE, VECTORS_FILE, LocalVectorIndex
+from MBTI_Advice.utils.vector_db import MBTIVectorDB, MockVectorDB, shared_vector_db
+
+
+def test_agent_uses_local_knowledge_base_when_enabled(tmp_path, monkeypatch):
+    path = str(tmp_path / "kb")
+    index = LocalVectorIndex(path)
+    index.add_documents([Document(page_content="INTJ 适合在安静的环境中做长期规划", metadata={"mbti": "INTJ"})])
+    monkeypatch.setattr(settings, "ADVICE_USE_VECTOR_DB", True)
+    monkeypatch.setattr(settings, "VECTOR_DB_PATH", path)
+    agent = MBTIAdviceAgent("INTJ")
+    assert isinstance(agent.vector_db, MBTIVectorDB)
+    assert agent.vector_db.db_path == path
+    # 各类型的Agent共用同一份索引
+    assert MBTIAdviceAgent("ENFP").vector_db is agent.vector_db is shared_vector_db(path)
+    assert "长期规划" in agent._retrieve_context("INTJ 适合做长期规划吗")
+
+
+def test_async_stream_retrieves_context_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(settings, "ADVICE_USE_VECTOR_DB", False)
+    agent = MBTIAdviceAgent("INTJ")
+    seen = {}
+
+    def get_relevant_info(query, k=3, mbti_type=None):
+        try:
+            asyncio.get_running_loop()
+            seen["on_loop"] = True
+        except RuntimeError:
+            seen["on_loop"] = False
+        return [Document(page_content="参考资料")]
+
+    class FakeLLM:
+        temperature = 1.0
+
+        async def astream(self, prompt, config=None):
+            seen["prompt"] = prompt
+            yield "回答"
+
+    agent.vector_db.get_relevant_info = get_relevant_info
+    agent.llm = FakeLLM()
+
+    async def main():
+        return [chunk async for chunk in agent.astream_advice("要不要换工作")]
+
+    assert asyncio.run(main()) == ["回答"]
+    assert seen["on_loop"] is False
+    assert "参考资料" in seen["prompt"]
+
+
+def test_agent_uses_builtin_data_by_default(monkeypatch):
+    monkeypatch.setattr(settings, "ADVICE_USE_VECTOR_DB", False)
+    assert isinstance(MBTIAdviceAgent("INTJ").vector_db, MockVectorDB)
+
+
+TEXTS = [
+    ("INTJ 擅长制定长期战略规划", "INTJ"),
+    ("ENFP 热情外向，喜欢尝试新鲜事物", "ENFP"),
+    ("ISTJ 做事踏实，重视规则和细节", "ISTJ"),
+    ("面对压力时先整理情绪，再分析问题", None),
+]
+
+
+def make_index(path=None, **kwargs):
+    index = LocalVectorIndex(path, **kwargs)
+    index.add_documents([Document(page_content=text, metadata={"mbti": mbti} if mbti else {})
+                         for text, mbti in TEXTS])
+    return index
+
+
+def test_index_persists_and_reopens(tmp_path):
+    path = str(tmp_path / "kb")
+    index = make_index(path)
+    assert index.delete([1]) == 1
+    reopened = LocalVectorIndex(path)
+    assert len(reopened) == len(TEXTS)
+    docs = reopened.get_relevant_info("热情外向 新鲜事物", k=4)
+    # 已删除的文档不再返回
+    assert [d.page_content for d in docs].count(TEXTS[1][0]) == 0
+    assert reopened.search("长期战略规划", k=1)[0][0].page_content == TEXTS[0][0]
+
+
+def test_filter_by_mbti_keeps_general_documents():
+    index = make_index()
+    contents = {d.page_content for d in index.get_relevant_info("规划 压力 规则", k=10, mbti_type="intj")}
+    assert contents == {TEXTS[0][0], TEXTS[3][0]}
+
+
+def test_ivf_search_matches_brute_force():
+    rng = np.random.default_rng(0)
+    texts = ["".join(rng.choice(list("性格职业规划压力沟通情绪团队目标"), 12)) for _ in range(300)]
+    brute = LocalVectorIndex()
+    brute.add_texts(texts)
+    ivf = LocalVectorIndex(ivf_min_rows=100, nprobe=1000)
+    ivf.add_texts(texts)
+    assert ivf.maybe_build_ivf()
+    for query in texts[:20]:
+        assert ivf.search_ids(query, k=5)[0].tolist() == brute.search_ids(query, k=5)[0].tolist()
+
+
+def test_interrupted_write_is_truncated_on_open(tmp_path):
+    path = str(tmp_path / "kb")
+    index = make_index(path)
+    # 模拟写入中断：文档写了一半、向量多写了半行
+    with open(os.path.join(path, DOCS_FILE), "ab") as f:
+        f.write(b'{"text": "half')
+    with open(os.path.join(path, VECTORS_FILE), "ab") as f:
+        f.write(b"\0" * (2 * index.dim))
+    reopened = LocalVectorIndex(path)
+    assert len(reopened) == len(TEXTS)
+    assert os.path.getsize(os.path.join(path, VECTORS_FILE)) == len(TEXTS) * 4 * index.dim
+    reopened.add_texts(["新增的资料"])
+    assert LocalVectorIndex(path).search("新增的资料", k=1)[0][0].page_content == "新增的资料"
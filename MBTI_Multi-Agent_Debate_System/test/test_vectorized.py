@@ -0,0 +1,67 @@
+import asyncio
+import random
+
+import numpy as np
+import pytest
+
+from MBTI_Debate.judge_system.core.common import SingleScore, SpeechScoreResult
+from MBTI_Debate.judge_system.scoring.dimension import ScoreAggregator
+from MBTI_Debate.judge_system.scoring.vectorized import ScoreMatrix, aggregate
+
+DIMENSIONS = ["逻辑性", "说服力", "表达"]
+WEIGHTS = {"逻辑性": 0.5, "说服力": 0.3, "表达": 0.2}
+DEBATERS = [("pro1", "INTJ"), ("pro2", "ENFP"), ("opp1", "ISTJ"), ("opp2", "INFP")]
+
+
+def make_debate(rng, speeches=10):
+    results = []
+    for i in range(speeches):
+        name, mbti = DEBATERS[i % len(DEBATERS)]
+        # 部分维度有多个采样、部分维度缺失
+        scores = [SingleScore(dimension=dim, score=rng.choice([6.0, 7.5, 8.0, 8.25]))
+                  for dim in DIMENSIONS for _ in range(rng.randint(0, 2))]
+        results.append(SpeechScoreResult(speech_id=str(i), debater_name=name.upper() if i % 3 else name,
+                                         mbti_type=mbti, stage="立论", dimension_scores=scores,
+                                         total_score=0, average_score=0))
+    return results
+
+
+def test_matches_per_debate_aggregation():
+    rng = random.Random(7)
+    debates = {debate_id: make_debate(rng) for debate_id in ("a", "b", "c")}
+    matrix = ScoreMatrix.concat([ScoreMatrix.from_results(results, DIMENSIONS, debate_id)
+                                 for debate_id, results in debates.items()])
+    batched = aggregate(matrix, WEIGHTS).to_final_scores()
+    aggregator = ScoreAggregator(DIMENSIONS, WEIGHTS)
+    for debate_id, results in debates.items():
+        expected = asyncio.run(aggregator.aggregate_speech_scores_async(results, None, with_comments=False))
+        assert list(batched[debate_id]) == list(expected)
+        assert batched[debate_id] == expected
+
+
+def test_ties_keep_first_appearance_order():
+    results = [SpeechScoreResult(speech_id=str(i), debater_name=name, mbti_type=mbti, stage="立论",
+                                 dimension_scores=[SingleScore(dimension=dim, score=7.0) for dim in DIMENSIONS],
+                                 total_score=0, average_score=0) for i, (name, mbti) in enumerate(DEBATERS)]
+    result = aggregate(ScoreMatrix.from_results(results, DIMENSIONS), WEIGHTS)
+    assert result.ranks.tolist() == [1, 2, 3, 4]
+
+
+def test_variance_and_confidence_interval():
+    results = [SpeechScoreResult(speech_id=str(i), debater_name="pro1", mbti_type="INTJ", stage="立论",
+                                 dimension_scores=[SingleScore(dimension="逻辑性", score=score)],
+                                 total_score=0, average_score=0) for i, score in enumerate([6.0, 8.0])]
+    result = aggregate(ScoreMatrix.from_results(results, ["逻辑性"]), {"逻辑性": 1.0})
+    assert result.dimension_averages[0, 0] == 7.0
+    assert result.dimension_variances[0, 0] == 2.0
+    assert result.score_counts[0, 0] == 2
+    half_width = 1.96 * np.sqrt(2.0 / 2)
+    assert result.ci_low[0] == pytest.approx(7.0 - half_width)
+    assert result.ci_high[0] == pytest.approx(7.0 + half_width)
+
+
+def test_concat_rejects_different_dimensions():
+    rng = random.Random(0)
+    with pytest.raises(ValueError):
+        ScoreMatrix.concat([ScoreMatrix.from_results(make_debate(rng), DIMENSIONS),
+                            ScoreMatrix.from_results(make_debate(rng), DIMENSIONS[:2])])
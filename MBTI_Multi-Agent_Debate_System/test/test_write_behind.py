@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from user_database.models import AdviceHistory, DebateHistory, DebateSpeech
+from user_database.write_behind import HistoryWriter
+
+CONFIG = {"pro1": "INTJ", "opp1": "ENFP"}
+
+
+def speech(i, stage="立论"):
+    return {"agent_id": "pro1" if i % 2 == 0 else "opp1", "stage": stage, "round": 1, "content": f"发言{i}"}
+
+
+async def with_writer(async_db, body, **kwargs):
+    async with async_db("u") as factory:
+        writer = HistoryWriter(session_factory=factory, **kwargs)
+        await body(writer)
+        await writer.close()
+        async with factory() as db:
+            return {model.__name__: (await db.execute(select(func.count()).select_from(model))).scalar()
+                    for model in (DebateHistory, DebateSpeech, AdviceHistory)}, writer
+
+
+def test_write_through_assigns_debate_ids(async_db):
+    async def body(writer):
+        handle = await writer.start_debate("u", "辩题", CONFIG)
+        # 等待提交完成后即可拿到记录id
+        assert handle.id == 1
+        for i in range(3):
+            await writer.add_speech(handle, i, speech(i), CONFIG)
+        await writer.add_advice("u", "问题", ["INTJ"], {"INTJ": "回答"})
+
+    counts, writer = asyncio.run(with_writer(async_db, body, write_behind=False))
+    assert counts == {"DebateHistory": 1, "DebateSpeech": 3, "AdviceHistory": 1}
+    assert writer.stats()["cached_users"] == 1
+
+
+def test_write_behind_batches_debate_and_speeches_together(async_db):
+    async def body(writer):
+        handles = [await writer.start_debate("u", f"辩题{n}", CONFIG) for n in range(5)]
+        for handle in handles:
+            for i in range(4):
+                await writer.add_speech(handle, i, speech(i), CONFIG)
+        await writer.flush()
+        assert [h.id for h in handles] == [1, 2, 3, 4, 5]
+        # 25 次写操作在一批中提交（flush 请求触发写入，不必等到超时）
+        assert (writer.batches, writer.rows) == (1, 25)
+
+    counts, _ = asyncio.run(with_writer(async_db, body, flush_ms=1000))
+    assert counts == {"DebateHistory": 5, "DebateSpeech": 20, "AdviceHistory": 0}
+
+
+def test_unknown_user_is_skipped(async_db):
+    async def body(writer):
+        handle = await writer.start_debate("nobody", "辩题", CONFIG)
+        await writer.add_speech(handle, 0, speech(0), CONFIG)
+        await writer.add_advice("nobody", "问题", ["INTJ"], {})
+        await writer.flush()
+        assert handle.skipped and handle.id is None
+
+    counts, _ = asyncio.run(with_writer(async_db, body))
+    assert counts == {"DebateHistory": 0, "DebateSpeech": 0, "AdviceHistory": 0}
+
+
+def test_bad_row_does_not_drop_the_rest_of_the_batch(async_db):
+    async def body(writer):
+        handle = await writer.start_debate("u", "辩题", CONFIG)
+        await writer.add_speech(handle, 0, speech(0), CONFIG)
+        await writer.add_speech(handle, 1, speech(1, stage="未知环节"), CONFIG)
+        await writer.add_speech(handle, 2, speech(2), CONFIG)
+        await writer.flush()
+
+    counts, writer = asyncio.run(with_writer(async_db, body, flush_ms=1000))
+    assert counts == {"DebateHistory": 1, "DebateSpeech": 2, "AdviceHistory": 0}
+    assert writer.failed == 1
+
+
+def test_write_through_reports_failures_to_caller(async_db):
+    async def body(writer):
+        handle = await writer.start_debate("u", "辩题", CONFIG)
+        with pytest.raises(ValueError):
+            await writer.add_speech(handle, 0, speech(0, stage="未知环节"), CONFIG)
+
+    counts, writer = asyncio.run(with_writer(async_db, body, write_behind=False))
+    assert counts["DebateSpeech"] == 0
+    assert writer.failed == 1
@@ -1,5 +1,5 @@
 # 导出数据库相关类和函数
-from .db import engine, SessionLocal
+from .db import engine, SessionLocal, async_engine, AsyncSessionLocal
 from .models import Base, User, History
 from .crud import create_user, get_user_by_username, authenticate_user
 from .security import get_password_hash, verify_password
@@ -7,6 +7,8 @@ from .security import get_password_hash, verify_password
 __all__ = [
     'engine',
     'SessionLocal', 
+    'async_engine',
+    'AsyncSessionLocal',
     'Base',
     'User',
     'History',
@@ -0,0 +1,186 @@
+# 用户操作函数（异步版本，与 crud.py 一一对应，供异步接口使用，数据库读写不阻塞事件循环）
+import asyncio
+from datetime import datetime
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+
+from .models import User, DebateHistory, AdviceHistory, DebateSpeech
+from .pagination import keyset_filter, preview, PREVIEW_LENGTH
+from .security import get_password_hash, verify_password
+from .speeches import to_speech_row, speech_to_dict, speeches_query, group_speeches, stage_code, \
+    debates_with_speeches_query
+
+
+async def get_user_by_username(db: AsyncSession, user_name: str):
+    result = await db.execute(select(User).where(User.user_name == user_name).limit(1))
+    return result.scalars().first()
+
+
+async def create_user(db: AsyncSession, user_name: str, password: str):
+    # 密码哈希是CPU密集操作，放到线程中执行
+    password_hash = await asyncio.to_thread(get_password_hash, password)
+    user = User(user_name=user_name, password=password_hash)
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+
+async def authenticate_user(db: AsyncSession, user_name: str, password: str):
+    user = await get_user_by_username(db, user_name)
+    if not user:
+        return None
+    if not await asyncio.to_thread(verify_password, password, user.password):
+        return None
+    return user
+
+
+async def create_debate_record(db: AsyncSession, user_name: str, topic: str, mbti_config: dict):
+    """创建辩论记录（不含发言），发言随后用 append_debate_speech 逐条追加"""
+    user = await get_user_by_username(db, user_name)
+    if not user:
+        return None
+    db_history = DebateHistory(
+        user_id=user.id,
+        user_name=user_name,
+        topic=topic,
+        mbti_config=mbti_config,
+        created_at=datetime.utcnow()
+    )
+    db.add(db_history)
+    await db.commit()
+    return db_history
+
+
+async def append_debate_speech(db: AsyncSession, debate_id: int, seq: int, speech: dict, mbti_config: dict):
+    row = to_speech_row(debate_id, seq, speech, mbti_config)
+    db.add(row)
+    await db.commit()
+    return row
+
+
+async def create_debate_history_by_name(db: AsyncSession, user_name: str, topic: str, mbti_config: dict,
+                                        history: list):
+    """一次写入整场辩论：记录与全部发言在同一事务中提交"""
+    user = await get_user_by_username(db, user_name)
+    if not user:
+        return None
+    db_history = DebateHistory(
+        user_id=user.id,
+        user_name=user_name,
+        topic=topic,
+        mbti_config=mbti_config,
+        created_at=datetime.utcnow()
+    )
+    db.add(db_history)
+    await db.flush()
+    db.add_all([to_speech_row(db_history.id, seq, speech, mbti_config) for seq, speech in enumerate(history)])
+    await db.commit()
+    return db_history
+
+
+async def get_user_debate_history_by_name(db: AsyncSession, user_name: str, limit: int = 10,
+                                          before: Optional[Tuple[datetime, int]] = None):
+    """按时间倒序取 before 游标之后的 limit 条记录（走 (user_name, created_at, id) 组合索引）"""
+    # 旧数据的 history JSON 不随列表加载，发言通过 get_debate_transcripts 读取
+    query = select(DebateHistory).options(defer(DebateHistory.history)).where(
+        DebateHistory.user_name == user_name
+    )
+    if before is not None:
+        query = query.where(keyset_filter(DebateHistory, before))
+    result = await db.execute(query.order_by(
+        DebateHistory.created_at.desc(), DebateHistory.id.desc()
+    ).limit(limit))
+    return result.scalars().all()
+
+
+async def get_debate_summaries(db: AsyncSession, debate_ids: Iterable[int]) -> Dict[int, dict]:
+    """列表展示用的摘要：发言条数和第一条发言的开头，不读取完整发言"""
+    debate_ids = list(debate_ids)
+    if not debate_ids:
+        return {}
+    counts = dict((await db.execute(select(DebateSpeech.debate_id, func.count()).where(
+        DebateSpeech.debate_id.in_(debate_ids)).group_by(DebateSpeech.debate_id))).all())
+    # 多取一个字符，用于判断是否需要加省略号
+    firsts = dict((await db.execute(select(DebateSpeech.debate_id,
+                                           func.substr(DebateSpeech.content, 1, PREVIEW_LENGTH + 1)).where(
+        DebateSpeech.debate_id.in_(debate_ids), DebateSpeech.seq == 0))).all())
+    summaries = {i: {"speech_count": counts[i], "preview": preview(firsts.get(i))} for i in debate_ids if i in counts}
+    # 尚未迁移到发言表的旧记录从 history JSON 计算
+    missing = [i for i in debate_ids if i not in counts]
+    if missing:
+        for debate_id, history in (await get_debate_transcripts(db, missing, with_analysis=False)).items():
+            summaries[debate_id] = {"speech_count": len(history),
+                                    "preview": preview(history[0].get("content") if history else "")}
+    return summaries
+
+
+async def get_debate_transcripts(db: AsyncSession, debate_ids: Iterable[int], stages: Optional[Iterable[str]] = None,
+                                 with_analysis: bool = True) -> Dict[int, List[dict]]:
+    """批量读取多场辩论的发言（一次查询），尚未迁移到发言表的旧记录从 history JSON 读取"""
+    debate_ids = list(debate_ids)
+    if not debate_ids:
+        return {}
+    grouped = group_speeches((await db.execute(speeches_query(debate_ids, stages))).scalars())
+    transcripts = {i: [speech_to_dict(row, with_analysis) for row in grouped.get(i, [])] for i in debate_ids}
+    missing = [i for i in debate_ids if not grouped.get(i)]
+    if missing and stages:
+        # 按环节过滤后没有发言的辩论不一定是旧记录：发言表中有任何发言就说明已迁移，该环节确实没有发言
+        migrated = set((await db.execute(debates_with_speeches_query(missing))).scalars())
+        missing = [i for i in missing if i not in migrated]
+    if missing:
+        codes = {stage_code(s) for s in stages} if stages else None
+        result = await db.execute(select(DebateHistory.id, DebateHistory.history).where(
+            DebateHistory.id.in_(missing)))
+        for debate_id, history in result:
+            transcripts[debate_id] = [
+                s if with_analysis else {k: v for k, v in s.items() if k != "analysis"}
+                for s in history or [] if codes is None or stage_code(s.get("stage")) in codes
+            ]
+    return transcripts
+
+
+async def create_advice_history_by_name(db: AsyncSession, user_name: str, question: str, mbti_types: list,
+                                        responses: dict):
+    user = await get_user_by_username(db, user_name)
+    if not user:
+        return None
+    db_history = AdviceHistory(
+        user_id=user.id,
+        user_name=user_name,
+        question=question,
+        mbti_types=mbti_types,
+        responses=responses,
+        created_at=datetime.utcnow()
+    )
+    db.add(db_history)
+    await db.commit()
+    await db.refresh(db_history)
+    return db_history
+
+
+async def get_user_advice_history_by_name(db: AsyncSession, user_name: str, limit: int = 10,
+                                          before: Optional[Tuple[datetime, int]] = None,
+                                          with_responses: bool = True):
+    query = select(AdviceHistory).where(AdviceHistory.user_name == user_name)
+    if not with_responses:
+        query = query.options(defer(AdviceHistory.responses))
+    if before is not None:
+        query = query.where(keyset_filter(AdviceHistory, before))
+    result = await db.execute(query.order_by(
+        AdviceHistory.created_at.desc(), AdviceHistory.id.desc()
+    ).limit(limit))
+    return result.scalars().all()
+
+
+async def get_debate_history_by_id(db: AsyncSession, record_id: int):
+    return await db.get(DebateHistory, record_id, options=[defer(DebateHistory.history)])
+
+
+async def get_advice_history_by_id(db: AsyncSession, record_id: int, with_responses: bool = True):
+    options = [] if with_responses else [defer(AdviceHistory.responses)]
+    return await db.get(AdviceHistory, record_id, options=options)
@@ -2,6 +2,7 @@
 from sqlalchemy.orm import Session
 from .models import User, DebateHistory, AdviceHistory
 from .security import get_password_hash, verify_password
+from .speeches import to_speech_row
 from datetime import datetime
 
 def get_user_by_username(db: Session, user_name: str):
@@ -31,10 +32,12 @@ def create_debate_history_by_name(db: Session, user_name: str, topic: str, mbti_
         user_name=user_name,
         topic=topic,
         mbti_config=mbti_config,
-        history=history,
         created_at=datetime.utcnow()
     )
     db.add(db_history)
+    db.flush()
+    # 发言逐条写入发言表
+    db.add_all([to_speech_row(db_history.id, seq, speech, mbti_config) for seq, speech in enumerate(history)])
     db.commit()
     db.refresh(db_history)
     return db_history
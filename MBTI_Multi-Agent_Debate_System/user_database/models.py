@@ -1,9 +1,16 @@
-from sqlalchemy import ForeignKey, Column, Integer, String, Text, JSON, DateTime
+from sqlalchemy import ForeignKey, Column, Integer, String, Text, JSON, DateTime, Float, Index, Enum
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
 Base = declarative_base()
 
+
+def create_missing_indexes(bind):
+    """create_all 只建新表，已存在的表上后来新增的索引在这里补建"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -31,6 +38,34 @@ class DebateHistory(Base):
     history = Column(JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # 历史列表按用户分页（keyset）：WHERE user_name=? AND (created_at, id) < 游标 ORDER BY created_at DESC, id DESC
+    __table_args__ = (Index("ix_debate_history_user_name_created_at_id", "user_name", "created_at", "id"),)
+
+
+# 辩论环节（存储统一使用英文代码，接口输出时换回中文名称）
+SPEECH_STAGES = ("OPENING", "CROSS_EXAM", "FREE_DEBATE", "SUMMARY")
+
+
+# 辩论发言：每条发言一行，按 (debate_id, seq) 顺序读取；新辩论逐条追加，不再写入 DebateHistory.history
+class DebateSpeech(Base):
+    __tablename__ = "debate_speeches"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    debate_id = Column(Integer, ForeignKey("debate_history.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    agent_id = Column(String(16), nullable=False)
+    mbti = Column(String(4))
+    stage = Column(Enum(*SPEECH_STAGES, name="debate_stage", native_enum=False), nullable=False)
+    round = Column(Integer)
+    content = Column(Text, nullable=False)
+    analysis = Column(JSON)
+
+    __table_args__ = (
+        Index("ix_debate_speeches_debate_id_seq", "debate_id", "seq", unique=True),
+        Index("ix_debate_speeches_debate_id_stage", "debate_id", "stage"),
+        Index("ix_debate_speeches_mbti_stage", "mbti", "stage"),
+    )
+
 
 class AdviceHistory(Base):
     __tablename__ = "advice_history"
@@ -41,4 +76,100 @@ class AdviceHistory(Base):
     question = Column(Text)
     mbti_types = Column(JSON)
     responses = Column(JSON)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_advice_history_user_name_created_at_id", "user_name", "created_at", "id"),)
+
+
+# MBTI 评级（物化表）：每场辩论评分后增量更新，排行榜直接读取
+class MBTIRating(Base):
+    __tablename__ = "mbti_ratings"
+
+    mbti = Column(String(4), primary_key=True)
+    rating = Column(Float, nullable=False, default=1500.0, index=True)
+    games = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+    losses = Column(Integer, nullable=False, default=0)
+    draws = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# MBTI 对阵评级：mbti 在对阵 opponent_mbti 时的评级与战绩
+class MBTIPairRating(Base):
+    __tablename__ = "mbti_pair_ratings"
+
+    mbti = Column(String(4), primary_key=True)
+    opponent_mbti = Column(String(4), primary_key=True)
+    rating = Column(Float, nullable=False, default=1500.0)
+    games = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+    losses = Column(Integer, nullable=False, default=0)
+    draws = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# 已计入评级的辩论，保证每场辩论只计分一次
+class RatedDebate(Base):
+    __tablename__ = "rated_debates"
+
+    debate_id = Column(Integer, primary_key=True)
+    pro_score = Column(Float)
+    opp_score = Column(Float)
+    rated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# 批处理任务进度，任务被中断后从 last_id 之后继续
+class JobCheckpoint(Base):
+    __tablename__ = "job_checkpoints"
+
+    job_name = Column(String(64), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    state = Column(JSON)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# 评委单维度评分缓存：键为评委模型参数+完整prompt的哈希，prompt不变即可复用
+class JudgeScoreCache(Base):
+    __tablename__ = "judge_score_cache"
+
+    key = Column(String(64), primary_key=True)
+    score = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# 辩论评分结果：记录评分时的配置指纹，配置变化后由批量重算任务更新
+class DebateScore(Base):
+    __tablename__ = "debate_scores"
+
+    debate_id = Column(Integer, primary_key=True)
+    prompt_hash = Column(String(16), nullable=False)
+    config_hash = Column(String(16), nullable=False, index=True)
+    final_scores = Column(JSON)
+    speech_scores = Column(JSON)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# 建议对话记忆：每个用户只保留最近若干条消息，多个进程共享
+class ConversationMessage(Base):
+    __tablename__ = "conversation_messages"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String(64), nullable=False)
+    role = Column(String(16), nullable=False)  # "用户" 或 MBTI类型
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_conversation_messages_user_id_id", "user_id", "id"),)
+
+
+# 对话滚动摘要：persona 为空表示整段对话，否则只涵盖用户与该MBTI类型之间的对话；
+# covered_id 之前（含）的消息已折叠进摘要
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+
+    user_id = Column(String(64), primary_key=True)
+    persona = Column(String(16), primary_key=True, default="")
+    summary = Column(Text, nullable=False)
+    covered_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,52 @@
+# 历史记录的游标分页（keyset）：按 (created_at, id) 倒序，游标为上一页最后一条记录的位置
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_
+
+HISTORY_PAGE_SIZE = 10
+HISTORY_PAGE_MAX = 100
+PREVIEW_LENGTH = 80
+
+
+def page_size(limit: Optional[int]) -> int:
+    return min(max(limit or HISTORY_PAGE_SIZE, 1), HISTORY_PAGE_MAX)
+
+
+def encode_cursor(created_at: datetime, record_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), record_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """解析游标，格式不正确时抛出 ValueError"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, record_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(record_id)
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+def keyset_filter(model, before: Optional[Tuple[datetime, int]]):
+    """位于游标之后（更早）的记录；与 (user_name, created_at, id) 组合索引的顺序一致"""
+    created_at, record_id = before
+    return or_(model.created_at < created_at, and_(model.created_at == created_at, model.id < record_id))
+
+
+def split_page(records: Sequence, limit: int) -> Tuple[List, Optional[str]]:
+    """查询时多取一条：有多余记录说明还有下一页，返回 (本页记录, 下一页游标)"""
+    records = list(records)
+    if len(records) <= limit:
+        return records, None
+    page = records[:limit]
+    return page, encode_cursor(page[-1].created_at, page[-1].id)
+
+
+def preview(text: Optional[str], length: int = PREVIEW_LENGTH) -> str:
+    text = (text or "").strip()
+    return text if len(text) <= length else text[:length] + "…"
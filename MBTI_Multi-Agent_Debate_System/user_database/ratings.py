@@ -0,0 +1,147 @@
+# MBTI 评级（ELO）：每场辩论评分后增量更新物化表，排行榜直接读表
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from datetime import datetime
+from .models import MBTIRating, MBTIPairRating, RatedDebate, JobCheckpoint
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 24.0
+
+
+def expected_score(rating: float, opponent_rating: float) -> float:
+    return 1.0 / (1.0 + 10 ** ((opponent_rating - rating) / 400.0))
+
+
+def elo_delta(rating: float, opponent_rating: float, actual: float, k: float = K_FACTOR) -> float:
+    return k * (actual - expected_score(rating, opponent_rating))
+
+
+def _insert_missing(db: Session, model, **keys):
+    """插入初始评级行，已存在时什么也不做（INSERT ... ON CONFLICT DO NOTHING / INSERT IGNORE）；
+    多个事务同时创建同一行时不会主键冲突"""
+    values = dict(keys, rating=INITIAL_RATING, games=0, wins=0, losses=0, draws=0)
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(model).values(**values).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(model).values(**values).on_conflict_do_nothing()
+    elif dialect in ("mysql", "mariadb"):
+        stmt = mysql.insert(model).values(**values).prefix_with("IGNORE")
+    else:
+        # 其他数据库：在保存点中插入，冲突时只回滚保存点
+        try:
+            with db.begin_nested():
+                db.execute(insert(model).values(**values))
+        except IntegrityError:
+            pass
+        return
+    db.execute(stmt)
+
+
+def _current_rating(db: Session, model, **keys) -> float:
+    """读取评级并加行锁（SELECT ... FOR UPDATE；SQLite 的写事务本身是串行的），不存在时先创建再读取"""
+    query = select(model).filter_by(**keys).with_for_update()
+    row = db.execute(query).scalars().first()
+    if row is None:
+        _insert_missing(db, model, **keys)
+        row = db.execute(query).scalars().first()
+    return row.rating
+
+
+def _record_result(db: Session, model, keys: dict, delta: float, actual: float):
+    """原子增量更新（rating = rating + delta），不会覆盖其他事务同时写入的结果"""
+    db.execute(update(model).filter_by(**keys).values(
+        rating=model.rating + delta,
+        games=model.games + 1,
+        wins=model.wins + (1 if actual == 1.0 else 0),
+        losses=model.losses + (1 if actual == 0.0 else 0),
+        draws=model.draws + (1 if actual == 0.5 else 0),
+        updated_at=datetime.utcnow(),
+    ))
+
+
+def is_debate_rated(db: Session, debate_id: int) -> bool:
+    return db.get(RatedDebate, debate_id) is not None
+
+
+def record_debate_result(db: Session, debate_id: int, mbti_config: dict, pro_score: float, opp_score: float,
+                         commit: bool = True) -> bool:
+    """把一场已评分辩论计入评级（幂等，并发计入同一场时只有一次生效），返回是否有更新"""
+    if is_debate_rated(db, debate_id):
+        return False
+    pro = [m for name, m in mbti_config.items() if name.startswith("pro")]
+    opp = [m for name, m in mbti_config.items() if name.startswith("opp")]
+    if not pro or not opp:
+        return False
+    pro_actual = 1.0 if pro_score > opp_score else 0.0 if pro_score < opp_score else 0.5
+
+    # 先写入已计分标记：并发计入同一场辩论时，后提交的事务在这里主键冲突，不会重复计分；
+    # SQLite 上这一步同时取得写锁，本事务之后读到的评级不会再被其他写入者改动
+    db.add(RatedDebate(debate_id=debate_id, pro_score=pro_score, opp_score=opp_score, rated_at=datetime.utcnow()))
+    try:
+        db.flush()
+    except IntegrityError:
+        if not commit:
+            raise
+        db.rollback()
+        return False
+
+    # 单类型评级：每位辩手对阵对方队伍的平均评级（先算完所有变化再写入，避免同场内顺序影响）
+    ratings = {m: _current_rating(db, MBTIRating, mbti=m) for m in sorted(set(pro + opp))}
+    pro_avg = sum(ratings[m] for m in pro) / len(pro)
+    opp_avg = sum(ratings[m] for m in opp) / len(opp)
+    updates = [(m, elo_delta(ratings[m], opp_avg, pro_actual), pro_actual) for m in pro]
+    updates += [(m, elo_delta(ratings[m], pro_avg, 1.0 - pro_actual), 1.0 - pro_actual) for m in opp]
+    for m, delta, actual in updates:
+        _record_result(db, MBTIRating, {"mbti": m}, delta, actual)
+
+    # 对阵评级：正反方每一对类型之间互相更新
+    for p in pro:
+        for o in opp:
+            if p == o:
+                continue
+            pair = _current_rating(db, MBTIPairRating, mbti=p, opponent_mbti=o)
+            reverse = _current_rating(db, MBTIPairRating, mbti=o, opponent_mbti=p)
+            _record_result(db, MBTIPairRating, {"mbti": p, "opponent_mbti": o},
+                           elo_delta(pair, reverse, pro_actual), pro_actual)
+            _record_result(db, MBTIPairRating, {"mbti": o, "opponent_mbti": p},
+                           elo_delta(reverse, pair, 1.0 - pro_actual), 1.0 - pro_actual)
+
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return True
+
+
+def get_leaderboard(db: Session, limit: int = 16):
+    return db.query(MBTIRating).order_by(MBTIRating.rating.desc()).limit(limit).all()
+
+
+def get_pair_ratings(db: Session, mbti: str):
+    return db.query(MBTIPairRating).filter(
+        MBTIPairRating.mbti == mbti
+    ).order_by(
+        MBTIPairRating.rating.desc()
+    ).all()
+
+
+def get_checkpoint(db: Session, job_name: str) -> JobCheckpoint:
+    checkpoint = db.get(JobCheckpoint, job_name)
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(job_name=job_name, last_id=0, processed=0, state={})
+        db.add(checkpoint)
+        db.flush()
+    return checkpoint
+
+
+def save_checkpoint(db: Session, checkpoint: JobCheckpoint, last_id: int, processed: int, state: dict = None):
+    """与本批次的业务写入放在同一事务中提交，中断后不会重复计算"""
+    checkpoint.last_id = last_id
+    checkpoint.processed = processed
+    if state is not None:
+        checkpoint.state = state
+    checkpoint.updated_at = datetime.utcnow()
+    db.commit()
@@ -0,0 +1,67 @@
+# 评委评分缓存与辩论评分结果的存取
+import asyncio
+
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
+from .models import JudgeScoreCache, DebateScore
+
+
+class DBScoreCache:
+    """JudgeAgent 的评分缓存（数据库持久化），新写入的分数在 commit() 时统一落库"""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._pending = {}
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[float]:
+        if key in self._pending:
+            self.hits += 1
+            return self._pending[key]
+        row = self.db.get(JudgeScoreCache, key)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row.score
+
+    async def aget(self, key: str) -> Optional[float]:
+        """异步版本：查询放到线程中执行，不阻塞事件循环；同一会话上的查询依次进行"""
+        if key in self._pending:
+            self.hits += 1
+            return self._pending[key]
+        async with self._lock:
+            return await asyncio.to_thread(self.get, key)
+
+    def set(self, key: str, score: float):
+        self._pending[key] = score
+
+    def commit(self, commit: bool = True):
+        for key, score in self._pending.items():
+            self.db.merge(JudgeScoreCache(key=key, score=score, created_at=datetime.utcnow()))
+        self._pending = {}
+        if commit:
+            self.db.commit()
+
+
+def get_debate_score(db: Session, debate_id: int) -> Optional[DebateScore]:
+    return db.get(DebateScore, debate_id)
+
+
+def save_debate_score(db: Session, debate_id: int, prompt_hash: str, config_hash: str,
+                      final_scores: list, speech_scores: list, commit: bool = True) -> DebateScore:
+    row = db.get(DebateScore, debate_id)
+    if row is None:
+        row = DebateScore(debate_id=debate_id)
+        db.add(row)
+    row.prompt_hash = prompt_hash
+    row.config_hash = config_hash
+    row.final_scores = final_scores
+    row.speech_scores = speech_scores
+    row.updated_at = datetime.utcnow()
+    if commit:
+        db.commit()
+    return row
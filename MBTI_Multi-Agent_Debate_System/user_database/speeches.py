@@ -0,0 +1,116 @@
+# 辩论发言表（debate_speeches）的存取：逐条追加写入，按辩论和环节读取
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models import DebateHistory, DebateSpeech
+
+# 发言记录里的环节名称（中文或旧数据里的英文代码）→ 存储使用的环节代码
+STAGE_CODES = {
+    "立论": "OPENING",
+    "攻辩": "CROSS_EXAM",
+    "自由辩论": "FREE_DEBATE",
+    "总结": "SUMMARY",
+    "总结陈词": "SUMMARY",
+    "OPENING": "OPENING",
+    "CROSS_EXAM": "CROSS_EXAM",
+    "FREE_DEBATE": "FREE_DEBATE",
+    "SUMMARY": "SUMMARY",
+}
+# 接口输出时使用的中文环节名称，与辩论引擎产生的发言一致
+STAGE_NAMES = {
+    "OPENING": "立论",
+    "CROSS_EXAM": "攻辩",
+    "FREE_DEBATE": "自由辩论",
+    "SUMMARY": "总结陈词",
+}
+
+
+def stage_code(stage: Optional[str]) -> str:
+    code = STAGE_CODES.get((stage or "").strip())
+    if code is None:
+        raise ValueError(f"未知的辩论环节: {stage}")
+    return code
+
+
+def to_speech_row(debate_id: int, seq: int, speech: dict, mbti_config: dict) -> DebateSpeech:
+    """辩论引擎产生的发言（或旧的 history JSON 中的一项）转换为发言表的一行"""
+    agent_id = (speech.get("agent_id") or speech.get("debater_name") or "").strip().lower()
+    return DebateSpeech(
+        debate_id=debate_id,
+        seq=seq,
+        agent_id=agent_id,
+        mbti=speech.get("mbti_type") or (mbti_config or {}).get(agent_id),
+        stage=stage_code(speech.get("stage")),
+        round=speech.get("round"),
+        content=speech.get("content") or "",
+        analysis=speech.get("analysis") or [],
+    )
+
+
+def speech_to_dict(row: DebateSpeech, with_analysis: bool = True) -> dict:
+    """发言行转换为与原 history JSON 相同格式的字典"""
+    speech = {
+        "agent_id": row.agent_id,
+        "round": row.round,
+        "stage": STAGE_NAMES[row.stage],
+        "content": row.content,
+    }
+    if with_analysis:
+        speech["analysis"] = row.analysis or []
+    return speech
+
+
+def speeches_query(debate_ids: Iterable[int], stages: Optional[Iterable[str]] = None):
+    query = select(DebateSpeech).where(DebateSpeech.debate_id.in_(list(debate_ids)))
+    if stages:
+        query = query.where(DebateSpeech.stage.in_([stage_code(s) for s in stages]))
+    return query.order_by(DebateSpeech.debate_id, DebateSpeech.seq)
+
+
+def debates_with_speeches_query(debate_ids: Iterable[int]):
+    """其中已有发言表数据（已迁移或新写入）的辩论id"""
+    return select(DebateSpeech.debate_id).where(DebateSpeech.debate_id.in_(list(debate_ids))).distinct()
+
+
+def group_speeches(rows: Iterable[DebateSpeech]) -> Dict[int, List[DebateSpeech]]:
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.debate_id].append(row)
+    return grouped
+
+
+def append_speech(db: Session, debate_id: int, seq: int, speech: dict, mbti_config: dict,
+                  commit: bool = True) -> DebateSpeech:
+    row = to_speech_row(debate_id, seq, speech, mbti_config)
+    db.add(row)
+    if commit:
+        db.commit()
+    return row
+
+
+def get_speeches(db: Session, debate_id: int, stages: Optional[Iterable[str]] = None) -> List[DebateSpeech]:
+    """按发言顺序读取一场辩论的发言，可只取指定环节"""
+    return list(db.execute(speeches_query([debate_id], stages)).scalars())
+
+
+def has_speeches(db: Session, debate_id: int) -> bool:
+    return db.execute(
+        select(DebateSpeech.id).where(DebateSpeech.debate_id == debate_id).limit(1)
+    ).first() is not None
+
+
+def backfill_debate(db: Session, record: DebateHistory, clear_json: bool = False) -> int:
+    """把一场旧辩论的 history JSON 拆分写入发言表（不提交事务），返回写入的条数；已拆分过的跳过"""
+    if has_speeches(db, record.id):
+        written = 0
+    else:
+        rows = [to_speech_row(record.id, seq, speech, record.mbti_config)
+                for seq, speech in enumerate(record.history or [])]
+        db.add_all(rows)
+        written = len(rows)
+    if clear_json and record.history is not None:
+        record.history = None
+    return written
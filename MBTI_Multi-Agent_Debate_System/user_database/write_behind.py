@@ -0,0 +1,226 @@
+# 历史记录的后台批量写入（write-behind）：接口只把写操作放入有界队列，
+# 后台协程每 HISTORY_FLUSH_MS 毫秒或攒够 HISTORY_BATCH_ROWS 条时在一个事务中批量插入
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select, text
+
+from .db import AsyncSessionLocal, ASYNC_DATABASE_URL
+from .models import User, DebateHistory, AdviceHistory
+from .speeches import to_speech_row
+
+logger = logging.getLogger(__name__)
+
+HISTORY_WRITE_BEHIND = os.environ.get("HISTORY_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+HISTORY_QUEUE_SIZE = int(os.environ.get("HISTORY_QUEUE_SIZE", 10000))
+HISTORY_BATCH_ROWS = int(os.environ.get("HISTORY_BATCH_ROWS", 200))
+HISTORY_FLUSH_MS = float(os.environ.get("HISTORY_FLUSH_MS", 50))
+# 每批提交时是否强制落盘（SQLite 的 synchronous=FULL，即默认值）；关闭时为 NORMAL，掉电时可能丢失最近几批。
+# 其他数据库的落盘策略由服务端配置决定
+HISTORY_FSYNC = os.environ.get("HISTORY_FSYNC", "true").lower() in ("1", "true", "yes")
+USER_ID_CACHE_SIZE = int(os.environ.get("USER_ID_CACHE_SIZE", 10000))
+
+
+class DebateHandle:
+    """排队中的辩论记录；写入后 id 才确定，之后追加的发言通过它关联"""
+    __slots__ = ("id", "skipped")
+
+    def __init__(self):
+        self.id: Optional[int] = None
+        self.skipped = False
+
+
+class _Op:
+    __slots__ = ("kind", "user_name", "data", "handle", "future")
+
+    def __init__(self, kind: str, user_name: Optional[str] = None, data: Optional[dict] = None,
+                 handle: Optional[DebateHandle] = None):
+        self.kind = kind  # debate / speech / advice / flush
+        self.user_name = user_name
+        self.data = data
+        self.handle = handle
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class HistoryWriter:
+    """
+    辩论/建议历史的后台写入器：
+    - 队列有界，写满时调用方等待（背压），不会无限占用内存
+    - 一批写操作在同一个事务中提交；批量失败时逐条重试，单条坏数据不影响同批其他记录
+    - 用户名→用户id 的查询结果缓存，一批中未命中的用户名合并成一次查询
+    - flush() 等待此前提交的写操作全部落库；close() 在应用关闭时写完剩余记录
+    """
+
+    def __init__(self, queue_size: int = HISTORY_QUEUE_SIZE, batch_rows: int = HISTORY_BATCH_ROWS,
+                 flush_ms: float = HISTORY_FLUSH_MS, fsync: bool = HISTORY_FSYNC,
+                 write_behind: bool = HISTORY_WRITE_BEHIND, session_factory=AsyncSessionLocal):
+        self.queue_size = queue_size
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_ms / 1000
+        self.fsync = fsync
+        # 关闭时每次写入都等待提交完成（仍然走批量写入）
+        self.write_behind = write_behind
+        self.session_factory = session_factory
+        self._sqlite = ASYNC_DATABASE_URL.startswith("sqlite")
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._user_ids: "OrderedDict[str, int]" = OrderedDict()
+        self.batches = 0
+        self.rows = 0
+        self.failed = 0
+
+    def start(self):
+        """在当前事件循环中启动后台写入协程（首次写入时也会自动启动）"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def _submit(self, op: _Op) -> _Op:
+        self.start()
+        await self._queue.put(op)
+        if not self.write_behind:
+            await op.future
+        return op
+
+    async def start_debate(self, user_name: str, topic: str, mbti_config: dict) -> DebateHandle:
+        handle = DebateHandle()
+        await self._submit(_Op("debate", user_name, {"topic": topic, "mbti_config": mbti_config,
+                                                     "created_at": datetime.utcnow()}, handle))
+        return handle
+
+    async def add_speech(self, handle: DebateHandle, seq: int, speech: dict, mbti_config: dict):
+        await self._submit(_Op("speech", data={"seq": seq, "speech": speech, "mbti_config": mbti_config},
+                               handle=handle))
+
+    async def add_advice(self, user_name: str, question: str, mbti_types: list, responses: dict):
+        await self._submit(_Op("advice", user_name, {"question": question, "mbti_types": mbti_types,
+                                                     "responses": responses, "created_at": datetime.utcnow()}))
+
+    async def flush(self):
+        """等待此前放入队列的写操作全部提交"""
+        if self._task is None or self._task.done():
+            return
+        op = _Op("flush")
+        await self._queue.put(op)
+        await op.future
+
+    async def close(self):
+        """写完队列中剩余的记录后停止后台协程"""
+        if self._task is None or self._task.done():
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize() if self._queue else 0, "batches": self.batches, "rows": self.rows,
+                "failed": self.failed, "cached_users": len(self._user_ids)}
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            # 攒批：达到条数上限、超过等待时间或遇到 flush 请求时写入
+            while len(batch) < self.batch_rows and batch[-1].kind != "flush":
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(batch)
+            except Exception as e:
+                logger.warning(f"历史记录批量写入失败，改为逐条写入: {e}")
+                for op in batch:
+                    try:
+                        await self._write([op])
+                    except Exception as e:
+                        self.failed += 1
+                        logger.error(f"历史记录写入失败，已丢弃: {e}", exc_info=True)
+                        # 后台写入模式下没有调用方等待结果，只记录日志
+                        if not self.write_behind and op.kind != "flush":
+                            op.future.set_exception(e)
+            for op in batch:
+                if not op.future.done():
+                    op.future.set_result(None)
+            self.batches += 1
+
+    async def _write(self, ops: List[_Op]):
+        headers = []
+        try:
+            await self._write_batch(ops, headers)
+        except BaseException:
+            # 事务已回滚，本批中取得的辩论id作废，逐条重试时重新写入
+            for handle, _ in headers:
+                handle.id = None
+            raise
+
+    async def _write_batch(self, ops: List[_Op], headers: list):
+        async with self.session_factory() as db:
+            if self._sqlite:
+                await db.execute(text(f"PRAGMA synchronous={'FULL' if self.fsync else 'NORMAL'}"))
+            user_ids = await self._resolve_users(db, {op.user_name for op in ops if op.user_name})
+            rows = 0
+            for op in ops:
+                if op.kind == "debate":
+                    user_id = user_ids.get(op.user_name)
+                    if user_id is None:
+                        op.handle.skipped = True
+                        continue
+                    record = DebateHistory(user_id=user_id, user_name=op.user_name, **op.data)
+                    db.add(record)
+                    headers.append((op.handle, record))
+                elif op.kind == "speech":
+                    if op.handle.id is None and any(h is op.handle for h, _ in headers):
+                        # 辩论记录与发言在同一批中：先写入记录以取得id
+                        await db.flush()
+                        for handle, record in headers:
+                            handle.id = record.id
+                    if op.handle.skipped or op.handle.id is None:
+                        continue
+                    db.add(to_speech_row(op.handle.id, op.data["seq"], op.data["speech"], op.data["mbti_config"]))
+                elif op.kind == "advice":
+                    user_id = user_ids.get(op.user_name)
+                    if user_id is None:
+                        continue
+                    db.add(AdviceHistory(user_id=user_id, user_name=op.user_name, **op.data))
+                else:
+                    continue
+                rows += 1
+            await db.flush()
+            await db.commit()
+            for handle, record in headers:
+                handle.id = record.id
+            self.rows += rows
+
+    async def _resolve_users(self, db, user_names: Iterable[str]) -> Dict[str, int]:
+        """用户名→用户id：先查缓存，未命中的合并成一次查询（不存在的用户不缓存，注册后即可写入）"""
+        found, missing = {}, []
+        for name in user_names:
+            if name in self._user_ids:
+                self._user_ids.move_to_end(name)
+                found[name] = self._user_ids[name]
+            else:
+                missing.append(name)
+        if missing:
+            result = await db.execute(select(User.user_name, User.id).where(User.user_name.in_(missing)))
+            for name, user_id in result:
+                found[name] = user_id
+                self._user_ids[name] = user_id
+            while len(self._user_ids) > USER_ID_CACHE_SIZE:
+                self._user_ids.popitem(last=False)
+        return found
+
+
+history_writer = HistoryWriter()